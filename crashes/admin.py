@@ -3,3 +3,5 @@ from crashes.models import *
 
 admin.site.register(Application)
 admin.site.register(CrashReport)
+admin.site.register(ApplicationStats)
+admin.site.register(ApiKey)
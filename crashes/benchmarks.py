@@ -0,0 +1,157 @@
+"""Latency, query count and memory benchmarks of the crash views.
+
+run_benchmarks drives the views through the Django test client against a
+dataset made by crashes.seeding.seed_dataset, and returns the results as a JSON-ready dict.
+The benchmark_crashes command runs it against a throwaway test database.
+"""
+import platform
+import random
+import resource
+import time
+
+import django
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test.client import Client
+
+from crashes import factories as f
+from crashes.cache import application_cache
+from crashes.models import CrashReport, CRASH_KIND
+from crashes.seeding import SEED_PASSWORD, generate_occurrence
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+### Scenarios: each takes (client, user, dataset, rng) and returns a response
+
+def _crash_data(dataset, rng):
+    # about half of the crashes are repeats of a few titles, the rest are new
+    title = 'Benchmark crash {0}'.format(f.spell(rng.randint(0, 10 ** 6) if rng.random() < 0.5 else rng.randint(0, 9)))
+    return dict(
+        application=rng.choice(dataset.applications).id,
+        title=title,
+        kind=rng.choice(CRASH_KIND.values()),
+        details='Details of {0}'.format(title),
+        version='1.{0}'.format(rng.randint(0, 9)),
+        count=1,
+    )
+
+def new_crash(client, user, dataset, rng):
+    return client.post('/u/{0}/new/'.format(user.username), _crash_data(dataset, rng))
+
+def crashes_by_user(client, user, dataset, rng):
+    return client.get('/u/{0}/'.format(user.username))
+
+def crash_by_user(client, user, dataset, rng):
+    return client.get('/u/{0}/{1}/'.format(user.username, rng.choice(dataset.crash_report_ids[user.id])))
+
+def edit_crash(client, user, dataset, rng):
+    crash_report = CrashReport.objects.get(id=rng.choice(dataset.crash_report_ids[user.id]))
+    return client.post('/u/{0}/{1}/edit/'.format(user.username, crash_report.id), dict(
+        application=crash_report.application_id,
+        title=crash_report.title,
+        kind=crash_report.kind,
+        details=crash_report.details,
+        version='2.{0}'.format(rng.randint(0, 9)),
+        count=crash_report.count,
+    ))
+
+def similar_crashes(client, user, dataset, rng):
+    crash_report = generate_occurrence(rng, user, dataset.applications, len(dataset.crash_report_ids[user.id]))
+    return client.get('/u/{0}/similar/'.format(user.username), dict(
+        application=crash_report.application.id,
+        title=crash_report.title,
+        details=crash_report.details,
+    ))
+
+SCENARIOS = (
+    ('new_crash', new_crash, (302, 202)),
+    ('crashes_by_user', crashes_by_user, (200,)),
+    ('crash_by_user', crash_by_user, (200,)),
+    ('edit_crash', edit_crash, (302, 200)),
+    # needs a dataset seeded with its similarity index
+    ('similar_crashes', similar_crashes, (200,)),
+)
+
+
+### Measurement
+
+def percentile(sorted_values, percent):
+    "Returns the nearest-rank percentile of a sorted, non-empty list."
+    index = max(0, int(round(percent / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def summarize(values):
+    "Returns the min, mean, max and PERCENTILES of a non-empty list of numbers."
+    values = sorted(values)
+    summary = dict(min=values[0], max=values[-1], mean=sum(values) / float(len(values)))
+    for percent in PERCENTILES:
+        summary['p{0}'.format(percent)] = percentile(values, percent)
+    return summary
+
+def _peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and bytes on OS X
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if platform.system() == 'Darwin' else peak
+
+def run_scenario(scenario, expected_statuses, clients, dataset, iterations, warmup, rng):
+    "Runs a scenario warmup + iterations times, measuring the last iterations. Returns its summary."
+    latencies, queries = [], []
+    rss_before = _peak_rss_kb()
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    try:
+        for i in range(warmup + iterations):
+            user = rng.choice(dataset.users)
+            reset_queries()
+            started = time.time()
+            response = scenario(clients[user.id], user, dataset, rng)
+            elapsed = time.time() - started
+            if response.status_code not in expected_statuses:
+                raise AssertionError('{0} answered {1}'.format(scenario.__name__, response.status_code))
+            if i >= warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(len(connection.queries))
+    finally:
+        connection.use_debug_cursor = old_debug_cursor
+        reset_queries()
+    return dict(
+        iterations=iterations,
+        latency_ms=summarize(latencies),
+        queries=summarize(queries),
+        peak_rss_kb=_peak_rss_kb(),
+        peak_rss_growth_kb=_peak_rss_kb() - rss_before,
+    )
+
+def run_benchmarks(dataset, scenarios=None, iterations=100, warmup=10, seed=0):
+    """Benchmarks the named scenarios (all of SCENARIOS by default) against a seeded dataset.
+
+    Each scenario starts with empty caches, then runs as random users of the
+    dataset. Returns a JSON-ready dict of the environment, dataset and the
+    latency, query count and memory summary of every scenario.
+    """
+    rng = random.Random(seed)
+    clients = {}
+    for user in dataset.users:
+        client = Client()
+        client.login(username=user.username, password=SEED_PASSWORD)
+        clients[user.id] = client
+
+    results = {}
+    for name, scenario, expected_statuses in SCENARIOS:
+        if scenarios and name not in scenarios:
+            continue
+        cache.clear()
+        application_cache.clear()
+        results[name] = run_scenario(scenario, expected_statuses, clients, dataset, iterations, warmup, rng)
+    return dict(
+        environment=dict(
+            python=platform.python_version(),
+            django=django.get_version(),
+            database=connection.vendor,
+        ),
+        dataset=dataset.describe(),
+        seed=seed,
+        scenarios=results,
+    )
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from crashes.models import Application, CrashReport, crash_reports_changed
+
+
+class ApplicationCache(object):
+    """A size-bounded, in-process LRU cache of Application rows by id.
+
+    Reading it like a dict loads missing applications from the database and
+    raises KeyError for ones that don't exist. Entries are dropped when their
+    application is saved or deleted in this process.
+    """
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._applications = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, application_id):
+        application = self.get_many([application_id]).get(application_id)
+        if application is None:
+            raise KeyError(application_id)
+        return application
+
+    def get_many(self, application_ids):
+        "Returns a dict of id => Application for the ids that exist, in at most one query."
+        found, missing = {}, []
+        with self._lock:
+            for application_id in application_ids:
+                application = self._applications.pop(application_id, None)
+                if application is None:
+                    missing.append(application_id)
+                else:
+                    self._applications[application_id] = application
+                    found[application_id] = application
+        if missing:
+            loaded = Application.objects.in_bulk(missing)
+            found.update(loaded)
+            with self._lock:
+                self._applications.update(loaded)
+                while len(self._applications) > self.max_size:
+                    self._applications.popitem(last=False)
+        return found
+
+    def invalidate(self, application_id):
+        with self._lock:
+            self._applications.pop(application_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._applications.clear()
+
+    def __len__(self):
+        return len(self._applications)
+
+
+application_cache = ApplicationCache(getattr(settings, 'APPLICATION_CACHE_SIZE', 1000))
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def invalidate_application_cache(sender, instance, **kwargs):
+    application_cache.invalidate(instance.pk)
+
+
+### Versioned cache keys for per-user crash report data
+
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+USER_VERSION_KEY = 'crashes:user:{0}:version'
+APPLICATIONS_VERSION_KEY = 'crashes:applications:version'
+
+def _new_version():
+    # versions start from the clock, so a version key that was evicted never
+    # comes back with a number whose entries are still cached
+    return int(time.time() * 1000)
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), VERSION_TIMEOUT)
+
+def crash_reports_versions(user_id):
+    """Returns the (crash reports version, applications version) of a user.
+
+    The first is bumped whenever one of the user's crash reports changes, the
+    second whenever any application changes.
+    """
+    keys = [USER_VERSION_KEY.format(user_id), APPLICATIONS_VERSION_KEY]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), VERSION_TIMEOUT)
+            versions[key] = cache.get(key)
+    return versions[keys[0]], versions[keys[1]]
+
+def crash_reports_cache_key(user_id, *parts):
+    """Returns a cache key for data derived from a user's crash reports.
+
+    The key embeds the user's crash_reports_versions, so stale entries are
+    never read again and simply expire.
+    """
+    user_version, applications_version = crash_reports_versions(user_id)
+    return 'crashes:user:{0}:{1}:{2}:{3}'.format(user_id, user_version, applications_version, ':'.join(parts))
+
+@receiver(post_save, sender=CrashReport)
+@receiver(post_delete, sender=CrashReport)
+def bump_crash_report_version(sender, instance, **kwargs):
+    _bump_version(USER_VERSION_KEY.format(instance.user_id))
+
+@receiver(crash_reports_changed, sender=CrashReport)
+def bump_crash_reports_versions(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        _bump_version(USER_VERSION_KEY.format(user_id))
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def bump_applications_version(sender, instance, **kwargs):
+    _bump_version(APPLICATIONS_VERSION_KEY)
@@ -0,0 +1,235 @@
+import csv
+import itertools
+import json
+import time
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import reset_queries, transaction
+
+from crashes.forms import CrashForm
+from crashes.models import Application, CrashReport, ImportProgress
+
+
+EXPORT_FIELDS = (
+    'id', 'title', 'kind', 'kind_name', 'details', 'version', 'count', 'fingerprint',
+    'application_id', 'application_name', 'application_company',
+    'user_id', 'username', 'created_at', 'updated_at',
+)
+
+def export_queryset():
+    "Returns the CrashReports to export, joined with just the application and user columns exported."
+    return CrashReport.objects.select_related('application', 'user').only(
+        'id', 'title', 'kind', 'details', 'version', 'count', 'fingerprint', 'created_at', 'updated_at',
+        'application', 'application__name', 'application__company', 'user', 'user__username',
+    )
+
+def export_row(crash_report):
+    "Returns the EXPORT_FIELDS dict of a crash report from export_queryset."
+    return dict(
+        id=crash_report.id,
+        title=crash_report.title,
+        kind=crash_report.kind,
+        kind_name=crash_report.get_kind_display(),
+        details=crash_report.details,
+        version=crash_report.version,
+        count=crash_report.count,
+        fingerprint=crash_report.fingerprint,
+        application_id=crash_report.application_id,
+        application_name=crash_report.application.name,
+        application_company=crash_report.application.company,
+        user_id=crash_report.user_id,
+        username=crash_report.user.username,
+        created_at=crash_report.created_at,
+        updated_at=crash_report.updated_at,
+    )
+
+def export_rows(queryset, batch_size=1000):
+    """Yields the export_row of every crash report in queryset, in id order.
+
+    Rows are read batch_size at a time, seeking past the last id instead of
+    holding a cursor or an offset open, so memory stays flat however many
+    rows there are and rows bumped during the export are neither skipped
+    nor repeated.
+    """
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')[:batch_size])
+        # DEBUG keeps every query otherwise
+        reset_queries()
+        if not batch:
+            return
+        for crash_report in batch:
+            yield export_row(crash_report)
+        last_id = batch[-1].id
+
+
+class CsvWriter(object):
+    "Writes export rows as UTF-8 CSV with a header line."
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(EXPORT_FIELDS)
+
+    def write(self, row):
+        self.writer.writerow([self._encode(row[name]) for name in EXPORT_FIELDS])
+
+    def _encode(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return value
+
+
+class NdjsonWriter(object):
+    "Writes export rows as one JSON object per line."
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+
+
+EXPORT_WRITERS = {
+    'csv': CsvWriter,
+    'ndjson': NdjsonWriter,
+}
+
+
+def read_csv(stream):
+    "Yields the rows of a UTF-8 CSV export as dicts of unicode."
+    for row in csv.DictReader(stream):
+        yield dict((name, value.decode('utf-8') if value is not None else None) for name, value in row.items())
+
+def read_ndjson(stream):
+    "Yields the rows of an NDJSON export as dicts, skipping blank lines."
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+EXPORT_READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+IMPORT_FIELDS = ('title', 'kind', 'details', 'version', 'count')
+
+def _import_row_fields():
+    fields = dict((name, CrashForm.base_fields[name]) for name in IMPORT_FIELDS)
+    fields['application_name'] = Application._meta.get_field('name').formfield()
+    fields['application_company'] = Application._meta.get_field('company').formfield()
+    fields['username'] = User._meta.get_field('username').formfield()
+    return fields
+
+IMPORT_ROW_FIELDS = _import_row_fields()
+
+def clean_import_row(row):
+    """Returns the IMPORT_ROW_FIELDS of an exported row, cleaned by the CrashForm
+    and model field rules.
+
+    Raises a ValidationError with a dict of field errors if any is invalid.
+    """
+    data, errors = {}, {}
+    for name, field in IMPORT_ROW_FIELDS.items():
+        try:
+            data[name] = field.clean(row.get(name))
+        except ValidationError as e:
+            errors[name] = e.messages
+    if errors:
+        raise ValidationError(errors)
+    return data
+
+def _in_chunks(values, size=500):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class CrashImporter(object):
+    """Loads exported crash rows into the database, batch_size rows per transaction.
+
+    Applications and users are matched by name and username, and the missing
+    ones are created in bulk. Rows are merged into existing crash reports by
+    the same (user, fingerprint) key as new_crash, adding their count.
+
+    The number of rows read from source is committed with every batch, so
+    running an interrupted import again skips what it already committed.
+    It is forgotten once the end of the rows is reached, so name each input
+    apart: a source that is imported again starts from the first row.
+    """
+    def __init__(self, source, batch_size=1000, progress=None, invalid=None):
+        self.source = source
+        self.batch_size = batch_size
+        # progress(rows read, rows imported, rows skipped, seconds) is called after every batch,
+        # and invalid(row number, field errors) for every row that doesn't validate
+        self.progress = progress or (lambda *args: None)
+        self.invalid = invalid or (lambda *args: None)
+
+    def run(self, rows, restart=False):
+        "Imports an iterable of export rows. Returns the (imported, skipped) numbers of rows."
+        progress, _ = ImportProgress.objects.get_or_create(source=self.source)
+        done = 0 if restart else progress.rows
+        imported = skipped = 0
+        started = time.time()
+        rows = itertools.islice(enumerate(rows, 1), done, None)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                ImportProgress.objects.filter(source=self.source).delete()
+                return imported, skipped
+            done = batch[-1][0]
+            batch_imported = self._import(batch, done)
+            imported += batch_imported
+            skipped += len(batch) - batch_imported
+            reset_queries()
+            self.progress(done, imported, skipped, time.time() - started)
+
+    def _import(self, batch, done):
+        cleaned = []
+        for number, row in batch:
+            try:
+                cleaned.append(clean_import_row(row))
+            except ValidationError as e:
+                self.invalid(number, e.message_dict)
+
+        with transaction.commit_on_success():
+            applications = self._applications(dict((c['application_name'], c['application_company']) for c in cleaned))
+            users = self._users(set(c['username'] for c in cleaned))
+            crash_reports = [
+                CrashReport(application=applications[c['application_name']], user_id=users[c['username']],
+                            **dict((name, c[name]) for name in IMPORT_FIELDS))
+                for c in cleaned
+            ]
+            ImportProgress.objects.filter(source=self.source).update(rows=done)
+            # commit_on_success doesn't nest in Django 1.5: the batch's own
+            # commit also commits the progress update above
+            CrashReport.objects.bulk_increment_or_create(
+                crash_reports, batch_size=max(len(crash_reports), 1), add_counts=True)
+        return len(cleaned)
+
+    def _applications(self, companies):
+        "Returns {name: Application} for a dict of {name: company}, creating the missing ones."
+        found = {}
+        for names in _in_chunks(companies):
+            found.update((a.name, a) for a in Application.objects.filter(name__in=names))
+        missing = [Application(name=name, company=company) for name, company in companies.items() if name not in found]
+        if missing:
+            Application.objects.bulk_create(missing)
+            for names in _in_chunks(a.name for a in missing):
+                found.update((a.name, a) for a in Application.objects.filter(name__in=names))
+        return found
+
+    def _users(self, usernames):
+        "Returns {username: user id} for a set of usernames, creating the missing users without passwords."
+        found = {}
+        for chunk in _in_chunks(usernames):
+            found.update(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+        missing = [User(username=username, password=UNUSABLE_PASSWORD) for username in usernames if username not in found]
+        if missing:
+            User.objects.bulk_create(missing)
+            for chunk in _in_chunks(u.username for u in missing):
+                found.update(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+        return found
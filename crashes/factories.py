@@ -4,6 +4,14 @@ from django.contrib.auth.models import User
 from crashes.models import *
 
 
+def spell(n):
+    """Returns n as letters (0 -> 'a', 12 -> 'bc').
+
+    Crash fingerprints ignore digits, so sequenced titles and details need
+    letters to stay distinct.
+    """
+    return ''.join(chr(ord('a') + int(digit)) for digit in str(n))
+
 class UserFactory(factory.DjangoModelFactory):
     FACTORY_FOR = User
 
@@ -42,7 +50,7 @@ class CrashReportFactory(factory.DjangoModelFactory):
     user = factory.SubFactory(UserFactory)
     kind = CRASH_KIND['crash']
     version = factory.Sequence(lambda n: 'Version {0}'.format(n))
-    details = factory.Sequence(lambda n: 'CrashReport Details {0}'.format(n))
-    title = factory.Sequence(lambda n: 'CrashReport Title {0}'.format(n))
+    details = factory.Sequence(lambda n: 'CrashReport Details {0}'.format(spell(n)))
+    title = factory.Sequence(lambda n: 'CrashReport Title {0}'.format(spell(n)))
     count = 1
 
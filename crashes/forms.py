@@ -1,9 +1,44 @@
 from django import forms
+from django.core.validators import EMPTY_VALUES
 
+from crashes.cache import application_cache
 from crashes.models import Application, CrashReport
 
+
+class PrefetchedModelChoiceField(forms.ModelChoiceField):
+    "A ModelChoiceField that picks from a mapping of pk => object instead of querying."
+    def __init__(self, objects, *args, **kwargs):
+        super(PrefetchedModelChoiceField, self).__init__(*args, **kwargs)
+        self.objects = objects
+
+    def to_python(self, value):
+        if value in EMPTY_VALUES:
+            return None
+        try:
+            return self.objects[int(value)]
+        except (KeyError, ValueError, TypeError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'])
+
+
 class CrashForm(forms.ModelForm):
+    application = PrefetchedModelChoiceField(application_cache, queryset=Application.objects.all())
+
     class Meta:
         model = CrashReport
         fields = ('application', 'title', 'kind', 'details', 'version', 'count')
 
+    def _get_validation_exclusions(self):
+        # the application field already found the application, so skip
+        # ForeignKey.validate's existence query
+        return super(CrashForm, self)._get_validation_exclusions() + ['application']
+
+
+class BulkCrashForm(CrashForm):
+    """CrashForm for one crash of a bulk upload.
+
+    The applications of the whole upload are fetched up front and passed in
+    as a dict of id => Application, so validating a crash doesn't query.
+    """
+    def __init__(self, data, applications, *args, **kwargs):
+        super(BulkCrashForm, self).__init__(data, *args, **kwargs)
+        self.fields['application'].objects = applications
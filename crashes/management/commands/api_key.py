@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from crashes.models import ApiKey
+
+
+class Command(BaseCommand):
+    args = '<username>'
+    help = ('Prints the API key a program sends as "Authorization: Token <key>" to file crashes as a user, '
+            'making one if needed.')
+    option_list = BaseCommand.option_list + (
+        make_option('--reset', action='store_true', default=False,
+                    help='Replace the existing key, which stops working.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Expected one username')
+        try:
+            user = User.objects.get(username=args[0])
+        except User.DoesNotExist:
+            raise CommandError('No user named {0!r}'.format(args[0]))
+        self.stdout.write(ApiKey.objects.for_user(user, reset=options['reset']).key)
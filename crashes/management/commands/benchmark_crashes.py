@@ -0,0 +1,62 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from crashes.benchmarks import SCENARIOS, run_benchmarks
+from crashes.seeding import seed_dataset
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database and benchmarks the crash views through the test client, '
+            'writing latency percentiles, query counts and peak memory as JSON.')
+    option_list = BaseCommand.option_list + (
+        make_option('--users', type='int', default=10,
+                    help='Number of users to seed.'),
+        make_option('--applications', type='int', default=5,
+                    help='Number of applications to seed.'),
+        make_option('--reports', type='int', default=1000,
+                    help='Number of crash reports to seed per user.'),
+        make_option('--iterations', type='int', default=200,
+                    help='Number of measured requests per scenario.'),
+        make_option('--warmup', type='int', default=20,
+                    help='Number of unmeasured requests to make before measuring each scenario.'),
+        make_option('--scenario', action='append', dest='scenarios',
+                    help='Only run this scenario ({0}). Repeatable.'.format(', '.join(name for name, _, _ in SCENARIOS))),
+        make_option('--seed', type='int', default=0,
+                    help='Random seed, so runs with the same options make the same requests.'),
+        make_option('--output', '-o', default='-',
+                    help='File to write the JSON results to; - (default) writes to stdout.'),
+    )
+
+    def handle(self, *args, **options):
+        names = [name for name, _, _ in SCENARIOS]
+        for scenario in options['scenarios'] or []:
+            if scenario not in names:
+                raise CommandError('Unknown scenario {0!r}; expected one of {1}'.format(scenario, ', '.join(names)))
+
+        # never touch the real database: build a test one the way the test runner does
+        from south.management.commands import patch_for_test_db_setup
+        patch_for_test_db_setup()
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # the similarity index is the bulk of the seeding time, so only build it when it's used
+            similarity_index = not options['scenarios'] or 'similar_crashes' in options['scenarios']
+            dataset = seed_dataset(options['users'], options['applications'], options['reports'], seed=options['seed'],
+                                   similarity_index=similarity_index)
+            results = run_benchmarks(dataset, options['scenarios'], iterations=options['iterations'],
+                                     warmup=options['warmup'], seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
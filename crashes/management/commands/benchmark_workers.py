@@ -0,0 +1,80 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from crashes.server_benchmarks import benchmark_worker_class, manage
+
+
+class Command(BaseCommand):
+    help = ('Serves a throwaway seeded database with gunicorn, once per worker class, and writes the '
+            'throughput, latency and memory per worker of each as JSON. Linux only.')
+    option_list = BaseCommand.option_list + (
+        make_option('--worker-class', action='append', dest='worker_classes',
+                    help='Gunicorn worker class to benchmark; repeatable. Defaults to sync and gevent.'),
+        make_option('--workers', type='int', default=2,
+                    help='Number of worker processes.'),
+        make_option('--concurrency', type='int', default=16,
+                    help='Number of client threads making requests at once.'),
+        make_option('--slow-clients', type='int', default=0,
+                    help='Number of extra clients that send their request a line a second.'),
+        make_option('--duration', type='float', default=10,
+                    help='Seconds to measure each worker class for.'),
+        make_option('--warmup', type='float', default=2,
+                    help='Seconds of unmeasured requests before measuring.'),
+        make_option('--users', type='int', default=4,
+                    help='Number of users to seed and make requests as.'),
+        make_option('--reports', type='int', default=200,
+                    help='Number of crash reports to seed per user.'),
+        make_option('--seed', type='int', default=0,
+                    help='Random seed.'),
+        make_option('--output', '-o', default='-',
+                    help='File to write the JSON results to; - (default) writes to stdout.'),
+    )
+
+    def handle(self, *args, **options):
+        path = tempfile.mkdtemp(prefix='crashula-benchmark-')
+        env = dict(
+            os.environ,
+            CRASHULA_DATABASE_URL='sqlite:///' + os.path.join(path, 'benchmark.db'),
+            CRASHULA_DEBUG='no',
+            CRASHULA_ALLOWED_HOSTS='127.0.0.1',
+            CRASHULA_PERFORMANCE_SAMPLE_RATE='0',
+            CRASHULA_PROFILE_PATH=os.path.join(path, 'profiles'),
+            CRASHULA_STATIC_ROOT=os.path.join(path, 'static'),
+        )
+        try:
+            manage(env, 'syncdb', '--noinput', '--migrate', '--verbosity=0')
+            manage(env, 'collectstatic', '--noinput', '--verbosity=0')
+            manage(env, 'seed_crashes', '--users={0}'.format(options['users']), '--reports={0}'.format(options['reports']),
+                   '--seed={0}'.format(options['seed']), '--verbosity=0')
+            usernames = ['seed{0}'.format(n) for n in range(options['users'])]
+            results = {}
+            for worker_class in options['worker_classes'] or ['sync', 'gevent']:
+                results[worker_class] = benchmark_worker_class(
+                    env, worker_class, options['workers'], usernames,
+                    concurrency=options['concurrency'],
+                    duration=options['duration'],
+                    warmup=options['warmup'],
+                    slow_clients=options['slow_clients'],
+                    seed=options['seed'],
+                )
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+        output = json.dumps(dict(
+            environment=dict(python=platform.python_version(), database='sqlite', cpus=os.sysconf('SC_NPROCESSORS_ONLN')),
+            concurrency=options['concurrency'],
+            slow_clients=options['slow_clients'],
+            duration=options['duration'],
+            worker_classes=results,
+        ), indent=2, sort_keys=True)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
@@ -0,0 +1,21 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from crashes.models import CrashHistory
+
+
+class Command(BaseCommand):
+    help = 'Merges old hourly crash occurrence buckets into daily ones.'
+    option_list = BaseCommand.option_list + (
+        make_option('--keep-days', type='int', default=7,
+                    help='Number of most recent days to keep at hourly resolution.'),
+    )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['keep_days'])
+        merged = CrashHistory.objects.downsample(before)
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Merged {0} hourly buckets into daily ones'.format(merged))
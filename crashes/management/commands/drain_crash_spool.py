@@ -0,0 +1,34 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from crashes.spool import get_spool, drain_spool
+
+
+class Command(BaseCommand):
+    help = 'Moves crashes queued by the spool ingest mode into the database.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=500,
+                    help='Number of crashes to store per transaction.'),
+        make_option('--loop', action='store_true', default=False,
+                    help='Keep draining until interrupted instead of exiting once the spool is empty.'),
+        make_option('--interval', type='float', default=1.0,
+                    help='Seconds to wait between polls of an empty spool when looping.'),
+        make_option('--requeue-dead-letters', action='store_true', default=False,
+                    help='Queue the crashes that could not be stored again before draining.'),
+    )
+
+    def handle(self, *args, **options):
+        spool = get_spool()
+        if options['requeue_dead_letters']:
+            requeued = spool.requeue_dead_letters()
+            if int(options['verbosity']) > 0:
+                self.stdout.write('Requeued {0} dead letters'.format(requeued))
+        while True:
+            drained = drain_spool(spool, batch_size=options['batch_size'])
+            if drained and int(options['verbosity']) > 0:
+                self.stdout.write('Drained {0} crashes'.format(drained))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,116 @@
+import datetime
+import gzip
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from crashes.dumps import EXPORT_WRITERS, export_queryset, export_rows
+from crashes.models import CRASH_KIND
+
+
+def parse_moment(value):
+    "Returns an aware datetime for a YYYY-MM-DD date (its midnight) or an ISO 8601 datetime."
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            date = parse_date(value)
+            if date is not None:
+                moment = datetime.datetime.combine(date, datetime.time())
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise CommandError('Expected a date or datetime, got {0!r}'.format(value))
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.get_current_timezone())
+    return moment
+
+def parse_kind(value):
+    "Returns the CRASH_KIND number of a kind name or number."
+    if value.isdigit() and int(value) in CRASH_KIND.values():
+        return int(value)
+    if value.lower() in CRASH_KIND:
+        return CRASH_KIND[value.lower()]
+    raise CommandError('Unknown kind {0!r}; expected one of {1}'.format(value, ', '.join(sorted(CRASH_KIND))))
+
+class UnterminatedOutput(object):
+    "Writes to a command's stdout as a file would, without the newline it adds to every write."
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, data):
+        self.output.write(data, ending='')
+
+    def flush(self):
+        self.output.flush()
+
+
+class Command(BaseCommand):
+    help = 'Streams crash reports, with their application and user, as CSV or NDJSON.'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=sorted(EXPORT_WRITERS), default='csv',
+                    help='Output format: csv (default) or ndjson.'),
+        make_option('--output', '-o', default='-',
+                    help='File to write to; - (default) writes to stdout.'),
+        make_option('--gzip', action='store_true', default=False,
+                    help='Compress the output with gzip.'),
+        make_option('--application', action='append',
+                    help='Only export crashes of this application id or name. Repeatable.'),
+        make_option('--kind', action='append',
+                    help='Only export crashes of this kind name or number. Repeatable.'),
+        make_option('--user', action='append',
+                    help='Only export crashes filed by this username. Repeatable.'),
+        make_option('--since',
+                    help='Only export crashes whose date is at or after this date or datetime.'),
+        make_option('--until',
+                    help='Only export crashes whose date is before this date or datetime.'),
+        make_option('--date-field', choices=['updated_at', 'created_at'], default='updated_at',
+                    help='The date --since and --until apply to: updated_at (default) or created_at.'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Number of crash reports to read per query.'),
+    )
+
+    def handle(self, *args, **options):
+        crash_reports = self.filter(export_queryset(), options)
+
+        if options['output'] == '-':
+            stream, close = UnterminatedOutput(self.stdout), False
+        else:
+            stream, close = open(options['output'], 'wb'), True
+        if options['gzip']:
+            stream, gzip_stream = gzip.GzipFile(fileobj=stream, mode='wb'), stream
+        try:
+            writer = EXPORT_WRITERS[options['format']](stream)
+            exported = 0
+            for row in export_rows(crash_reports, batch_size=options['batch_size']):
+                writer.write(row)
+                exported += 1
+        finally:
+            if options['gzip']:
+                stream.close()
+                stream = gzip_stream
+            if close:
+                stream.close()
+            else:
+                stream.flush()
+        if int(options['verbosity']) > 1:
+            self.stderr.write('Exported {0} crash reports'.format(exported))
+
+    def filter(self, crash_reports, options):
+        applications = options['application']
+        if applications:
+            crash_reports = crash_reports.filter(
+                Q(application__in=[int(a) for a in applications if a.isdigit()]) |
+                Q(application__name__in=[a for a in applications if not a.isdigit()]))
+        if options['kind']:
+            crash_reports = crash_reports.filter(kind__in=[parse_kind(kind) for kind in options['kind']])
+        if options['user']:
+            crash_reports = crash_reports.filter(user__username__in=options['user'])
+        date_field = options['date_field']
+        if options['since']:
+            crash_reports = crash_reports.filter(**{date_field + '__gte': parse_moment(options['since'])})
+        if options['until']:
+            crash_reports = crash_reports.filter(**{date_field + '__lt': parse_moment(options['until'])})
+        return crash_reports
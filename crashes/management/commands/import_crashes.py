@@ -0,0 +1,80 @@
+import gzip
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crashes.dumps import EXPORT_READERS, CrashImporter
+from crashes.models import CrashReport, crash_reports_created
+from crashes.similarity import index_created_crash_reports
+
+
+def file_source(f):
+    "Returns the source name of an open file: its path, size and modification time, so a new dump at a path starts over."
+    stat = os.fstat(f.fileno())
+    return '{0}:{1}:{2}'.format(os.path.abspath(f.name), stat.st_size, int(stat.st_mtime))
+
+
+class Command(BaseCommand):
+    args = '<path>'
+    help = ('Loads crash reports from a CSV or NDJSON file made by export_crashes (- reads stdin), '
+            'merging duplicates into existing reports.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=sorted(EXPORT_READERS),
+                    help='Input format: csv or ndjson. Defaults to the file extension.'),
+        make_option('--gzip', action='store_true', default=False,
+                    help='The input is gzipped. Implied by a .gz extension.'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Number of rows to commit per transaction.'),
+        make_option('--source',
+                    help='Name the progress of this import is saved under; required to read stdin. Defaults to '
+                         'the absolute path, size and modification time of the file.'),
+        make_option('--restart', action='store_true', default=False,
+                    help='Start from the first row, ignoring the saved progress.'),
+        make_option('--no-similarity-index', action='store_false', dest='similarity_index', default=True,
+                    help="Don't index the new crash reports for similar-crash suggestions while importing; "
+                         "run rebuild_similarity_index afterwards."),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Expected one path to import')
+        path = args[0]
+        name = path[:-len('.gz')] if path.endswith('.gz') else path
+        format = options['format'] or os.path.splitext(name)[1].lstrip('.').replace('jsonl', 'ndjson')
+        if format not in EXPORT_READERS:
+            raise CommandError('Unknown format {0!r}; pass --format'.format(format))
+
+        if path == '-' and not options['source']:
+            raise CommandError('Pass --source to name the input read from stdin, so an interrupted import can resume')
+
+        raw = sys.stdin if path == '-' else open(path, 'rb')
+        stream = gzip.GzipFile(fileobj=raw, mode='rb') if options['gzip'] or path.endswith('.gz') else raw
+        importer = CrashImporter(
+            options['source'] or file_source(raw),
+            batch_size=options['batch_size'],
+            progress=self.progress if int(options['verbosity']) > 0 else None,
+            invalid=self.invalid,
+        )
+        if not options['similarity_index']:
+            crash_reports_created.disconnect(index_created_crash_reports, sender=CrashReport)
+        try:
+            imported, skipped = importer.run(EXPORT_READERS[format](stream), restart=options['restart'])
+        finally:
+            if not options['similarity_index']:
+                crash_reports_created.connect(index_created_crash_reports, sender=CrashReport)
+            if stream is not raw:
+                stream.close()
+            if raw is not sys.stdin:
+                raw.close()
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Imported {0} rows, skipped {1} invalid rows'.format(imported, skipped))
+
+    def progress(self, done, imported, skipped, seconds):
+        self.stderr.write('{0} rows read, {1} imported, {2} skipped ({3:.0f} rows/s)'.format(
+            done, imported, skipped, imported / seconds if seconds else 0))
+
+    def invalid(self, number, errors):
+        self.stderr.write('Row {0} skipped: {1}'.format(number, '; '.join(
+            '{0}: {1}'.format(name, ' '.join(messages)) for name, messages in sorted(errors.items()))))
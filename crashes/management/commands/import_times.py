@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def time_imports(lean_runtime):
+    "Returns the import timings of crashula.importtime's cold start in a fresh process."
+    env = dict(os.environ, CRASHULA_LEAN_RUNTIME='yes' if lean_runtime else 'no')
+    process = subprocess.Popen([sys.executable, '-m', 'crashula.importtime'],
+                               env=env, cwd=PROJECT_PATH, stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode:
+        raise CommandError('Timing the imports failed with {0}'.format(process.returncode))
+    return json.loads(output)
+
+
+class Command(BaseCommand):
+    help = ('Times a cold start of the site in a fresh process, the way a gunicorn worker starts, '
+            'and prints the cumulative import time of the slowest modules.')
+    option_list = BaseCommand.option_list + (
+        make_option('--full', action='store_true', default=False,
+                    help='Time the full set of apps management commands use, instead of the lean runtime.'),
+        make_option('--repeat', type='int', default=3,
+                    help='Number of fresh processes to time; the one with the median import time is reported.'),
+        make_option('--limit', type='int', default=30,
+                    help='Number of modules to print.'),
+        make_option('--sort', choices=('cumulative', 'self'), default='cumulative',
+                    help='Print the modules with the most cumulative (default) or self time.'),
+        make_option('--budget', type='float',
+                    help='Fail if importing takes longer than this many milliseconds.'),
+        make_option('--json', action='store_true', default=False,
+                    help='Print every import as JSON instead.'),
+    )
+
+    def handle(self, *args, **options):
+        runs = sorted((time_imports(not options['full']) for _ in range(max(options['repeat'], 1))),
+                      key=lambda run: run['imports'])
+        run = runs[len(runs) // 2]
+
+        if options['json']:
+            self.stdout.write(json.dumps(run, indent=2, sort_keys=True))
+        else:
+            self.stdout.write('{0} runtime: {1} modules, imports took {2:.1f} ms of a {3:.1f} ms start'.format(
+                'Lean' if run['lean_runtime'] else 'Full', run['modules'], run['imports'] * 1000, run['startup'] * 1000))
+            self.stdout.write('{0:>10} {1:>10}  {2}'.format('cumulative', 'self', 'modules'))
+            records = sorted(run['records'], key=lambda record: record[options['sort']], reverse=True)
+            for record in records[:options['limit']]:
+                self.stdout.write('{0:>10.1f} {1:>10.1f}  {2}{3}'.format(
+                    record['cumulative'] * 1000, record['self'] * 1000, '  ' * record['depth'],
+                    ', '.join(record['modules'])))
+
+        if options['budget'] is not None and run['imports'] * 1000 > options['budget']:
+            raise CommandError('Imports took {0:.1f} ms, over the budget of {1:.1f} ms'.format(
+                run['imports'] * 1000, options['budget']))
@@ -0,0 +1,27 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crashes.models import ApplicationStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-application crash statistics from the crash reports.'
+    option_list = BaseCommand.option_list + (
+        make_option('--check', action='store_true', default=False,
+                    help='Only report statistics that drifted from the crash reports, and fail if any did.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = ApplicationStats.objects.drift()
+            for application_id, version, kind, expected, stored in drift:
+                self.stdout.write('application {0} version {1!r} kind {2}: expected {3}, stored {4}'.format(
+                    application_id, version, kind, expected, stored))
+            if drift:
+                raise CommandError('{0} application statistics drifted'.format(len(drift)))
+            return
+
+        rebuilt = ApplicationStats.objects.rebuild()
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Rebuilt {0} application statistics'.format(rebuilt))
@@ -0,0 +1,29 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crashes.models import CrashReport
+from crashes.similarity import index_crash_reports
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the similar-crash suggestion index from the crash reports.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=500,
+                    help='Number of crash reports to index per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        crash_reports = CrashReport.objects.only('id', 'application', 'user', 'title', 'details').order_by('id')
+        indexed, last_id = 0, 0
+        while True:
+            batch = list(crash_reports.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.commit_on_success():
+                index_crash_reports(batch)
+            indexed += len(batch)
+            last_id = batch[-1].id
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Indexed {0} crash reports'.format(indexed))
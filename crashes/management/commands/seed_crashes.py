@@ -0,0 +1,44 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from crashes.seeding import SEED_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    help = ('Bulk inserts generated users, applications and crash reports, with a long-tailed '
+            'distribution of duplicates and kinds, for development and load testing.')
+    option_list = BaseCommand.option_list + (
+        make_option('--users', type='int', default=100,
+                    help='Number of users to create.'),
+        make_option('--applications', type='int', default=10,
+                    help='Number of applications to create.'),
+        make_option('--reports', type='int', default=1000,
+                    help='Number of distinct crash reports to create per user.'),
+        make_option('--seed', type='int', default=0,
+                    help='Random seed; the same seed generates the same crash reports.'),
+        make_option('--prefix', default='seed',
+                    help='Prefix of the usernames and application names, which must not exist yet.'),
+        make_option('--password', default=SEED_PASSWORD,
+                    help='Password of every user, hashed once.'),
+        make_option('--password-hash',
+                    help='Precomputed password hash of every user, instead of hashing --password.'),
+        make_option('--similarity-index', action='store_true', default=False,
+                    help='Also index the crash reports for similar-crash suggestions, which is slower.'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Number of crash reports to generate and insert per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        dataset = seed_dataset(
+            options['users'], options['applications'], options['reports'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            password=options['password'],
+            password_hash=options['password_hash'],
+            similarity_index=options['similarity_index'],
+            batch_size=options['batch_size'],
+        )
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Created {users} users, {applications} applications and {crash_reports} crash reports'.format(
+                **dataset.describe()))
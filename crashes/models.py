@@ -1,5 +1,27 @@
-from django.db import models
+import binascii
+import datetime
+import hashlib
+import os
+import re
+from collections import defaultdict
+
+from django.db import models, connections, transaction, IntegrityError
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from crashes.pagination import EPOCH
+
+
+# Sent when crash reports are inserted or updated in bulk, where post_save
+# isn't. user_ids is the set of users whose crash reports changed.
+crash_reports_changed = Signal(providing_args=['user_ids'])
+
+# Sent after crash reports are inserted in bulk, where post_save isn't.
+# crash_reports is the list of new CrashReports, with their ids set.
+crash_reports_created = Signal(providing_args=['crash_reports'])
 
 
 class Application(models.Model):
@@ -23,6 +45,201 @@ CRASH_KIND_CHOICES = tuple(enumerate((
 
 CRASH_KIND = dict((n.lower(), i) for (i, n) in CRASH_KIND_CHOICES)
 
+FINGERPRINT_NOISE = re.compile(r'0x[0-9a-f]+|[0-9]+')
+FINGERPRINT_WHITESPACE = re.compile(r'\s+')
+
+def normalize_for_fingerprint(text):
+    """Strips the parts of crash text that vary between occurrences of the same crash.
+
+    Lowercases, removes addresses and numbers, and collapses whitespace.
+    """
+    text = FINGERPRINT_NOISE.sub('', (text or u'').lower())
+    return FINGERPRINT_WHITESPACE.sub(' ', text).strip()
+
+def crash_fingerprint(application_id, kind, title, details):
+    "Returns the hex digest used to deduplicate crash reports."
+    parts = [unicode(application_id), unicode(kind), normalize_for_fingerprint(title), normalize_for_fingerprint(details)]
+    return hashlib.sha1(u'\0'.join(parts).encode('utf-8')).hexdigest()
+
+class CrashReportManager(models.Manager):
+    def increment_or_create(self, defaults=None, amount=1, **lookup):
+        """Adds amount to the count of the crash report matching lookup, or creates it.
+
+        The increment is a single UPDATE with an F() expression, so concurrent
+        submissions of the same crash never lose a count. The insert is guarded
+        by the unique constraint on the lookup fields: losing the insert race
+        falls back to incrementing the winner's row.
+
+        Returns a tuple of (crash_report_id, created).
+        """
+        row = self._increment(lookup, amount)
+        if row is not None:
+            return row[0], False
+
+        params = dict(defaults or {})
+        params.update(lookup)
+        crash_report = self.model(**params)
+        try:
+            sid = transaction.savepoint(using=self.db)
+            crash_report.save(force_insert=True, using=self.db)
+            transaction.savepoint_commit(sid, using=self.db)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid, using=self.db)
+            row = self._increment(lookup, amount)
+            if row is None:
+                raise
+            return row[0], False
+        ApplicationStats.objects.add(crash_report.application_id, crash_report.version, crash_report.kind,
+                                     crash_report.count, crash_report.updated_at)
+        CrashHistory.objects.record({crash_report.id: crash_report.count}, crash_report.updated_at)
+        return crash_report.id, True
+
+    def bulk_increment_or_create(self, crash_reports, batch_size=500, add_counts=False):
+        """Saves many unsaved crash reports, incrementing the ones that already exist.
+
+        Crash reports are deduplicated by (user, fingerprint), both against the
+        database and against each other, following the same counting rules as
+        increment_or_create, unless add_counts is set: then a duplicate adds its
+        own count instead of one. Each batch costs a fixed handful of
+        statements: one SELECT for existing rows, one bulk INSERT, one SELECT
+        for the new ids and one UPDATE per distinct increment.
+
+        Returns a list of (crash_report_id, created) in the order given.
+        """
+        results = []
+        for start in range(0, len(crash_reports), batch_size):
+            batch = crash_reports[start:start + batch_size]
+            with transaction.commit_on_success(using=self.db):
+                results.extend(self._bulk_increment_or_create(batch, add_counts))
+            crash_reports_changed.send(sender=self.model, user_ids=set(c.user_id for c in batch))
+        return results
+
+    def _bulk_increment_or_create(self, crash_reports, add_counts=False):
+        keys = []
+        for crash_report in crash_reports:
+            crash_report.fingerprint = crash_report.compute_fingerprint()
+            keys.append((crash_report.user_id, crash_report.fingerprint))
+
+        rows = self._rows_by_fingerprint(keys)
+        increments = defaultdict(int)
+        created, new_crash_reports = set(), []
+        for key, crash_report in zip(keys, crash_reports):
+            if key in rows or key in created:
+                increments[key] += crash_report.count if add_counts else 1
+            else:
+                created.add(key)
+                new_crash_reports.append(crash_report)
+
+        now = timezone.now()
+        stats, new_counts = defaultdict(int), {}
+        if new_crash_reports:
+            try:
+                sid = transaction.savepoint(using=self.db)
+                self.bulk_create(new_crash_reports)
+                transaction.savepoint_commit(sid, using=self.db)
+                for crash_report in new_crash_reports:
+                    stats[crash_report.application_id, crash_report.version, crash_report.kind] += crash_report.count
+                    new_counts[crash_report.user_id, crash_report.fingerprint] = crash_report.count
+            except IntegrityError:
+                # lost an insert race; fall back to the row-at-a-time path
+                transaction.savepoint_rollback(sid, using=self.db)
+                for crash_report in new_crash_reports:
+                    key = (crash_report.user_id, crash_report.fingerprint)
+                    crash_report_id, was_created = self.increment_or_create(
+                        user=crash_report.user,
+                        fingerprint=crash_report.fingerprint,
+                        defaults=dict((f.name, getattr(crash_report, f.name))
+                                      for f in self.model._meta.fields if not f.primary_key),
+                        amount=crash_report.count if add_counts else 1,
+                    )
+                    if not was_created:
+                        created.discard(key)
+            rows.update(self._rows_by_fingerprint([k for k in keys if k not in rows]))
+            if new_counts:
+                # bulk_create doesn't set primary keys
+                for crash_report in new_crash_reports:
+                    crash_report.id = rows[crash_report.user_id, crash_report.fingerprint][0]
+                crash_reports_created.send(sender=self.model, crash_reports=new_crash_reports)
+
+        by_amount = defaultdict(list)
+        for key, amount in increments.items():
+            crash_report_id, application_id, version, kind = rows[key]
+            by_amount[amount].append(crash_report_id)
+            stats[application_id, version, kind] += amount
+        for amount, crash_report_ids in by_amount.items():
+            self.filter(id__in=crash_report_ids).update(count=F('count') + amount, updated_at=now)
+        ApplicationStats.objects.add_many(stats, now)
+        occurrences = defaultdict(int)
+        for key, count in new_counts.items() + increments.items():
+            occurrences[rows[key][0]] += count
+        CrashHistory.objects.record(occurrences, now)
+
+        results, seen = [], set()
+        for key in keys:
+            results.append((rows[key][0], key in created and key not in seen))
+            seen.add(key)
+        return results
+
+    def _rows_by_fingerprint(self, keys):
+        """Returns a dict of (user_id, fingerprint) => (crash_report_id, application_id, version, kind)
+        for the keys that exist.
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+        # one IN per column rather than an OR per user: building the Q tree
+        # costs more than the rows a fingerprint shared between users adds
+        rows = self.values_list('user', 'fingerprint', 'id', 'application', 'version', 'kind').filter(
+            user__in=set(user_id for user_id, _ in keys),
+            fingerprint__in=set(fingerprint for _, fingerprint in keys),
+        )
+        return dict((tuple(row[:2]), tuple(row[2:])) for row in rows if tuple(row[:2]) in keys)
+
+    INCREMENT_RETURNING = ('id', 'user', 'application', 'version', 'kind')
+
+    def _increment(self, lookup, amount=1):
+        """Adds amount to the count of the crash report matching lookup.
+
+        Returns its INCREMENT_RETURNING fields, or None if nothing matched.
+        """
+        now = timezone.now()
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            row = self._increment_returning(connection, lookup, amount, now)
+        elif self.filter(**lookup).update(count=F('count') + amount, updated_at=now):
+            row = self.filter(**lookup).values_list(*self.INCREMENT_RETURNING)[0]
+        else:
+            row = None
+        if row is not None:
+            crash_report_id, user_id, application_id, version, kind = row
+            ApplicationStats.objects.add(application_id, version, kind, amount, now)
+            CrashHistory.objects.record({crash_report_id: amount}, now)
+            crash_reports_changed.send(sender=self.model, user_ids=set([user_id]))
+        return row
+
+    def _increment_returning(self, connection, lookup, amount, now):
+        "Same as _increment, but uses UPDATE ... RETURNING to do it in one round trip."
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        where, params = [], [amount, now]
+        for name, value in sorted(lookup.items()):
+            field = opts.get_field(name)
+            if isinstance(value, models.Model):
+                value = value.pk
+            where.append('{0} = %s'.format(qn(field.column)))
+            params.append(field.get_db_prep_save(value, connection=connection))
+        cursor = connection.cursor()
+        cursor.execute('UPDATE {table} SET {count} = {count} + %s, {updated_at} = %s WHERE {where} RETURNING {returning}'.format(
+            table=qn(opts.db_table),
+            count=qn(opts.get_field('count').column),
+            updated_at=qn(opts.get_field('updated_at').column),
+            where=' AND '.join(where),
+            returning=', '.join(qn(opts.get_field(name).column) for name in self.INCREMENT_RETURNING),
+        ), params)
+        row = cursor.fetchone()
+        transaction.commit_unless_managed(using=self.db)
+        return row
+
 class CrashReport(models.Model):
     application = models.ForeignKey(Application, related_name='crash_reports')
     version = models.CharField(max_length=25, blank=True)
@@ -31,10 +248,24 @@ class CrashReport(models.Model):
     details = models.TextField(blank=True)
     title = models.CharField(max_length=200, db_index=True)
     count = models.IntegerField(default=1)
+    fingerprint = models.CharField(max_length=40, editable=False)
 
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CrashReportManager()
+
+    class Meta:
+        unique_together = (('user', 'fingerprint'),)
+        index_together = (('user', 'updated_at', 'id'),)
+
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.compute_fingerprint()
+        super(CrashReport, self).save(*args, **kwargs)
+
+    def compute_fingerprint(self):
+        return crash_fingerprint(self.application_id, self.kind, self.title, self.details)
+
     def __unicode__(self):
         return '{title} ({app} {type} by {user})'.format(
             title=self.title,
@@ -43,3 +274,329 @@ class CrashReport(models.Model):
             user=self.user.username,
         )
 
+
+
+class ApplicationStatsManager(models.Manager):
+    def add(self, application_id, version, kind, count, seen_at=None):
+        """Adds count crashes to the (application, version, kind) rollup, creating it if needed.
+
+        seen_at, when given, becomes its last_seen_at. Like
+        CrashReport.objects.increment_or_create, this is an F() UPDATE with an
+        insert fallback guarded by the unique constraint.
+        """
+        lookup = dict(application=application_id, version=version, kind=kind)
+        changes = dict(count=F('count') + count)
+        if seen_at is not None:
+            changes['last_seen_at'] = seen_at
+        if self.filter(**lookup).update(**changes):
+            return
+        try:
+            sid = transaction.savepoint(using=self.db)
+            self.create(application_id=application_id, version=version, kind=kind, count=count,
+                        last_seen_at=seen_at or timezone.now())
+            transaction.savepoint_commit(sid, using=self.db)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid, using=self.db)
+            self.filter(**lookup).update(**changes)
+
+    def subtract(self, application_id, version, kind, count):
+        """Takes count crashes from the (application, version, kind) rollup.
+
+        It never creates a rollup. One that doesn't include the crashes, like
+        those of reports made outside the managers, is left for
+        rebuild_application_stats rather than going negative.
+        """
+        self.filter(application=application_id, version=version, kind=kind, count__gte=count).update(
+            count=F('count') - count)
+
+    def add_many(self, counts, seen_at):
+        """Adds a dict of {(application_id, version, kind): count} to the rollups.
+
+        Takes a fixed number of queries however many rollups change: one
+        UPDATE per distinct count, and a bulk insert of the missing rollups.
+        """
+        if not counts:
+            return
+        rows = self.filter(
+            application__in=set(key[0] for key in counts), version__in=set(key[1] for key in counts),
+        ).values_list('id', 'application', 'version', 'kind')
+        existing = dict((tuple(row[1:]), row[0]) for row in rows if tuple(row[1:]) in counts)
+        by_count = defaultdict(list)
+        for key, id in existing.items():
+            by_count[counts[key]].append(id)
+        for count, ids in by_count.items():
+            self.filter(id__in=ids).update(count=F('count') + count, last_seen_at=seen_at)
+
+        missing = [key for key in counts if key not in existing]
+        if not missing:
+            return
+        try:
+            sid = transaction.savepoint(using=self.db)
+            self.bulk_create([
+                self.model(application_id=application_id, version=version, kind=kind,
+                           count=counts[application_id, version, kind], last_seen_at=seen_at)
+                for application_id, version, kind in missing
+            ])
+            transaction.savepoint_commit(sid, using=self.db)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid, using=self.db)
+            for key in missing:
+                self.add(*key, count=counts[key], seen_at=seen_at)
+
+    def expected(self):
+        "Returns {(application_id, version, kind): (count, last_seen_at)} aggregated from every crash report."
+        rows = CrashReport.objects.values('application', 'version', 'kind').annotate(
+            total=models.Sum('count'), last_seen_at=models.Max('updated_at')).order_by()
+        return dict(((row['application'], row['version'], row['kind']), (row['total'], row['last_seen_at']))
+                    for row in rows)
+
+    def drift(self):
+        "Returns a sorted list of (application_id, version, kind, expected count, stored count) that disagree."
+        expected = self.expected()
+        stored = dict(((application_id, version, kind), count) for application_id, version, kind, count
+                      in self.values_list('application', 'version', 'kind', 'count'))
+        drift = []
+        for key in set(expected) | set(stored):
+            expected_count, stored_count = expected.get(key, (0, None))[0], stored.get(key, 0)
+            if expected_count != stored_count:
+                drift.append(key + (expected_count, stored_count))
+        return sorted(drift)
+
+    def rebuild(self):
+        "Replaces every rollup with one aggregated from the crash reports. Returns the number of rollups."
+        stats = [
+            self.model(application_id=application_id, version=version, kind=kind, count=count, last_seen_at=last_seen_at)
+            for (application_id, version, kind), (count, last_seen_at) in self.expected().items()
+        ]
+        with transaction.commit_on_success(using=self.db):
+            self.all().delete()
+            self.bulk_create(stats)
+        return len(stats)
+
+class ApplicationStats(models.Model):
+    """Crash totals of an application, by version and kind.
+
+    Kept up to date as crashes are filed, so per-application numbers don't
+    need to aggregate over every crash report. The rebuild_application_stats
+    command recomputes them from scratch.
+    """
+    application = models.ForeignKey(Application, related_name='stats')
+    version = models.CharField(max_length=25, blank=True)
+    kind = models.IntegerField(choices=CRASH_KIND_CHOICES, default=0)
+    count = models.IntegerField(default=0)
+    last_seen_at = models.DateTimeField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ApplicationStatsManager()
+
+    class Meta:
+        unique_together = (('application', 'version', 'kind'),)
+        verbose_name_plural = 'application stats'
+
+    def __unicode__(self):
+        return '{app} {version} {type}: {count}'.format(
+            app=self.application.name,
+            version=self.version,
+            type=self.get_kind_display().lower(),
+            count=self.count,
+        )
+
+@receiver(post_delete, sender=CrashReport)
+def remove_crash_report_from_stats(sender, instance, **kwargs):
+    # subtract never creates a rollup, which for a report deleted along
+    # with its application would outlive it
+    ApplicationStats.objects.subtract(instance.application_id, instance.version, instance.kind, instance.count)
+
+@receiver(pre_delete, sender=Application)
+def remove_application_stats(sender, instance, **kwargs):
+    "Deletes an application's rollups before its crash reports, so their removal has nothing to adjust."
+    ApplicationStats.objects.filter(application=instance).delete()
+
+
+HISTORY_RESOLUTION = dict(hourly=60 * 60, daily=24 * 60 * 60)
+HISTORY_RESOLUTION_CHOICES = (
+    (HISTORY_RESOLUTION['hourly'], 'Hourly'),
+    (HISTORY_RESOLUTION['daily'], 'Daily'),
+)
+
+def history_bucket(when, resolution):
+    "Returns the start of the resolution seconds long bucket holding when, counted from the epoch in UTC."
+    delta = when - EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % resolution)
+
+class CrashHistoryManager(models.Manager):
+    def record(self, counts, occurred_at):
+        """Adds a dict of {crash_report_id: occurrences} to the hourly buckets holding occurred_at.
+
+        Like ApplicationStats.objects.add_many, this takes a fixed number of
+        queries: one SELECT, one UPDATE per distinct count and a bulk insert
+        of the missing buckets.
+        """
+        counts = dict((id, count) for id, count in counts.items() if count)
+        if not counts:
+            return
+        resolution = HISTORY_RESOLUTION['hourly']
+        self._add(counts, resolution, history_bucket(occurred_at, resolution), restrict=True)
+
+    def downsample(self, before):
+        """Merges the hourly buckets of the days before the day holding before into daily ones.
+
+        Each day is merged in its own transaction. Returns the number of
+        hourly buckets merged.
+        """
+        hourly, daily = HISTORY_RESOLUTION['hourly'], HISTORY_RESOLUTION['daily']
+        cutoff = history_bucket(before, daily)
+        merged = 0
+        while True:
+            oldest = self.filter(resolution=hourly, bucket__lt=cutoff).aggregate(oldest=models.Min('bucket'))['oldest']
+            if oldest is None:
+                return merged
+            day = history_bucket(oldest, daily)
+            buckets = self.filter(resolution=hourly, bucket__gte=day, bucket__lt=day + datetime.timedelta(days=1))
+            with transaction.commit_on_success(using=self.db):
+                counts = dict(buckets.values_list('crash_report').annotate(models.Sum('count')).order_by())
+                self._add(counts, daily, day)
+                merged += buckets.count()
+                buckets.delete()
+
+    def series(self, crash_report_id, since=None):
+        "Returns the [(bucket, resolution, count)] of a crash report, oldest first."
+        buckets = self.filter(crash_report=crash_report_id)
+        if since is not None:
+            buckets = buckets.filter(bucket__gte=since)
+        return list(buckets.order_by('bucket', '-resolution').values_list('bucket', 'resolution', 'count'))
+
+    def _add(self, counts, resolution, bucket, restrict=False):
+        # restrict looks up just the buckets of the crash reports in counts,
+        # rather than every crash report's bucket
+        existing = self.values_list('crash_report', 'id').filter(resolution=resolution, bucket=bucket)
+        if restrict:
+            existing = existing.filter(crash_report__in=list(counts))
+        existing = dict(existing)
+        by_count = defaultdict(list)
+        for crash_report_id, id in existing.items():
+            if crash_report_id in counts:
+                by_count[counts[crash_report_id]].append(id)
+        for count, ids in by_count.items():
+            self.filter(id__in=ids).update(count=F('count') + count)
+
+        missing = [crash_report_id for crash_report_id in counts if crash_report_id not in existing]
+        if not missing:
+            return
+        try:
+            sid = transaction.savepoint(using=self.db)
+            self.bulk_create([
+                self.model(crash_report_id=crash_report_id, resolution=resolution, bucket=bucket,
+                           count=counts[crash_report_id])
+                for crash_report_id in missing
+            ])
+            transaction.savepoint_commit(sid, using=self.db)
+        except IntegrityError:
+            # lost an insert race; the buckets exist now
+            transaction.savepoint_rollback(sid, using=self.db)
+            for crash_report_id in missing:
+                lookup = dict(crash_report=crash_report_id, resolution=resolution, bucket=bucket)
+                self.filter(**lookup).update(count=F('count') + counts[crash_report_id])
+
+class CrashHistory(models.Model):
+    """The number of occurrences of a crash report within an hour or a day.
+
+    Occurrences are recorded in hourly buckets as crashes are filed, and the
+    downsample_crash_history command merges old hourly buckets into daily
+    ones, so a report's trend is a few hundred rows at most.
+    """
+    crash_report = models.ForeignKey(CrashReport, related_name='history')
+    resolution = models.IntegerField(choices=HISTORY_RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    objects = CrashHistoryManager()
+
+    class Meta:
+        unique_together = (('crash_report', 'resolution', 'bucket'),)
+        verbose_name_plural = 'crash history'
+
+    def __unicode__(self):
+        return '{title} {resolution} at {bucket}: {count}'.format(
+            title=self.crash_report.title,
+            resolution=self.get_resolution_display().lower(),
+            bucket=self.bucket.isoformat(),
+            count=self.count,
+        )
+
+
+class SimilarityBand(models.Model):
+    """One locality-sensitive hash band of a crash report's MinHash signature.
+
+    Crash reports whose title or details share a band are probably the same
+    crash; see crashes.similarity. The application and user are copied from
+    the crash report so lookups stay within the index.
+    """
+    crash_report = models.ForeignKey(CrashReport, related_name='similarity_bands')
+    application = models.ForeignKey(Application, related_name='+')
+    user = models.ForeignKey(User, related_name='+')
+    band = models.SmallIntegerField()
+    bucket = models.IntegerField()
+
+    class Meta:
+        index_together = (('user', 'application', 'band', 'bucket'),)
+
+
+class ImportProgress(models.Model):
+    """How many rows of an import_crashes source are committed.
+
+    It is updated in the same transaction as each imported batch, so an
+    interrupted import resumes right after the last committed batch.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    rows = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'import progress'
+
+    def __unicode__(self):
+        return '{0}: {1} rows'.format(self.source, self.rows)
+
+
+class ApiKeyManager(models.Manager):
+    def for_user(self, user, reset=False):
+        "Returns a user's API key, making one if they have none or reset is set."
+        if reset:
+            self.filter(user=user).delete()
+        api_key, _ = self.get_or_create(user=user, defaults=dict(key=binascii.hexlify(os.urandom(20))))
+        return api_key
+
+    def user_for(self, key):
+        "Returns the active user an API key belongs to, or None."
+        api_key = self.filter(key=key, user__is_active=True).select_related('user')[:1]
+        return api_key[0].user if api_key else None
+
+
+class ApiKey(models.Model):
+    """The secret a program sends in an Authorization: Token <key> header to
+    file crashes as a user, without a session or CSRF token.
+
+    Make or reset one with `manage.py api_key <username>`.
+    """
+    user = models.OneToOneField(User, related_name='api_key')
+    key = models.CharField(max_length=40, unique=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ApiKeyManager()
+
+    def __unicode__(self):
+        return 'API key of {0}'.format(self.user)
+
+
+# connects the cache invalidation, search index and similarity index
+# receivers wherever the models are used
+import crashes.cache
+import crashes.search
+import crashes.similarity
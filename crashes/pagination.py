@@ -0,0 +1,85 @@
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+class InvalidCursor(ValueError):
+    pass
+
+def make_cursor(updated_at, id):
+    "Returns a cursor string of updated_at in epoch microseconds and id."
+    delta = updated_at - EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+    return '{0}-{1}'.format(microseconds, id)
+
+def encode_cursor(obj):
+    "Returns the cursor pointing at obj."
+    return make_cursor(obj.updated_at, obj.id)
+
+def decode_cursor(cursor):
+    "Returns the (updated_at, id) pair of a cursor made by encode_cursor."
+    try:
+        microseconds, id = [int(part) for part in cursor.split('-')]
+        # dates out of datetime's range overflow
+        return EPOCH + datetime.timedelta(microseconds=microseconds), id
+    except (ValueError, OverflowError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage(object):
+    "A page of objects, with the cursors of its neighbouring pages (or None)."
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def keyset_paginate(queryset, per_page, after=None, before=None):
+    """Returns a KeysetPage of queryset, ordered newest first by (updated_at, id).
+
+    Pages seek from the cursor through the (updated_at, id) index instead of
+    using OFFSET, so the cost of a page doesn't depend on how deep it is.
+    Pass the next_cursor of a page as after to get the page following it,
+    or the previous_cursor as before to get the page preceding it.
+    """
+    if before is not None:
+        updated_at, id = decode_cursor(before)
+        object_list = list(queryset.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=id)
+        ).order_by('updated_at', 'id')[:per_page + 1])
+        has_newer = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        object_list.reverse()
+        has_older = True
+    else:
+        if after is not None:
+            updated_at, id = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=id))
+        object_list = list(queryset.order_by('-updated_at', '-id')[:per_page + 1])
+        has_older = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        has_newer = after is not None
+
+    if not object_list:
+        return KeysetPage(object_list)
+    return KeysetPage(
+        object_list,
+        next_cursor=encode_cursor(object_list[-1]) if has_older else None,
+        previous_cursor=encode_cursor(object_list[0]) if has_newer else None,
+    )
@@ -0,0 +1,135 @@
+import operator
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import post_syncdb
+from django.dispatch import receiver
+
+from crashes.models import CrashReport
+
+
+SEARCH_TERM = re.compile(r'\w+', re.UNICODE)
+
+def search_terms(query):
+    "Returns the lowercased words of a search query, ignoring any punctuation or operators."
+    return [term.lower() for term in SEARCH_TERM.findall(query or u'')]
+
+
+class SearchBackend(object):
+    """Indexes the titles and details of crash reports for one database connection.
+
+    The index is maintained by the database itself (an expression index or
+    triggers), so every write path, including bulk inserts and F() updates,
+    keeps it current without touching Python.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        "Creates the index, and fills it with the existing crash reports."
+
+    def uninstall(self):
+        "Drops the index."
+
+    def filter(self, queryset, terms):
+        "Returns queryset narrowed to the crash reports matching every term."
+        raise NotImplementedError
+
+    def _execute(self, statements):
+        cursor = self.connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class PostgresSearchBackend(SearchBackend):
+    "Matches a tsvector of the title and details against a GIN expression index."
+    INDEX = 'crashes_crashreport_search'
+    DOCUMENT = "to_tsvector('english', coalesce({table}.title, '') || ' ' || coalesce({table}.details, ''))"
+
+    def install(self):
+        cursor = self.connection.cursor()
+        cursor.execute('SELECT 1 FROM pg_indexes WHERE indexname = %s', [self.INDEX])
+        if cursor.fetchone() is None:
+            cursor.execute('CREATE INDEX {0} ON crashes_crashreport USING gin ({1})'.format(
+                self.INDEX, self.DOCUMENT.format(table='crashes_crashreport')))
+
+    def uninstall(self):
+        self._execute(['DROP INDEX IF EXISTS {0}'.format(self.INDEX)])
+
+    def filter(self, queryset, terms):
+        return queryset.extra(
+            where=[self.DOCUMENT.format(table='"crashes_crashreport"') + " @@ plainto_tsquery('english', %s)"],
+            params=[u' '.join(terms)],
+        )
+
+
+class SQLiteSearchBackend(SearchBackend):
+    "Matches an FTS5 table of the title and details, kept in sync by triggers."
+    TABLE = 'crashes_crashreport_search'
+    INSTALL = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        "title, details, content='crashes_crashreport', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON crashes_crashreport BEGIN "
+        "INSERT INTO {table} (rowid, title, details) VALUES (new.id, new.title, new.details); END",
+        "CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON crashes_crashreport BEGIN "
+        "INSERT INTO {table} ({table}, rowid, title, details) VALUES ('delete', old.id, old.title, old.details); END",
+        # count bumps don't touch the title or details, so they leave the index alone
+        "CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF title, details ON crashes_crashreport BEGIN "
+        "INSERT INTO {table} ({table}, rowid, title, details) VALUES ('delete', old.id, old.title, old.details); "
+        "INSERT INTO {table} (rowid, title, details) VALUES (new.id, new.title, new.details); END",
+        "INSERT INTO {table} ({table}) VALUES ('rebuild')",
+    ]
+    UNINSTALL = [
+        'DROP TRIGGER IF EXISTS {table}_insert',
+        'DROP TRIGGER IF EXISTS {table}_delete',
+        'DROP TRIGGER IF EXISTS {table}_update',
+        'DROP TABLE IF EXISTS {table}',
+    ]
+
+    def install(self):
+        self._execute([statement.format(table=self.TABLE) for statement in self.INSTALL])
+
+    def uninstall(self):
+        self._execute([statement.format(table=self.TABLE) for statement in self.UNINSTALL])
+
+    def filter(self, queryset, terms):
+        # quoting every term keeps FTS5 query syntax in the input from being interpreted
+        return queryset.extra(
+            where=['"crashes_crashreport"."id" IN (SELECT rowid FROM {0} WHERE {0} MATCH %s)'.format(self.TABLE)],
+            params=[u' '.join(u'"{0}"'.format(term) for term in terms)],
+        )
+
+
+class ScanSearchBackend(SearchBackend):
+    "Scans the titles and details with LIKE, for databases without a full-text index here."
+    def filter(self, queryset, terms):
+        return queryset.filter(reduce(operator.and_, (
+            Q(title__icontains=term) | Q(details__icontains=term) for term in terms
+        )))
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+def get_search_backend(using='default'):
+    "Returns the SearchBackend for a database alias or connection."
+    connection = connections[using] if isinstance(using, basestring) else using
+    return SEARCH_BACKENDS.get(connection.vendor, ScanSearchBackend)(connection)
+
+def search_crash_reports(queryset, query):
+    "Returns queryset narrowed to the crash reports whose title or details contain every word of query."
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    return get_search_backend(queryset.db).filter(queryset, terms)
+
+
+@receiver(post_syncdb)
+def install_search_index(sender, created_models, db='default', **kwargs):
+    # South migrations install the index themselves; this covers plain syncdb,
+    # which is also how the test database is made
+    if CrashReport in created_models:
+        get_search_backend(db).install()
@@ -0,0 +1,194 @@
+"""Bulk generation of users, applications and crash reports for tests and benchmarks.
+
+Everything is inserted with bulk_create, a batch at a time, instead of
+saving factory instances one by one: users share one password hash, and
+crash reports share a handful of applications. The crash reports follow a
+long-tailed distribution like real ones: a few crashes are hit over and
+over and collect most of the counts, while most are only seen once.
+"""
+import bisect
+import random
+import zlib
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import reset_queries, transaction
+
+from crashes.factories import spell
+from crashes.models import Application, ApplicationStats, CrashReport, CRASH_KIND
+from crashes.similarity import index_crash_reports
+
+
+SEED_PASSWORD = 'test123'
+# how often each kind of crash is filed
+KIND_WEIGHTS = (
+    (CRASH_KIND['crash'], 60),
+    (CRASH_KIND['annoyance'], 25),
+    (CRASH_KIND['hang'], 12),
+    (CRASH_KIND['severe data loss'], 3),
+)
+KIND_SLOTS = [kind for kind, weight in KIND_WEIGHTS for _ in range(weight)]
+SYMPTOMS = (
+    'EXC_BAD_ACCESS',
+    'Unhandled exception',
+    'Assertion failed',
+    'Watchdog timeout',
+    'Out of memory',
+    'Deadlock',
+)
+VERSIONS = ('1.0', '1.1', '1.2', '2.0', '2.1')
+# each new version is filed against about twice as often as the one before
+VERSION_WEIGHTS = tuple((version, 2 ** i) for i, version in enumerate(VERSIONS))
+# the shape of the Pareto distribution crash counts are drawn from: the
+# lower it is, the more the most common crashes are filed again
+DUPLICATE_SHAPE = 1.2
+MAX_COUNT = 10000
+FRAME_NAMES = [spell(i) for i in range(8)]
+# the most values looked up with one IN (...); SQLite allows 999 parameters
+LOOKUP_SIZE = 500
+
+
+class Dataset(object):
+    "The users, applications and crash report ids of a seeded dataset."
+    def __init__(self, users, applications, crash_report_ids):
+        self.users = users
+        self.applications = applications
+        # {user id: [crash report id]}
+        self.crash_report_ids = crash_report_ids
+
+    def describe(self):
+        return dict(
+            users=len(self.users),
+            applications=len(self.applications),
+            crash_reports=sum(len(ids) for ids in self.crash_report_ids.values()),
+        )
+
+
+def weighted_choice(rng, weighted):
+    "Returns one of the values of a sequence of (value, weight), in proportion to its weight."
+    totals, total = [], 0
+    for _, weight in weighted:
+        total += weight
+        totals.append(total)
+    return weighted[bisect.bisect_right(totals, rng.random() * total)][0]
+
+def _in_batches(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def seed_users(count, prefix='seed', password=SEED_PASSWORD, password_hash=None):
+    """Inserts count users named prefix0, prefix1, ... and returns them.
+
+    They all share one password hash: password_hash if given, or password
+    hashed once with the first of the PASSWORD_HASHERS.
+    """
+    if password_hash is None:
+        password_hash = make_password(password)
+    usernames = ['{0}{1}'.format(prefix, n) for n in range(count)]
+    User.objects.bulk_create([User(username=username, password=password_hash) for username in usernames])
+    users = []
+    for chunk in _in_batches(usernames, LOOKUP_SIZE):
+        users.extend(User.objects.filter(username__in=chunk).order_by('id'))
+    return users
+
+def seed_applications(count, prefix='Seeded application'):
+    "Inserts count applications and returns them."
+    names = ['{0} {1}'.format(prefix, n) for n in range(count)]
+    Application.objects.bulk_create([Application(name=name, company='Company {0}'.format(n))
+                                     for n, name in enumerate(names)])
+    return list(Application.objects.filter(name__in=names).order_by('id'))
+
+def _crash_report(rng, user, application, signature, count):
+    # a signature is one crash: the same signature always makes the same title,
+    # kind and stack frames, whoever files it
+    symbol = 'frame_{0}'.format(spell(signature))
+    frames = '\n'.join(
+        '{0} {1} 0x{2:08x} {3}_{4} + {5}'.format(i, application.name, rng.getrandbits(32), symbol, frame, rng.randint(1, 999))
+        for i, frame in enumerate(FRAME_NAMES))
+    return CrashReport(
+        application=application,
+        user=user,
+        kind=KIND_SLOTS[zlib.crc32(symbol) % len(KIND_SLOTS)],
+        title='{0} in {1}'.format(SYMPTOMS[signature % len(SYMPTOMS)], symbol),
+        details='Thread 0 Crashed:\n{0}'.format(frames),
+        version=weighted_choice(rng, VERSION_WEIGHTS),
+        count=count,
+    )
+
+def _pareto_index(rng, size):
+    "Returns a random index below size, 0 being the most likely and the odds falling off like a power law."
+    return min(int(rng.paretovariate(DUPLICATE_SHAPE)), size) - 1
+
+def generate_crash_reports(rng, user, applications, count):
+    """Returns count distinct unsaved crash reports of a user, with their fingerprints.
+
+    The n-th report is the user's n-th most common crash signature, so every
+    user shares the same common crashes. Counts are drawn from a Pareto
+    distribution: most crashes were filed once or twice, a few thousands
+    of times.
+    """
+    counts = sorted((min(int(rng.paretovariate(DUPLICATE_SHAPE)), MAX_COUNT) for _ in range(count)), reverse=True)
+    crash_reports = []
+    for signature, crash_count in enumerate(counts):
+        application = applications[_pareto_index(rng, len(applications))]
+        crash_report = _crash_report(rng, user, application, signature, crash_count)
+        crash_report.fingerprint = crash_report.compute_fingerprint()
+        crash_reports.append(crash_report)
+    return crash_reports
+
+def generate_occurrence(rng, user, applications, signatures):
+    """Returns an unsaved crash report that files one of a user's first
+    signatures crash signatures again, as generate_crash_reports made them,
+    with new frame addresses.
+
+    Like the crashes themselves, the common signatures are the most likely.
+    """
+    application = applications[_pareto_index(rng, len(applications))]
+    return _crash_report(rng, user, application, _pareto_index(rng, signatures), 1)
+
+def seed_crash_reports(users, applications, reports_per_user, seed=0, batch_size=1000):
+    """Inserts reports_per_user crash reports for every user, against the given applications.
+
+    Returns {user id: [crash report id]}. The same seed makes the same crash
+    reports. ApplicationStats are rebuilt afterwards, but the similarity index
+    isn't; see index_seeded_crash_reports.
+    """
+    rng = random.Random(seed)
+    crash_report_ids = dict((user.id, []) for user in users)
+    users_per_batch = max(1, batch_size // max(reports_per_user, 1))
+    for batch in _in_batches(users, users_per_batch):
+        crash_reports = []
+        for user in batch:
+            crash_reports.extend(generate_crash_reports(rng, user, applications, reports_per_user))
+        with transaction.commit_on_success():
+            CrashReport.objects.bulk_create(crash_reports)
+        for chunk in _in_batches(batch, LOOKUP_SIZE):
+            for user_id, crash_report_id in CrashReport.objects.filter(user__in=chunk).values_list('user', 'id'):
+                crash_report_ids[user_id].append(crash_report_id)
+        # DEBUG keeps every query otherwise
+        reset_queries()
+    ApplicationStats.objects.rebuild()
+    return crash_report_ids
+
+def index_seeded_crash_reports(crash_report_ids):
+    "Adds the similarity bands of seeded crash reports, given as returned by seed_crash_reports."
+    ids = sorted(id for ids in crash_report_ids.values() for id in ids)
+    crash_reports = CrashReport.objects.only('id', 'application', 'user', 'title', 'details')
+    for batch in _in_batches(ids, LOOKUP_SIZE):
+        with transaction.commit_on_success():
+            index_crash_reports(list(crash_reports.filter(id__in=batch)), replace=False)
+
+def seed_dataset(users, applications, reports_per_user, seed=0, prefix='seed', password=SEED_PASSWORD,
+                 password_hash=None, similarity_index=False, batch_size=1000):
+    """Inserts users, applications and reports_per_user crash reports for each user. Returns a Dataset.
+
+    The similarity index is only filled in if similarity_index is True, as
+    it takes longer than inserting the crash reports themselves.
+    """
+    user_list = seed_users(users, prefix=prefix, password=password, password_hash=password_hash)
+    application_list = seed_applications(applications, prefix='{0} application'.format(prefix))
+    crash_report_ids = seed_crash_reports(user_list, application_list, reports_per_user, seed=seed,
+                                          batch_size=batch_size)
+    if similarity_index:
+        index_seeded_crash_reports(crash_report_ids)
+    return Dataset(user_list, application_list, crash_report_ids)
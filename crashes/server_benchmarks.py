@@ -0,0 +1,222 @@
+"""Throughput and memory benchmarks of gunicorn worker classes serving the crash views.
+
+Unlike crashes.benchmarks, which calls the views in process, this starts
+gunicorn with crashula/gunicorn_config.py and loads it over HTTP from
+client threads, then reads the memory of its worker processes from /proc,
+so it only runs on Linux.
+"""
+import Cookie
+import httplib
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib
+
+from crashes.benchmarks import summarize
+from crashes.seeding import SEED_PASSWORD
+
+
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONFIG = os.path.join(PROJECT_PATH, 'crashula', 'gunicorn_config.py')
+CRASH_LINK = re.compile(r'href="(/u/[\w-]+/\d+/)"')
+CSRF_INPUT = re.compile(r"name='csrfmiddlewaretoken' value='([^']+)'")
+
+
+def manage(env, *args):
+    "Runs a manage.py command of the project in a subprocess with the given environment."
+    subprocess.check_call([sys.executable, os.path.join(PROJECT_PATH, 'manage.py')] + list(args),
+                          env=env, cwd=PROJECT_PATH)
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class Server(object):
+    "A gunicorn master process started with crashula/gunicorn_config.py."
+    def __init__(self, env, worker_class, workers, port):
+        self.port = port
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+             '-c', GUNICORN_CONFIG, 'crashula.wsgi:application'],
+            env=dict(env, CRASHULA_WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(workers),
+                     CRASHULA_BIND='127.0.0.1:{0}'.format(port), CRASHULA_MAX_REQUESTS='0'),
+            cwd=PROJECT_PATH,
+        )
+
+    def request(self, method, path, body=None, headers=None):
+        "Returns the (status, headers, body) of one request, on a connection of its own."
+        connection = httplib.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            connection.request(method, path, body, headers or {})
+            response = connection.getresponse()
+            return response.status, response.msg, response.read()
+        finally:
+            connection.close()
+
+    def wait_until_ready(self, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited with {0}'.format(self.process.returncode))
+            try:
+                if self.request('GET', '/login/')[0] == 200:
+                    return
+            except (socket.error, httplib.HTTPException):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError('gunicorn did not answer within {0} seconds'.format(timeout))
+
+    def log_in(self, username, password=SEED_PASSWORD):
+        "Returns the Cookie header of a session logged in as username."
+        status, headers, body = self.request('GET', '/login/')
+        cookies = Cookie.SimpleCookie(headers.getheader('Set-Cookie'))
+        token = CSRF_INPUT.search(body).group(1)
+        status, headers, body = self.request(
+            'POST', '/login/',
+            urllib.urlencode(dict(username=username, password=password, csrfmiddlewaretoken=token)),
+            {'Content-Type': 'application/x-www-form-urlencoded',
+             'Cookie': 'csrftoken={0}'.format(cookies['csrftoken'].value)})
+        if status != 302:
+            raise RuntimeError('Logging in as {0} answered {1}'.format(username, status))
+        cookies.load(headers.getheader('Set-Cookie'))
+        return '; '.join('{0}={1}'.format(name, morsel.value) for name, morsel in cookies.items())
+
+    def worker_pids(self):
+        pids = []
+        for pid in os.listdir('/proc'):
+            if pid.isdigit():
+                try:
+                    with open('/proc/{0}/stat'.format(pid)) as f:
+                        # the parent pid follows the parenthesized command name
+                        if int(f.read().rsplit(')', 1)[1].split()[1]) == self.process.pid:
+                            pids.append(int(pid))
+                except (IOError, IndexError, ValueError):
+                    pass
+        return pids
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            self.process.wait()
+
+
+def memory_kb(pid):
+    """Returns the (RSS, PSS) of a process in kilobytes.
+
+    PSS splits memory shared copy-on-write between the processes sharing it,
+    so unlike RSS it shows what preloading saves.
+    """
+    rss = pss = 0
+    with open('/proc/{0}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+    with open('/proc/{0}/smaps'.format(pid)) as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                pss += int(line.split()[1])
+    return rss, pss
+
+
+def slow_client(port, stop):
+    "Sends the headers of one request a line a second until stop is set, like a client on a bad network."
+    try:
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall('GET /login/ HTTP/1.1\r\nHost: 127.0.0.1\r\n')
+        while not stop.wait(1):
+            sock.sendall('X-Slow: 1\r\n')
+        sock.close()
+    except socket.error:
+        pass
+
+def load(server, sessions, paths, concurrency, duration, rng):
+    """Requests random paths of random sessions from concurrency threads for duration seconds.
+
+    sessions is {username: Cookie header} and paths {username: [path]}.
+    Returns the latencies in milliseconds of the requests answered 200, and
+    the number of other answers and errors.
+    """
+    deadline = time.time() + duration
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    usernames = sorted(sessions)
+    seeds = [rng.random() for _ in range(concurrency)]
+
+    def client(seed):
+        rng = random.Random(seed)
+        while time.time() < deadline:
+            username = rng.choice(usernames)
+            started = time.time()
+            try:
+                status, _, _ = server.request('GET', rng.choice(paths[username]), headers={'Cookie': sessions[username]})
+            except (socket.error, httplib.HTTPException):
+                status = None
+            elapsed = (time.time() - started) * 1000
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in seeds]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def benchmark_worker_class(env, worker_class, workers, usernames, concurrency, duration, warmup,
+                           slow_clients=0, seed=0):
+    """Serves the seeded database with gunicorn and a worker class, and loads it.
+
+    Returns the throughput, latency and per-worker memory as a JSON-ready dict.
+    """
+    rng = random.Random(seed)
+    server = Server(env, worker_class, workers, free_port())
+    stop_slow_clients = threading.Event()
+    try:
+        server.wait_until_ready()
+        sessions = dict((username, server.log_in(username)) for username in usernames)
+        paths = {}
+        for username, cookie in sessions.items():
+            listing = '/u/{0}/'.format(username)
+            body = server.request('GET', listing, headers={'Cookie': cookie})[2]
+            paths[username] = [listing] + CRASH_LINK.findall(body)
+        load(server, sessions, paths, concurrency, warmup, rng)
+
+        slow = [threading.Thread(target=slow_client, args=(server.port, stop_slow_clients))
+                for _ in range(slow_clients)]
+        for thread in slow:
+            thread.start()
+        latencies, errors = load(server, sessions, paths, concurrency, duration, rng)
+        stop_slow_clients.set()
+        for thread in slow:
+            thread.join()
+
+        memory = [memory_kb(pid) for pid in server.worker_pids()]
+        master_rss, master_pss = memory_kb(server.process.pid)
+    finally:
+        stop_slow_clients.set()
+        server.stop()
+    return dict(
+        workers=workers,
+        requests=len(latencies),
+        errors=errors,
+        requests_per_second=len(latencies) / float(duration),
+        latency_ms=summarize(latencies) if latencies else None,
+        worker_rss_kb=summarize([rss for rss, _ in memory]) if memory else None,
+        worker_pss_kb=summarize([pss for _, pss in memory]) if memory else None,
+        master_rss_kb=master_rss,
+        master_pss_kb=master_pss,
+    )
@@ -0,0 +1,109 @@
+"""Suggests existing crash reports that are probably the same crash as a new one.
+
+Titles and details are reduced to MinHash signatures of their character
+shingles, and each signature is cut into bands stored as SimilarityBand
+rows. Two texts share a band with a probability that grows steeply with
+their Jaccard similarity, so looking up the bands of a new crash finds the
+likely duplicates through the (user, application, band, bucket) index,
+without reading any crash report rows.
+"""
+import operator
+import random
+import zlib
+
+from django.db.models import Count, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from crashes.models import (CrashReport, SimilarityBand, crash_reports_created,
+                            normalize_for_fingerprint)
+
+
+SHINGLE_SIZE = 3
+# long details are mostly stack frames; their start says enough about the crash
+TEXT_LENGTH = 1000
+SIGNATURE_SIZE = 32
+BAND_ROWS = 2
+BANDS = SIGNATURE_SIZE // BAND_ROWS
+# hash values and coefficients stay below 2 ** 31, so the products fit a machine int
+PRIME = 2 ** 31 - 1
+_random = random.Random(1307)
+PERMUTATIONS = [(_random.randrange(1, PRIME), _random.randrange(PRIME)) for _ in range(SIGNATURE_SIZE)]
+# the fraction of bands a crash report must share to be suggested; a band is
+# shared with a probability of similarity ** BAND_ROWS, so this is about a
+# Jaccard similarity of 0.45
+MIN_SHARED_BANDS = 0.2
+
+
+def shingles(text):
+    "Returns the set of hashed character shingles of text, normalized like fingerprints."
+    text = normalize_for_fingerprint(text)[:TEXT_LENGTH]
+    if len(text) <= SHINGLE_SIZE:
+        pieces = [text] if text else []
+    else:
+        pieces = [text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)]
+    return set(zlib.crc32(piece.encode('utf-8')) & PRIME for piece in pieces)
+
+def minhash(hashes):
+    "Returns the SIGNATURE_SIZE long MinHash signature of a non-empty set of shingle hashes."
+    return [min((a * x + b) % PRIME for x in hashes) for a, b in PERMUTATIONS]
+
+def signature_bands(title, details):
+    """Returns the [(band, bucket)] of a crash's title and details.
+
+    Title bands are numbered 0 to BANDS - 1 and details bands BANDS to
+    2 * BANDS - 1, so the two are only ever matched against their own kind.
+    """
+    bands = []
+    for offset, text in enumerate((title, details)):
+        hashes = shingles(text)
+        if not hashes:
+            continue
+        signature = minhash(hashes)
+        for band in range(BANDS):
+            rows = signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]
+            bucket = zlib.crc32(','.join(str(value) for value in rows)) & PRIME
+            bands.append((offset * BANDS + band, bucket))
+    return bands
+
+def index_crash_reports(crash_reports, replace=True):
+    "Stores the bands of saved crash reports, replacing their old ones unless replace is False."
+    if replace:
+        SimilarityBand.objects.filter(crash_report__in=[c.id for c in crash_reports]).delete()
+    SimilarityBand.objects.bulk_create([
+        SimilarityBand(crash_report_id=crash_report.id, application_id=crash_report.application_id,
+                       user_id=crash_report.user_id, band=band, bucket=bucket)
+        for crash_report in crash_reports
+        for band, bucket in signature_bands(crash_report.title, crash_report.details)
+    ])
+
+def similar_crash_reports(user, application_id, title, details='', limit=5):
+    """Returns up to limit [(crash_report, similarity)] of the user's reports for an application,
+    most similar first.
+
+    similarity is the fraction of the crash's bands the report shares, from
+    MIN_SHARED_BANDS to 1. The bands are matched with one indexed query, and
+    only the suggested crash reports are loaded.
+    """
+    bands = signature_bands(title, details)
+    if not bands:
+        return []
+    matches = SimilarityBand.objects.filter(
+        reduce(operator.or_, (Q(band=band, bucket=bucket) for band, bucket in bands)),
+        application=application_id,
+        user=user,
+    ).values_list('crash_report').annotate(matches=Count('id')).filter(
+        matches__gte=max(1, int(len(bands) * MIN_SHARED_BANDS)),
+    ).order_by('-matches', '-crash_report')[:limit]
+    matches = list(matches)
+    crash_reports = CrashReport.objects.only('id', 'title', 'count').in_bulk([id for id, _ in matches])
+    return [(crash_reports[id], float(count) / len(bands)) for id, count in matches if id in crash_reports]
+
+
+@receiver(post_save, sender=CrashReport)
+def index_saved_crash_report(sender, instance, created, **kwargs):
+    index_crash_reports([instance], replace=not created)
+
+@receiver(crash_reports_created, sender=CrashReport)
+def index_created_crash_reports(sender, crash_reports, **kwargs):
+    index_crash_reports(crash_reports, replace=False)
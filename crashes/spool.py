@@ -0,0 +1,172 @@
+import json
+import logging
+import sqlite3
+from contextlib import closing
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+
+from crashes.models import Application, CrashReport
+
+
+logger = logging.getLogger(__name__)
+
+SPOOL_FIELDS = ('title', 'kind', 'details', 'version', 'count')
+
+class CrashSpool(object):
+    """A durable, append-only queue of validated crashes in a local SQLite file.
+
+    Web workers append to it instead of writing to the database, and the
+    drain_crash_spool command moves the crashes into CrashReport in batches.
+    Entries are only removed after they have been committed, so nothing is
+    lost while the drainer is down (a drainer that dies between the two may
+    count a batch twice). Entries that can't be stored are moved to a
+    dead_letter table in the same file, so they don't hold up the rest.
+    """
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS spool ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, crash TEXT NOT NULL)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS dead_letter ('
+                'id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, crash TEXT NOT NULL, error TEXT NOT NULL, '
+                "failed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA synchronous=FULL')
+        return connection
+
+    def append(self, user_id, crashes):
+        "Durably queues a list of crashes (CrashForm cleaned_data) filed by a user."
+        rows = [(user_id, json.dumps(self._serialize(crash))) for crash in crashes]
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.executemany('INSERT INTO spool (user_id, crash) VALUES (?, ?)', rows)
+
+    def peek(self, limit):
+        "Returns up to limit of the oldest (id, user_id, crash dict) entries, leaving them queued."
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT id, user_id, crash FROM spool ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [(id, user_id, json.loads(crash)) for id, user_id, crash in rows]
+
+    def remove(self, ids):
+        "Removes entries returned by peek once they are safely stored elsewhere."
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.executemany('DELETE FROM spool WHERE id = ?', [(id,) for id in ids])
+
+    def bury(self, failures):
+        "Moves entries returned by peek to the dead letters, given a list of their (id, error)."
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO dead_letter (id, user_id, crash, error) '
+                    'SELECT id, user_id, crash, ? FROM spool WHERE id = ?',
+                    [(error, id) for id, error in failures])
+                connection.executemany('DELETE FROM spool WHERE id = ?', [(id,) for id, _ in failures])
+
+    def dead_letters(self):
+        "Returns the (id, user_id, crash dict, error) of the entries that couldn't be stored, oldest first."
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT id, user_id, crash, error FROM dead_letter ORDER BY id').fetchall()
+        return [(id, user_id, json.loads(crash), error) for id, user_id, crash, error in rows]
+
+    def requeue_dead_letters(self):
+        "Queues the dead letters again, as after fixing what stopped them from being stored. Returns how many."
+        with closing(self._connect()) as connection:
+            with connection:
+                requeued = connection.execute(
+                    'INSERT INTO spool (user_id, crash) SELECT user_id, crash FROM dead_letter ORDER BY id').rowcount
+                connection.execute('DELETE FROM dead_letter')
+        return requeued
+
+    def __len__(self):
+        with closing(self._connect()) as connection:
+            return connection.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+
+    def _serialize(self, crash):
+        data = dict((name, crash[name]) for name in SPOOL_FIELDS)
+        data['application'] = crash['application'].pk
+        return data
+
+
+_spools = {}
+
+def get_spool():
+    "Returns the CrashSpool at settings.CRASH_SPOOL_PATH."
+    path = settings.CRASH_SPOOL_PATH
+    if path not in _spools:
+        _spools[path] = CrashSpool(path)
+    return _spools[path]
+
+def ingest_is_spooled():
+    return settings.CRASH_INGEST_MODE == 'spool'
+
+def _crash_reports(entries):
+    """Returns the [(id, CrashReport)] of the spooled entries that can be stored,
+    and the [(id, error)] of those that can't.
+
+    Applications are looked up in the database rather than application_cache:
+    a drainer runs for a long time, and deletes in the web workers don't reach
+    its cache.
+    """
+    applications = Application.objects.in_bulk(
+        set(crash.get('application') for _, _, crash in entries if isinstance(crash, dict)))
+    user_ids = set(User.objects.filter(id__in=set(user_id for _, user_id, _ in entries)).values_list('id', flat=True))
+    crash_reports, failures = [], []
+    for id, user_id, crash in entries:
+        try:
+            if user_id not in user_ids or crash['application'] not in applications:
+                raise ValidationError('its user or application no longer exists')
+            crash_report = CrashReport(
+                user_id=user_id,
+                application=applications[crash['application']],
+                **dict((name, crash[name]) for name in SPOOL_FIELDS)
+            )
+            crash_report.clean_fields(exclude=['user', 'application'])
+        except (KeyError, TypeError, ValueError, ValidationError) as e:
+            failures.append((id, 'Invalid: {0!r}'.format(e)))
+        else:
+            crash_reports.append((id, crash_report))
+    return crash_reports, failures
+
+def drain_spool(spool, batch_size=500):
+    """Moves spooled crashes into CrashReport, oldest first, batch_size at a time.
+
+    Crashes that are invalid, whose user or application was deleted while
+    they were queued, or that the database refuses are moved to the spool's
+    dead letters, so they can't block the queue. Returns the number of
+    crashes drained.
+    """
+    drained = 0
+    while True:
+        entries = spool.peek(batch_size)
+        if not entries:
+            return drained
+        crash_reports, failures = _crash_reports(entries)
+        try:
+            CrashReport.objects.bulk_increment_or_create([crash_report for _, crash_report in crash_reports],
+                                                         batch_size=batch_size)
+        except DatabaseError:
+            logger.exception('Storing a batch of spooled crashes failed; storing them one at a time')
+            stored = []
+            for id, crash_report in crash_reports:
+                try:
+                    CrashReport.objects.bulk_increment_or_create([crash_report])
+                except DatabaseError as e:
+                    failures.append((id, 'Not stored: {0!r}'.format(e)))
+                else:
+                    stored.append((id, crash_report))
+            crash_reports = stored
+        if failures:
+            for id, error in failures:
+                logger.warning('Moving spooled crash %s to the dead letters: %s', id, error)
+            spool.bury(failures)
+        spool.remove([id for id, _ in crash_reports])
+        drained += len(crash_reports)
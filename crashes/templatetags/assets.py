@@ -0,0 +1,23 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.html import format_html_join
+
+register = template.Library()
+
+TAGS = {
+    '.css': u'<link rel="stylesheet" type="text/css" href="{0}" />',
+    '.js': u'<script src="{0}"></script>',
+}
+
+
+@register.simple_tag
+def bundle(name):
+    """Links a bundle of STATIC_BUNDLES, like {% bundle 'css/site.css' %}.
+
+    With DEBUG it links each of the bundle's files, as they are in the
+    source tree; otherwise the one file collectstatic built of them.
+    """
+    paths = settings.STATIC_BUNDLES[name] if settings.DEBUG else [name]
+    tag = TAGS[name[name.rindex('.'):]]
+    return format_html_join(u'\n', tag, ((staticfiles_storage.url(path),) for path in paths))
@@ -1,10 +1,13 @@
 import pytest
 import selenium.webdriver
 
+from django.core.cache import cache
 from django.test.client import Client
 from django.contrib.auth.models import AnonymousUser
 
 from crashes import factories as f
+from crashes.cache import application_cache
+from crashes.templatetags.fragments import fragment_cache
 
 @pytest.fixture(scope='session')
 def webdriver(request, live_server):
@@ -21,6 +24,13 @@ def browser(webdriver):
     webdriver.delete_all_cookies()
     return webdriver
 
+@pytest.fixture(autouse=True)
+def clear_caches(request):
+    "Empties the caches, which would otherwise outlive each test's database."
+    application_cache.clear()
+    cache.clear()
+    fragment_cache.clear()
+
 @pytest.fixture()
 def application(db):
     "Returns an application"
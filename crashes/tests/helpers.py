@@ -1,4 +1,8 @@
-from django.db import models
+from contextlib import contextmanager
+
+from django.db import models, connection
+from django.core.signals import request_started
+from django.db import reset_queries
 
 def form_fields(form_class):
     "Returns a dict of all fields for a Django Form class, mapped by name."
@@ -54,6 +58,37 @@ class Fields(object):
     def __len__(self):
         return len(self.__get_field(self.__cls))
 
+class QueryCount(object):
+    "The queries executed inside a count_queries() block."
+    def __init__(self):
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def __repr__(self):
+        return 'QueryCount({0!r})'.format([q['sql'] for q in self.queries])
+
+@contextmanager
+def count_queries():
+    """Records the queries executed on the default connection inside the block.
+
+        >>> with count_queries() as queries:
+        ...     client.get('/')
+        >>> assert len(queries) == 2
+    """
+    result = QueryCount()
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    request_started.disconnect(reset_queries)
+    start = len(connection.queries)
+    try:
+        yield result
+    finally:
+        result.queries = connection.queries[start:]
+        connection.use_debug_cursor = old_debug_cursor
+        request_started.connect(reset_queries)
+
 ### TODO: move into DB helpers
 
 class FieldBase(object):
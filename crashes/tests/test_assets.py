@@ -0,0 +1,128 @@
+import gzip
+import os
+from StringIO import StringIO
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.files.storage import FileSystemStorage
+from django.template import Context, Template
+
+from crashula.assets import (BundlingStaticFilesStorage, StaticFilesApplication, accepted_encodings,
+                             minify_css, rebase_css_urls)
+
+
+def test_minify_css():
+    css = '/* the page */\nbody  {\n    color: red;\n    margin: 0 auto;\n}\n\na :hover, b > i { x: y }\n'
+    assert minify_css(css) == 'body{color:red;margin:0 auto}a :hover,b>i{x:y}'
+
+def test_rebase_css_urls():
+    css = 'a { background: url("../img/a.png"); } b { background: url(/img/b.png) url(data:x) }'
+    assert rebase_css_urls(css, 'vendor/css/x.css', 'css/site.css') == (
+        'a { background: url("../vendor/img/a.png"); } b { background: url(/img/b.png) url(data:x) }')
+    assert rebase_css_urls(css, 'css/x.css', 'css/site.css') == css
+
+def test_accepted_encodings():
+    assert accepted_encodings('gzip, deflate, br;q=0.5, identity;q=0') == set(['gzip', 'deflate', 'br'])
+    assert accepted_encodings('') == set()
+
+
+@pytest.fixture
+def collected(settings, tmpdir):
+    "Post-processes crashula/static into a temporary STATIC_ROOT like collectstatic does."
+    settings.STATIC_BUNDLES = {
+        'css/site.css': ('css/bootstrap.css', 'css/application.css'),
+        'js/site.js': ('js/bootstrap.js',),
+    }
+    source = FileSystemStorage(location=django_settings.STATICFILES_DIRS[0])
+    storage = BundlingStaticFilesStorage(location=str(tmpdir), base_url='/static/')
+    paths = {}
+    for directory in ('css', 'img', 'js'):
+        for name in source.listdir(directory)[1]:
+            path = directory + '/' + name
+            paths[path] = (source, path)
+            with source.open(path) as f:
+                storage.save(path, f)
+    processed = dict((name, hashed_name) for name, hashed_name, _ in storage.post_process(paths))
+    return storage, processed
+
+def test_bundles_are_minified_and_hashed(collected):
+    storage, processed = collected
+    with storage.open(processed['css/site.css']) as f:
+        css = f.read()
+    assert css.startswith('/*!\n * Bootstrap')
+    assert css.rstrip().endswith('.footer{color:#d9d9d9;font-size:16px;margin-top:1em;text-align:center}')
+    assert 'url("../img/glyphicons-halflings.2516339970d7.png")' in css
+    with storage.open(processed['js/site.js']) as f:
+        with storage.open('js/bootstrap.min.js') as minified:
+            assert f.read().strip() == minified.read().strip()
+
+def test_hashed_text_files_are_precompressed(collected):
+    storage, processed = collected
+    hashed_name = processed['css/site.css']
+    with storage.open(hashed_name + '.gz') as f:
+        with storage.open(hashed_name) as original:
+            assert gzip.GzipFile(fileobj=StringIO(f.read())).read() == original.read()
+    assert not storage.exists(processed['img/glyphicons-halflings.png'] + '.gz')
+
+def render(text):
+    return Template('{% load assets %}' + text).render(Context())
+
+def test_bundle_tag_links_the_collected_bundle(settings):
+    settings.DEBUG = False
+    assert render("{% bundle 'js/site.js' %}") == '<script src="/static/js/site.js"></script>'
+
+def test_bundle_tag_links_each_file_with_debug(settings):
+    settings.DEBUG = True
+    assert render("{% bundle 'css/site.css' %}").count('<link rel="stylesheet"') == len(settings.STATIC_BUNDLES['css/site.css'])
+
+
+def not_found(environ, start_response):
+    start_response('404 Not Found', [])
+    return ['not found']
+
+@pytest.fixture
+def static_root(tmpdir):
+    tmpdir.mkdir('css').join('site.0123456789ab.css').write('body{}' * 100)
+    with gzip.open(str(tmpdir.join('css', 'site.0123456789ab.css.gz')), 'wb') as f:
+        f.write('body{}' * 100)
+    tmpdir.join('css', 'site.css').write('body{}')
+    return tmpdir
+
+def get(application, path, **headers):
+    response = {}
+    def start_response(status, response_headers):
+        response.update(status=status, headers=dict(response_headers))
+    environ = dict(REQUEST_METHOD='GET', PATH_INFO=path, **headers)
+    response['body'] = ''.join(application(environ, start_response))
+    return response
+
+def test_static_files_application(static_root):
+    application = StaticFilesApplication(not_found, str(static_root), '/static/')
+    response = get(application, '/static/css/site.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+    assert response['status'] == '200 OK'
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert response['headers']['Vary'] == 'Accept-Encoding'
+    assert 'immutable' in response['headers']['Cache-Control']
+    assert response['headers']['Content-Type'] == 'text/css; charset=utf-8'
+    assert int(response['headers']['Content-Length']) == len(response['body']) < 600
+
+    response = get(application, '/static/css/site.0123456789ab.css')
+    assert 'Content-Encoding' not in response['headers']
+    assert response['body'] == 'body{}' * 100
+
+    response = get(application, '/static/css/site.css')
+    assert response['headers']['Cache-Control'] == 'public, max-age=3600'
+    assert 'Vary' not in response['headers']
+
+def test_static_files_application_revalidates(static_root):
+    application = StaticFilesApplication(not_found, str(static_root), '/static/')
+    etag = get(application, '/static/css/site.css')['headers']['ETag']
+    response = get(application, '/static/css/site.css', HTTP_IF_NONE_MATCH=etag)
+    assert response['status'] == '304 Not Modified'
+    assert response['body'] == ''
+
+@pytest.mark.parametrize('path', ['/css/site.css', '/static/css/missing.css', '/static/../static/css/site.css',
+                                  '/static//css/site.css', '/static/css/'])
+def test_static_files_application_passes_other_requests_on(static_root, path):
+    application = StaticFilesApplication(not_found, str(static_root), '/static/')
+    assert get(application, path)['status'] == '404 Not Found'
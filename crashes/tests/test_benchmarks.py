@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from crashes.benchmarks import SCENARIOS, PERCENTILES, percentile, summarize, run_benchmarks
+from crashes.seeding import seed_dataset
+from crashes.tests.fixtures import *
+
+
+def test_percentile():
+    values = range(1, 101)
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 99) == 7
+
+def test_summarize():
+    summary = summarize([3, 1, 2])
+    assert summary['min'] == 1
+    assert summary['max'] == 3
+    assert summary['mean'] == 2
+    assert set('p{0}'.format(p) for p in PERCENTILES) < set(summary)
+
+@pytest.mark.django_db
+def test_run_benchmarks():
+    dataset = seed_dataset(users=2, applications=2, reports_per_user=5)
+    results = run_benchmarks(dataset, iterations=3, warmup=1)
+    json.dumps(results)
+    assert set(results['scenarios']) == set(name for name, _, _ in SCENARIOS)
+    for summary in results['scenarios'].values():
+        assert summary['iterations'] == 3
+        assert summary['queries']['min'] > 0
+        assert summary['latency_ms']['p99'] >= summary['latency_ms']['p50']
+
+@pytest.mark.django_db
+def test_run_benchmarks_of_some_scenarios():
+    dataset = seed_dataset(users=1, applications=1, reports_per_user=2)
+    results = run_benchmarks(dataset, scenarios=['crash_by_user'], iterations=2, warmup=0)
+    assert list(results['scenarios']) == ['crash_by_user']
@@ -0,0 +1,53 @@
+import pytest
+
+from crashes import factories as f
+from crashes.cache import ApplicationCache, application_cache
+from crashes.tests.fixtures import *
+from crashes.tests.helpers import count_queries
+
+
+def test_application_cache_loads_missing_applications_once(application):
+    cache = ApplicationCache()
+    with count_queries() as queries:
+        assert cache[application.id] == application
+        assert cache[application.id] == application
+    assert len(queries) == 1
+
+def test_application_cache_raises_key_error_for_unknown_applications(db):
+    with pytest.raises(KeyError):
+        ApplicationCache()[1234]
+
+def test_application_cache_gets_many_in_one_query(db):
+    applications = f.ApplicationFactory.create_batch(3)
+    cache = ApplicationCache()
+    cache[applications[0].id]
+    with count_queries() as queries:
+        found = cache.get_many([a.id for a in applications] + [1234])
+    assert found == dict((a.id, a) for a in applications)
+    assert len(queries) == 1
+
+def test_application_cache_evicts_the_least_recently_used(db):
+    applications = f.ApplicationFactory.create_batch(3)
+    cache = ApplicationCache(max_size=2)
+    cache[applications[0].id]
+    cache[applications[1].id]
+    cache[applications[0].id]
+    cache[applications[2].id]
+    assert len(cache) == 2
+    with count_queries() as queries:
+        cache[applications[0].id]
+        cache[applications[2].id]
+    assert len(queries) == 0
+
+def test_application_cache_is_invalidated_on_save(application):
+    application_cache[application.id]
+    application.name = 'Renamed'
+    application.save()
+    assert application_cache[application.id].name == 'Renamed'
+
+def test_application_cache_is_invalidated_on_delete(application):
+    application_id = application.id
+    application_cache[application_id]
+    application.delete()
+    with pytest.raises(KeyError):
+        application_cache[application_id]
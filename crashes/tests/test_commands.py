@@ -0,0 +1,176 @@
+import csv
+import datetime
+import gzip
+import json
+import sys
+from StringIO import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from crashes import factories as f
+from crashes.dumps import CrashImporter
+from crashes.management.commands.import_crashes import file_source
+from crashes.models import (CRASH_KIND, CrashReport, ApplicationStats, CrashHistory, SimilarityBand, HISTORY_RESOLUTION,
+                            ImportProgress)
+from crashes.tests.fixtures import *
+
+
+def test_rebuild_application_stats_check_fails_on_drift(crash_reports):
+    with pytest.raises(CommandError):
+        call_command('rebuild_application_stats', check=True)
+
+def test_rebuild_application_stats(crash_reports):
+    call_command('rebuild_application_stats', verbosity=0)
+    call_command('rebuild_application_stats', check=True)
+    assert ApplicationStats.objects.drift() == []
+
+def test_downsample_crash_history(crash_report):
+    old = timezone.now() - datetime.timedelta(days=10)
+    CrashHistory.objects.record({crash_report.id: 2}, old)
+    CrashHistory.objects.record({crash_report.id: 1}, timezone.now())
+    call_command('downsample_crash_history', verbosity=0)
+    assert sorted(resolution for _, resolution, _ in CrashHistory.objects.series(crash_report.id)) == [
+        HISTORY_RESOLUTION['hourly'], HISTORY_RESOLUTION['daily']]
+
+def test_rebuild_similarity_index(crash_reports):
+    SimilarityBand.objects.all().delete()
+    call_command('rebuild_similarity_index', batch_size=3, verbosity=0)
+    assert SimilarityBand.objects.values('crash_report').distinct().count() == len(crash_reports)
+
+def export(**options):
+    out = StringIO()
+    call_command('export_crashes', stdout=out, **options)
+    return out.getvalue()
+
+def test_export_crashes_as_csv(crash_report):
+    rows = list(csv.DictReader(StringIO(export())))
+    assert len(rows) == 1
+    assert rows[0]['id'] == str(crash_report.id)
+    assert rows[0]['title'] == crash_report.title
+    assert rows[0]['application_name'] == crash_report.application.name
+    assert rows[0]['username'] == crash_report.user.username
+    assert rows[0]['kind_name'] == 'Crash'
+
+def test_export_crashes_as_gzipped_ndjson(tmpdir, crash_reports):
+    path = str(tmpdir.join('crashes.ndjson.gz'))
+    call_command('export_crashes', format='ndjson', gzip=True, output=path, batch_size=3)
+    rows = [json.loads(line) for line in gzip.open(path).read().splitlines()]
+    assert [row['id'] for row in rows] == sorted(c.id for c in crash_reports)
+
+def test_export_crashes_gzipped_to_stdout(crash_reports):
+    rows = [json.loads(line) for line in gzip.GzipFile(fileobj=StringIO(export(format='ndjson', gzip=True))).read().splitlines()]
+    assert len(rows) == len(crash_reports)
+
+def test_export_crashes_filters(user, application, crash_reports):
+    crash_report = f.CrashReportFactory.create(kind=CRASH_KIND['hang'])
+    def ids(**options):
+        return [json.loads(line)['id'] for line in export(format='ndjson', **options).splitlines()]
+    assert ids(application=[crash_report.application.name]) == [crash_report.id]
+    assert ids(application=[str(application.id)], kind=['hang']) == []
+    assert ids(application=[str(crash_report.application_id)], kind=['3']) == []
+    assert ids(kind=['hang']) == [crash_report.id]
+    assert ids(user=[crash_report.user.username]) == [crash_report.id]
+    assert len(ids(user=[user.username, crash_report.user.username])) == len(crash_reports) + 1
+    assert len(ids(since='2000-01-01')) == len(crash_reports) + 1
+    assert ids(until='2000-01-01', date_field='created_at') == []
+
+def test_export_crashes_rejects_bad_filters(db):
+    with pytest.raises(CommandError):
+        export(kind=['explosion'])
+    with pytest.raises(CommandError):
+        export(since='yesterday')
+
+def import_rows(**overrides):
+    row = dict(title='Segfault', kind='1', details='', version='1.0', count='2',
+               application_name='Imported App', application_company='Imported Co', username='importer')
+    row.update(overrides)
+    return row
+
+def test_import_crashes_round_trips_an_export(tmpdir, crash_reports):
+    path = str(tmpdir.join('crashes.csv.gz'))
+    call_command('export_crashes', gzip=True, output=path)
+    expected = sorted((c.title, c.user.username, c.application.name, c.count) for c in crash_reports)
+    CrashReport.objects.all().delete()
+
+    call_command('import_crashes', path, verbosity=0)
+    assert sorted((c.title, c.user.username, c.application.name, c.count)
+                  for c in CrashReport.objects.select_related('user', 'application')) == expected
+
+def test_import_crashes_merges_duplicates_adding_counts(tmpdir, crash_report):
+    path = str(tmpdir.join('crashes.ndjson'))
+    call_command('export_crashes', format='ndjson', output=path)
+    call_command('import_crashes', path, verbosity=0)
+    assert CrashReport.objects.get(id=crash_report.id).count == 2 * crash_report.count
+    # a finished import leaves no progress behind, so importing it again adds it again
+    call_command('import_crashes', path, verbosity=0)
+    assert CrashReport.objects.count() == 1
+    assert CrashReport.objects.get(id=crash_report.id).count == 3 * crash_report.count
+    assert not ImportProgress.objects.exists()
+
+def test_import_crashes_from_stdin_needs_a_source(monkeypatch, db):
+    monkeypatch.setattr(sys, 'stdin', StringIO(''))
+    with pytest.raises(CommandError):
+        call_command('import_crashes', '-', format='ndjson', verbosity=0)
+
+def test_import_crashes_of_different_stdin_dumps_back_to_back(monkeypatch, db):
+    for title in ('First dump', 'Second dump'):
+        monkeypatch.setattr(sys, 'stdin', StringIO(json.dumps(import_rows(title=title)) + '\n'))
+        call_command('import_crashes', '-', format='ndjson', source='nightly', verbosity=0)
+    assert sorted(CrashReport.objects.values_list('title', flat=True)) == ['First dump', 'Second dump']
+
+def test_import_crashes_of_a_new_file_at_the_same_path(tmpdir, db):
+    path = tmpdir.join('crashes.ndjson')
+    path.write(json.dumps(import_rows(title='First dump')) + '\n')
+    path.setmtime(1000000000)
+    with path.open() as first:
+        # as if an import of the first file was interrupted after its first row
+        ImportProgress.objects.create(source=file_source(first), rows=1)
+    path.write(json.dumps(import_rows(title='Second dump')) + '\n')
+    path.setmtime(1000000100)
+    call_command('import_crashes', str(path), verbosity=0)
+    assert list(CrashReport.objects.values_list('title', flat=True)) == ['Second dump']
+
+def test_crash_importer_creates_applications_and_users(db):
+    rows = [import_rows(), import_rows(count='3'), import_rows(username='other', title='Hang')]
+    assert CrashImporter('test').run(rows) == (3, 0)
+    crash_reports = CrashReport.objects.select_related('user', 'application').order_by('title')
+    assert [(c.title, c.user.username, c.application.company, c.count) for c in crash_reports] == [
+        ('Hang', 'other', 'Imported Co', 2),
+        ('Segfault', 'importer', 'Imported Co', 5),
+    ]
+    assert not crash_reports[0].user.has_usable_password()
+
+def test_crash_importer_skips_invalid_rows(db):
+    invalid = []
+    importer = CrashImporter('test', invalid=lambda number, errors: invalid.append((number, sorted(errors))))
+    assert importer.run([import_rows(kind='9'), import_rows(), import_rows(title='', username='')]) == (1, 2)
+    assert invalid == [(1, ['kind']), (3, ['title', 'username'])]
+
+def test_crash_importer_resumes_after_the_last_committed_batch(db):
+    def interrupted(rows, after):
+        for number, row in enumerate(rows):
+            if number == after:
+                raise KeyboardInterrupt
+            yield row
+    rows = [import_rows(title='Crash {0}'.format(f.spell(n))) for n in range(10)]
+    with pytest.raises(KeyboardInterrupt):
+        CrashImporter('test', batch_size=3).run(interrupted(rows, 7))
+    assert CrashReport.objects.count() == 6
+    CrashImporter('test', batch_size=3).run(rows)
+    assert sorted(CrashReport.objects.values_list('count', flat=True)) == [2] * 10
+    assert not ImportProgress.objects.filter(source='test').exists()
+
+def test_api_key(user):
+    def api_key(**options):
+        out = StringIO()
+        call_command('api_key', user.username, stdout=out, **options)
+        return out.getvalue().strip()
+    key = api_key()
+    assert len(key) == 40
+    assert api_key() == key
+    assert api_key(reset=True) != key
+    with pytest.raises(CommandError):
+        call_command('api_key', 'nobody')
@@ -3,5 +3,27 @@ from django import forms
 from crashes.models import CRASH_KIND, Application
 from crashes.forms import *
 from crashes.tests.helpers import *
+from crashes.tests.fixtures import *
 
 
+def crash_data(application, **kwargs):
+    data = dict(application=application.id, title='Foo', kind=CRASH_KIND['crash'], details='', version='1.0', count=1)
+    data.update(kwargs)
+    return data
+
+def test_bulk_crash_form_resolves_application_from_the_given_dict(application):
+    with count_queries() as queries:
+        form = BulkCrashForm(crash_data(application), {application.id: application})
+        assert form.is_valid(), form.errors
+    assert form.cleaned_data['application'] == application
+    assert len(queries) == 0
+
+def test_bulk_crash_form_rejects_unknown_applications(application):
+    form = BulkCrashForm(crash_data(application), {})
+    assert not form.is_valid()
+    assert 'application' in form.errors
+
+def test_bulk_crash_form_uses_crash_form_rules(application):
+    form = BulkCrashForm(crash_data(application, title=''), {application.id: application})
+    assert not form.is_valid()
+    assert 'title' in form.errors
@@ -0,0 +1,33 @@
+import pytest
+from django.template import Context, Template, TemplateSyntaxError
+
+from crashes.models import CrashReport
+from crashes.tests.fixtures import *
+
+
+def render(text, **context):
+    return Template('{% load fragments %}' + text).render(Context(context))
+
+def test_fragments_are_cached_by_what_they_vary_on():
+    text = '{% fragment row id version %}{{ title }}{% endfragment %}'
+    assert render(text, id=1, version=1, title='first') == 'first'
+    assert render(text, id=1, version=1, title='second') == 'first'
+    assert render(text, id=1, version=2, title='second') == 'second'
+    assert render(text, id=2, version=1, title='third') == 'third'
+
+def test_fragment_requires_a_name():
+    with pytest.raises(TemplateSyntaxError):
+        render('{% fragment %}{% endfragment %}')
+
+def test_crash_list_rows_change_with_their_crash_reports(user_client, user, crash_report):
+    path = '/u/{0}/'.format(user.username)
+    assert crash_report.title in user_client.get(path).content
+
+    crash_report = CrashReport.objects.get(id=crash_report.id)
+    crash_report.title = 'Renamed crash'
+    crash_report.save()
+    crash_report.application.name = 'Renamed application'
+    crash_report.application.save()
+    content = user_client.get(path).content
+    assert 'Renamed crash' in content
+    assert 'Renamed application' in content
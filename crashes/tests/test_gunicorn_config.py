@@ -0,0 +1,38 @@
+import os
+
+from crashes.server_benchmarks import GUNICORN_CONFIG, memory_kb
+
+
+def load_config(monkeypatch, **env):
+    for name in ('CRASHULA_WORKER_CLASS', 'WEB_CONCURRENCY', 'CRASHULA_PRELOAD', 'CRASHULA_MAX_REQUESTS', 'PORT'):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    config = {}
+    execfile(GUNICORN_CONFIG, config)
+    return config
+
+def test_gunicorn_config_defaults(monkeypatch):
+    config = load_config(monkeypatch)
+    assert config['worker_class'] == 'gevent'
+    assert config['workers'] > 1
+    assert config['preload_app']
+    assert config['max_requests'] > 0
+    assert config['bind'] == '0.0.0.0:8000'
+
+def test_gunicorn_config_from_environment(monkeypatch):
+    config = load_config(monkeypatch, CRASHULA_WORKER_CLASS='sync', WEB_CONCURRENCY='3',
+                         CRASHULA_PRELOAD='no', PORT='5000')
+    assert config['worker_class'] == 'sync'
+    assert config['workers'] == 3
+    assert not config['preload_app']
+    assert config['bind'] == '0.0.0.0:5000'
+
+def test_warm_up_loads_the_middleware():
+    from crashula.wsgi import handler, warm_up
+    warm_up()
+    assert handler._request_middleware is not None
+
+def test_memory_kb():
+    rss, pss = memory_kb(os.getpid())
+    assert 0 < pss <= rss
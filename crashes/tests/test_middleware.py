@@ -0,0 +1,68 @@
+import json
+import logging
+import random
+
+import pytest
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test.client import Client
+
+from crashula.middleware import PerformanceMiddleware, RequestTimings
+from crashes.tests.fixtures import *
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+@pytest.fixture()
+def performance_log(request):
+    handler = RecordingHandler()
+    logger = logging.getLogger('crashula.performance')
+    logger.addHandler(handler)
+    request.addfinalizer(lambda: logger.removeHandler(handler))
+    return handler.records
+
+
+def test_server_timing():
+    timings = RequestTimings()
+    timings.queries, timings.db_time, timings.template_time, timings.total = 3, 0.012, 0.004, 0.03
+    assert timings.server_timing() == 'db;dur=12.0;desc="3 queries", template;dur=4.0, total;dur=30.0'
+
+def test_middleware_is_not_used_without_sampling(settings):
+    settings.PERFORMANCE_SAMPLE_RATE = 0
+    with pytest.raises(MiddlewareNotUsed):
+        PerformanceMiddleware()
+
+def test_sampled_requests_are_measured(settings, performance_log, user_client, user, crash_reports):
+    settings.PERFORMANCE_SAMPLE_RATE = 1
+    settings.PERFORMANCE_SERVER_TIMING = True
+    response = user_client.get('/u/{0}/'.format(user.username))
+    assert response.status_code == 200
+    assert 'total;dur=' in response['Server-Timing']
+    line = json.loads(performance_log[-1].getMessage())
+    assert line['view'] == 'crashes.views.crashes_by_user'
+    assert line['status'] == 200
+    assert line['queries'] > 0
+    assert line['template_ms'] > 0
+    assert line['response_bytes'] == len(response.content)
+    # the cursor of the connection is restored after the request
+    assert 'cursor' not in connection.__dict__
+
+def test_server_timing_header_can_be_turned_off(settings, performance_log, db):
+    settings.PERFORMANCE_SAMPLE_RATE = 1
+    settings.PERFORMANCE_SERVER_TIMING = False
+    response = Client().get('/login/')
+    assert not response.has_header('Server-Timing')
+    assert json.loads(performance_log[-1].getMessage())['path'] == '/login/'
+
+def test_unsampled_requests_are_not_measured(settings, performance_log, db, monkeypatch):
+    settings.PERFORMANCE_SAMPLE_RATE = 0.5
+    monkeypatch.setattr(random, 'random', lambda: 0.9)
+    response = Client().get('/login/')
+    assert not response.has_header('Server-Timing')
+    assert performance_log == []
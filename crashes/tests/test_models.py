@@ -1,5 +1,9 @@
-from django.db import models
+import datetime
+import threading
+
+from django.db import models, connections
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 from crashes.tests.helpers import *
 from crashes import factories as f
@@ -37,9 +41,233 @@ def test_crash_report_fields():
     assert model.details == TextField(blank=True)
     assert model.title == CharField(max_length=200, db_index=True)
     assert model.count == IntegerField(default=1)
+    assert model.fingerprint == CharField(max_length=40, editable=False)
     assert_date_fields(CrashReport)
 
 def test_crash_report_unicode(db):
     cr = f.CrashReportFactory.build(title='Foobar', user__username='Joe', application__name='xcode', kind=CRASH_KIND['crash'])
     assert unicode(cr) == 'Foobar (xcode crash by Joe)'
 
+
+def test_crash_report_is_unique_by_user_and_fingerprint():
+    assert ('user', 'fingerprint') in CrashReport._meta.unique_together
+
+def test_crash_report_fingerprint_ignores_case_whitespace_numbers_and_addresses():
+    fingerprint = crash_fingerprint(1, CRASH_KIND['crash'], 'EXC_BAD_ACCESS at 0x1f3a', 'Thread 3  crashed\n  line 42')
+    assert fingerprint == crash_fingerprint(1, CRASH_KIND['crash'], 'exc_bad_access at 0xdeadbeef', 'thread 7 crashed line 9')
+
+def test_crash_report_fingerprint_depends_on_application_kind_title_and_details():
+    fingerprint = crash_fingerprint(1, CRASH_KIND['crash'], 'Foo', 'Bar')
+    assert fingerprint != crash_fingerprint(2, CRASH_KIND['crash'], 'Foo', 'Bar')
+    assert fingerprint != crash_fingerprint(1, CRASH_KIND['hang'], 'Foo', 'Bar')
+    assert fingerprint != crash_fingerprint(1, CRASH_KIND['crash'], 'Baz', 'Bar')
+    assert fingerprint != crash_fingerprint(1, CRASH_KIND['crash'], 'Foo', 'Baz')
+
+def test_crash_report_save_stores_its_fingerprint(crash_report):
+    assert crash_report.fingerprint == crash_fingerprint(
+        crash_report.application_id, crash_report.kind, crash_report.title, crash_report.details)
+
+def test_increment_or_create_creates_missing_crash_report(user, application):
+    crash_report_id, created = CrashReport.objects.increment_or_create(
+        user=user, fingerprint='abc', defaults=dict(application=application, title='Foobar', details='boom'))
+    assert created
+    crash_report = CrashReport.objects.get(id=crash_report_id)
+    assert crash_report.title == 'Foobar'
+    assert crash_report.details == 'boom'
+    assert crash_report.count == 1
+
+def test_increment_or_create_increments_existing_crash_report(crash_report):
+    crash_report_id, created = CrashReport.objects.increment_or_create(
+        user=crash_report.user, fingerprint=crash_report.fingerprint, defaults=dict(details='ignored'))
+    assert not created
+    assert crash_report_id == crash_report.id
+    updated = CrashReport.objects.get(id=crash_report.id)
+    assert updated.count == 2
+    assert updated.details == crash_report.details
+    assert updated.updated_at >= crash_report.updated_at
+
+def test_increment_or_create_does_not_lose_concurrent_increments(crash_report):
+    threads, per_thread = 10, 20
+    # share the test connection like LiveServerTestCase does, so every thread
+    # sees the same (possibly in-memory) test database.
+    connection = connections['default']
+    connection.allow_thread_sharing = True
+    # pysqlite's statement cache isn't thread-safe, so on SQLite the threads
+    # take turns per call; other databases run them concurrently
+    lock = threading.Lock() if connection.vendor == 'sqlite' else None
+    def hammer():
+        connections['default'] = connection
+        for _ in range(per_thread):
+            if lock:
+                lock.acquire()
+            try:
+                CrashReport.objects.increment_or_create(user=crash_report.user, fingerprint=crash_report.fingerprint)
+            finally:
+                if lock:
+                    lock.release()
+    workers = [threading.Thread(target=hammer) for _ in range(threads)]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        connection.allow_thread_sharing = False
+    assert CrashReport.objects.get(id=crash_report.id).count == 1 + threads * per_thread
+
+def test_bulk_increment_or_create_creates_and_increments(user, application, crash_report):
+    existing = f.CrashReportFactory.build(user=crash_report.user, application=crash_report.application,
+                                          kind=crash_report.kind, title=crash_report.title, details=crash_report.details)
+    new = f.CrashReportFactory.build(user=user, application=application, count=3)
+    new_again = f.CrashReportFactory.build(user=user, application=application, title=new.title, details=new.details)
+    results = CrashReport.objects.bulk_increment_or_create([existing, new, new_again, existing])
+
+    new_id = CrashReport.objects.get(title=new.title).id
+    assert results == [(crash_report.id, False), (new_id, True), (new_id, False), (crash_report.id, False)]
+    assert CrashReport.objects.get(id=crash_report.id).count == 3
+    assert CrashReport.objects.get(id=new_id).count == 4
+
+def test_bulk_increment_or_create_adds_counts_after_losing_an_insert_race(monkeypatch, crash_report):
+    rows_by_fingerprint = CrashReport.objects._rows_by_fingerprint
+    calls = []
+    def lose_the_race(keys):
+        # the first lookup misses the row, as if another process inserted it just after
+        calls.append(keys)
+        return {} if len(calls) == 1 else rows_by_fingerprint(keys)
+    monkeypatch.setattr(CrashReport.objects, '_rows_by_fingerprint', lose_the_race)
+    ApplicationStats.objects.rebuild()
+    duplicate = f.CrashReportFactory.build(user=crash_report.user, application=crash_report.application, count=5,
+                                           kind=crash_report.kind, title=crash_report.title, details=crash_report.details)
+    CrashReport.objects.bulk_increment_or_create([duplicate], add_counts=True)
+    assert CrashReport.objects.get(id=crash_report.id).count == crash_report.count + 5
+    assert ApplicationStats.objects.drift() == []
+
+def test_bulk_increment_or_create_uses_a_fixed_number_of_queries(user, application, crash_reports):
+    batch = [f.CrashReportFactory.build(user=user, application=application) for _ in range(200)]
+    batch += [f.CrashReportFactory.build(user=user, application=application, kind=c.kind, title=c.title, details=c.details)
+              for c in crash_reports]
+    with count_queries() as queries:
+        CrashReport.objects.bulk_increment_or_create(batch)
+    assert CrashReport.objects.count() == 210
+    # bulk INSERTs are split by the backend (sqlite limits query parameters)
+    assert len([q for q in queries.queries if not q['sql'].startswith('INSERT')]) <= 5, queries
+
+### APPLICATION STATS
+
+def stats_counts():
+    return dict(((s.application_id, s.version, s.kind), s.count) for s in ApplicationStats.objects.all())
+
+def test_application_stats_fields():
+    model = Fields(ApplicationStats)
+    assert model.application == ForeignKey(Application, related_name='stats')
+    assert model.version == CharField(max_length=25, blank=True)
+    assert model.kind == IntegerField(choices=CRASH_KIND_CHOICES, default=0)
+    assert model.count == IntegerField(default=0)
+    assert model.last_seen_at == DateTimeField()
+    assert ('application', 'version', 'kind') in ApplicationStats._meta.unique_together
+    assert_date_fields(ApplicationStats)
+
+def test_application_stats_add_creates_then_increments(application):
+    ApplicationStats.objects.add(application.id, '1.0', CRASH_KIND['hang'], 2)
+    ApplicationStats.objects.add(application.id, '1.0', CRASH_KIND['hang'], 3)
+    ApplicationStats.objects.add(application.id, '1.1', CRASH_KIND['hang'], 1)
+    assert stats_counts() == {
+        (application.id, '1.0', CRASH_KIND['hang']): 5,
+        (application.id, '1.1', CRASH_KIND['hang']): 1,
+    }
+
+def test_increment_or_create_keeps_application_stats(user, application):
+    defaults = dict(application=application, title='Foo', version='1.0', kind=CRASH_KIND['crash'], count=2)
+    fingerprint = crash_fingerprint(application.id, defaults['kind'], 'Foo', '')
+    CrashReport.objects.increment_or_create(user=user, fingerprint=fingerprint, defaults=defaults)
+    CrashReport.objects.increment_or_create(user=user, fingerprint=fingerprint, defaults=defaults)
+    assert stats_counts() == {(application.id, '1.0', CRASH_KIND['crash']): 3}
+    assert ApplicationStats.objects.drift() == []
+
+def test_bulk_increment_or_create_keeps_application_stats(user, application, crash_report):
+    ApplicationStats.objects.rebuild()
+    batch = [
+        f.CrashReportFactory.build(user=user, application=application, version='2.0', title='Foo'),
+        f.CrashReportFactory.build(user=user, application=application, version='2.0', title='Foo'),
+        f.CrashReportFactory.build(user=user, application=application, kind=crash_report.kind,
+                                   title=crash_report.title, details=crash_report.details),
+    ]
+    CrashReport.objects.bulk_increment_or_create(batch)
+    assert ApplicationStats.objects.drift() == []
+    assert stats_counts()[application.id, '2.0', CRASH_KIND['crash']] == 2
+
+def test_deleting_a_crash_report_removes_it_from_application_stats(crash_report):
+    ApplicationStats.objects.rebuild()
+    crash_report.delete()
+    assert ApplicationStats.objects.drift() == []
+
+def test_deleting_an_application_leaves_no_application_stats(application, crash_reports):
+    ApplicationStats.objects.rebuild()
+    application.delete()
+    assert not ApplicationStats.objects.exists()
+
+def test_deleting_an_uncounted_crash_report_keeps_application_stats(crash_report):
+    ApplicationStats.objects.rebuild()
+    CrashReport.objects.filter(id=crash_report.id).update(count=crash_report.count + 5)
+    CrashReport.objects.get(id=crash_report.id).delete()
+    assert sum(stats_counts().values()) == crash_report.count
+
+def test_application_stats_drift_and_rebuild(crash_reports):
+    assert len(ApplicationStats.objects.drift()) == len(set((c.application_id, c.version, c.kind) for c in crash_reports))
+    ApplicationStats.objects.rebuild()
+    assert ApplicationStats.objects.drift() == []
+    assert sum(stats_counts().values()) == sum(c.count for c in crash_reports)
+
+### CRASH HISTORY
+
+def test_crash_history_fields():
+    model = Fields(CrashHistory)
+    assert model.crash_report == ForeignKey(CrashReport, related_name='history')
+    assert model.resolution == IntegerField(choices=HISTORY_RESOLUTION_CHOICES)
+    assert model.bucket == DateTimeField()
+    assert model.count == IntegerField(default=0)
+    assert ('crash_report', 'resolution', 'bucket') in CrashHistory._meta.unique_together
+
+def test_history_bucket():
+    when = datetime.datetime(2013, 5, 4, 13, 45, 12, tzinfo=timezone.utc)
+    assert history_bucket(when, HISTORY_RESOLUTION['hourly']) == datetime.datetime(2013, 5, 4, 13, tzinfo=timezone.utc)
+    assert history_bucket(when, HISTORY_RESOLUTION['daily']) == datetime.datetime(2013, 5, 4, tzinfo=timezone.utc)
+
+def test_crash_history_record_upserts_hourly_buckets(crash_report):
+    when = datetime.datetime(2013, 5, 4, 13, 45, tzinfo=timezone.utc)
+    CrashHistory.objects.record({crash_report.id: 2}, when)
+    CrashHistory.objects.record({crash_report.id: 3}, when + datetime.timedelta(minutes=10))
+    CrashHistory.objects.record({crash_report.id: 1}, when + datetime.timedelta(hours=1))
+    assert CrashHistory.objects.series(crash_report.id) == [
+        (datetime.datetime(2013, 5, 4, 13, tzinfo=timezone.utc), HISTORY_RESOLUTION['hourly'], 5),
+        (datetime.datetime(2013, 5, 4, 14, tzinfo=timezone.utc), HISTORY_RESOLUTION['hourly'], 1),
+    ]
+
+def test_increment_or_create_records_history(user, application):
+    defaults = dict(application=application, title='Foo', kind=CRASH_KIND['crash'], count=2)
+    fingerprint = crash_fingerprint(application.id, defaults['kind'], 'Foo', '')
+    crash_report_id, _ = CrashReport.objects.increment_or_create(user=user, fingerprint=fingerprint, defaults=defaults)
+    CrashReport.objects.increment_or_create(user=user, fingerprint=fingerprint, defaults=defaults)
+    assert sum(count for _, _, count in CrashHistory.objects.series(crash_report_id)) == 3
+
+def test_bulk_increment_or_create_records_history(user, application):
+    new = f.CrashReportFactory.build(user=user, application=application, count=3)
+    new_again = f.CrashReportFactory.build(user=user, application=application, title=new.title, details=new.details)
+    [(crash_report_id, _), _] = CrashReport.objects.bulk_increment_or_create([new, new_again])
+    assert [count for _, _, count in CrashHistory.objects.series(crash_report_id)] == [4]
+
+def test_crash_history_downsample_merges_old_days(crash_report):
+    day = datetime.datetime(2013, 5, 4, tzinfo=timezone.utc)
+    for hour in (1, 5, 23):
+        CrashHistory.objects.record({crash_report.id: hour}, day + datetime.timedelta(hours=hour))
+    CrashHistory.objects.record({crash_report.id: 7}, day + datetime.timedelta(days=1, hours=2))
+
+    assert CrashHistory.objects.downsample(day + datetime.timedelta(days=1, hours=12)) == 3
+    assert CrashHistory.objects.series(crash_report.id) == [
+        (day, HISTORY_RESOLUTION['daily'], 29),
+        (day + datetime.timedelta(days=1, hours=2), HISTORY_RESOLUTION['hourly'], 7),
+    ]
+    # merging more hours into a day adds to it
+    CrashHistory.objects.record({crash_report.id: 1}, day)
+    CrashHistory.objects.downsample(day + datetime.timedelta(days=1))
+    assert CrashHistory.objects.series(crash_report.id)[0] == (day, HISTORY_RESOLUTION['daily'], 30)
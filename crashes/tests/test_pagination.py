@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from crashes import factories as f
+from crashes.models import CrashReport
+from crashes.pagination import *
+from crashes.tests.fixtures import *
+
+
+@pytest.fixture()
+def many_crash_reports(user, application):
+    "Returns 25 crash reports, several of which share an updated_at, newest first."
+    now = timezone.now()
+    crash_reports = f.CrashReportFactory.create_batch(25, user=user, application=application)
+    for i, crash_report in enumerate(crash_reports):
+        CrashReport.objects.filter(id=crash_report.id).update(updated_at=now - datetime.timedelta(seconds=i // 3))
+    return list(CrashReport.objects.filter(user=user).order_by('-updated_at', '-id'))
+
+def test_cursor_round_trips(crash_report):
+    updated_at, id = decode_cursor(encode_cursor(crash_report))
+    assert updated_at == crash_report.updated_at
+    assert id == crash_report.id
+
+def test_invalid_cursor_raises():
+    with pytest.raises(InvalidCursor):
+        decode_cursor('foo')
+
+@pytest.mark.parametrize('cursor', ['99999999999999999999-1', '1000000000000000000-1'])
+def test_out_of_range_cursor_raises(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+def test_first_page_has_only_a_next_cursor(many_crash_reports):
+    page = keyset_paginate(CrashReport.objects.all(), 10)
+    assert list(page) == many_crash_reports[:10]
+    assert page.has_next()
+    assert not page.has_previous()
+
+def test_paging_forwards_visits_every_crash_report_once(many_crash_reports):
+    seen, cursor = [], None
+    while True:
+        page = keyset_paginate(CrashReport.objects.all(), 10, after=cursor)
+        seen.extend(page)
+        if not page.has_next():
+            break
+        cursor = page.next_cursor
+    assert seen == many_crash_reports
+    assert page.has_previous()
+
+def test_paging_backwards_returns_the_preceding_page(many_crash_reports):
+    first = keyset_paginate(CrashReport.objects.all(), 10)
+    second = keyset_paginate(CrashReport.objects.all(), 10, after=first.next_cursor)
+    third = keyset_paginate(CrashReport.objects.all(), 10, after=second.next_cursor)
+    assert list(third) == many_crash_reports[20:]
+    assert not third.has_next()
+
+    back = keyset_paginate(CrashReport.objects.all(), 10, before=third.previous_cursor)
+    assert list(back) == list(second)
+    assert back.has_next() and back.has_previous()
+    back = keyset_paginate(CrashReport.objects.all(), 10, before=back.previous_cursor)
+    assert list(back) == list(first)
+    assert not back.has_previous()
+
+def test_empty_queryset_has_no_cursors(db):
+    page = keyset_paginate(CrashReport.objects.all(), 10)
+    assert list(page) == []
+    assert not page.has_next()
+    assert not page.has_previous()
@@ -0,0 +1,88 @@
+import cProfile
+
+import pytest
+from django.test.client import Client
+
+from crashula.profiling import ProfileStore
+from crashes.tests.fixtures import *
+
+
+@pytest.fixture()
+def profile_path(settings, tmpdir):
+    settings.PROFILE_PATH = str(tmpdir.join('profiles'))
+    return settings.PROFILE_PATH
+
+@pytest.fixture()
+def admin_client(admin):
+    client = Client()
+    client.login(username=admin.username, password='test123')
+    return client
+
+def profile_of(function):
+    profile = cProfile.Profile()
+    profile.runcall(function)
+    return profile
+
+
+def test_armed_requests_are_claimed_once(tmpdir):
+    store, other_worker = ProfileStore(str(tmpdir)), ProfileStore(str(tmpdir))
+    assert not store.claim('/')
+    store.arm(2)
+    assert store.pending() == 2
+    assert store.claim('/')
+    assert other_worker.claim('/u/')
+    assert not store.claim('/')
+    assert not other_worker.claim('/')
+    assert store.pending() == 0
+
+def test_armed_requests_only_match_their_path_prefix(tmpdir):
+    store = ProfileStore(str(tmpdir))
+    store.arm(1, '/u/')
+    assert not store.claim('/login/')
+    assert store.claim('/u/user0/')
+
+def test_saved_profiles(tmpdir):
+    store = ProfileStore(str(tmpdir), keep=2)
+    names = [store.save(profile_of(lambda: sorted(range(100))), path='/{0}/'.format(i)) for i in range(3)]
+    assert store.names() == names[:0:-1]
+    assert [p['path'] for p in store.profiles()] == ['/2/', '/1/']
+    total_time, functions = store.top_functions(names[-1], 'ncalls', limit=5)
+    assert 0 < len(functions) <= 5
+    assert any('sorted' in f['function'] for f in functions)
+
+def test_armed_requests_are_profiled(profile_path, db):
+    store = ProfileStore(profile_path)
+    store.arm(1)
+    Client().get('/login/')
+    Client().get('/login/')
+    profiles = store.profiles()
+    assert len(profiles) == 1
+    assert profiles[0]['path'] == '/login/'
+    assert profiles[0]['status'] == 200
+    assert profiles[0]['user'] is None
+
+def test_staff_can_profile_a_request(profile_path, admin_client, admin):
+    admin_client.get('/login/?profile')
+    assert [p['user'] for p in ProfileStore(profile_path).profiles()] == [admin.username]
+
+def test_others_cannot_profile_a_request(profile_path, user_client):
+    user_client.get('/login/?profile')
+    assert ProfileStore(profile_path).profiles() == []
+
+def test_profile_pages_are_staff_only(profile_path, user_client):
+    response = user_client.get('/admin/profiles/')
+    assert response.status_code == 200
+    assert 'id="login-form"' in response.content
+
+def test_profile_pages(profile_path, admin_client):
+    response = admin_client.post('/admin/profiles/', dict(count=1, path_prefix='/login/'))
+    assert response.status_code == 302
+    admin_client.get('/login/')
+    name = ProfileStore(profile_path).names()[0]
+
+    response = admin_client.get('/admin/profiles/')
+    assert name in response.content
+    response = admin_client.get('/admin/profiles/{0}/?sort=tottime'.format(name))
+    assert response.status_code == 200
+    assert 'Cumulative' in response.content
+    assert admin_client.get('/admin/profiles/missing/').status_code == 404
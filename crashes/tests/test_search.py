@@ -0,0 +1,58 @@
+import pytest
+
+from crashes import factories as f
+from crashes.models import CrashReport
+from crashes.search import (search_terms, search_crash_reports, get_search_backend,
+                            SQLiteSearchBackend, ScanSearchBackend)
+from crashes.tests.fixtures import *
+
+
+def titles(crash_reports):
+    return sorted(crash_report.title for crash_report in crash_reports)
+
+@pytest.fixture()
+def searchable(user, application):
+    f.CrashReportFactory.create(user=user, application=application, title='Segfault in renderer',
+                                details='EXC_BAD_ACCESS while drawing fonts')
+    f.CrashReportFactory.create(user=user, application=application, title='Hangs on launch',
+                                details='Spinning beach ball while loading fonts')
+    f.CrashReportFactory.create(user=user, application=application, title='Saving loses data', details='')
+    return CrashReport.objects.filter(user=user)
+
+def test_search_terms_drops_punctuation_and_operators():
+    assert search_terms(u'"Fonts" AND -renderer*') == [u'fonts', u'and', u'renderer']
+    assert search_terms(None) == []
+
+def test_get_search_backend_uses_fts_for_sqlite(db):
+    assert isinstance(get_search_backend(), SQLiteSearchBackend)
+
+def test_search_matches_titles_and_details(searchable):
+    assert titles(search_crash_reports(searchable, 'renderer')) == ['Segfault in renderer']
+    assert titles(search_crash_reports(searchable, 'fonts')) == ['Hangs on launch', 'Segfault in renderer']
+    assert titles(search_crash_reports(searchable, 'FONTS launch')) == ['Hangs on launch']
+
+def test_search_stems_words(searchable):
+    assert titles(search_crash_reports(searchable, 'hang')) == ['Hangs on launch']
+
+def test_search_ignores_query_syntax(searchable):
+    assert titles(search_crash_reports(searchable, 'renderer" OR "launch')) == []
+    assert list(search_crash_reports(searchable, '*')) == []
+
+def test_search_index_follows_updates_and_deletes(searchable):
+    crash_report = searchable.get(title='Saving loses data')
+    crash_report.title = 'Saving corrupts data'
+    crash_report.save()
+    assert titles(search_crash_reports(searchable, 'loses')) == []
+    assert titles(search_crash_reports(searchable, 'corrupts')) == ['Saving corrupts data']
+    crash_report.delete()
+    assert titles(search_crash_reports(searchable, 'corrupts')) == []
+
+def test_search_index_covers_bulk_inserts(user, application):
+    CrashReport.objects.bulk_increment_or_create([
+        f.CrashReportFactory.build(user=user, application=application, title='Bulk loaded crash'),
+    ])
+    assert titles(search_crash_reports(CrashReport.objects.all(), 'bulk')) == ['Bulk loaded crash']
+
+def test_scan_backend_matches_like_the_index(searchable):
+    backend = ScanSearchBackend(None)
+    assert titles(backend.filter(searchable, search_terms('fonts launch'))) == ['Hangs on launch']
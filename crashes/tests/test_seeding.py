@@ -0,0 +1,64 @@
+import random
+
+import pytest
+from django.contrib.auth import authenticate
+from django.core.management import call_command
+
+from crashes.models import CrashReport, ApplicationStats, SimilarityBand
+from crashes.seeding import (KIND_WEIGHTS, weighted_choice, generate_crash_reports, generate_occurrence,
+                             seed_applications, seed_dataset)
+from crashes.tests.fixtures import *
+
+
+def test_weighted_choice():
+    rng = random.Random(0)
+    choices = [weighted_choice(rng, (('a', 9), ('b', 1), ('c', 0))) for _ in range(1000)]
+    assert 800 < choices.count('a') < 1000
+    assert 'c' not in choices
+
+@pytest.mark.django_db
+def test_generate_crash_reports_are_distinct_with_long_tailed_counts(user):
+    applications = seed_applications(3)
+    crash_reports = generate_crash_reports(random.Random(0), user, applications, 200)
+    assert len(crash_reports) == 200
+    assert len(set(c.fingerprint for c in crash_reports)) == 200
+    counts = sorted((c.count for c in crash_reports), reverse=True)
+    assert counts[0] > 10 * counts[len(counts) // 2]
+    assert set(c.kind for c in crash_reports) <= set(kind for kind, _ in KIND_WEIGHTS)
+
+@pytest.mark.django_db
+def test_generate_occurrence_repeats_a_generated_crash(user):
+    applications = seed_applications(3)
+    titles = set(c.title for c in generate_crash_reports(random.Random(0), user, applications, 20))
+    occurrence = generate_occurrence(random.Random(1), user, applications, 20)
+    assert occurrence.title in titles
+    assert occurrence.count == 1
+
+@pytest.mark.django_db
+def test_seed_dataset():
+    dataset = seed_dataset(users=3, applications=2, reports_per_user=20, password='secret')
+    assert dataset.describe() == dict(users=3, applications=2, crash_reports=60)
+    assert CrashReport.objects.count() == 60
+    assert all(len(ids) == 20 for ids in dataset.crash_report_ids.values())
+    assert authenticate(username=dataset.users[0].username, password='secret') == dataset.users[0]
+    assert ApplicationStats.objects.drift() == []
+    assert not SimilarityBand.objects.exists()
+
+@pytest.mark.django_db
+def test_seed_dataset_is_repeatable():
+    first = seed_dataset(users=1, applications=2, reports_per_user=10, prefix='first')
+    second = seed_dataset(users=1, applications=2, reports_per_user=10, prefix='second')
+    titles = lambda dataset: sorted(CrashReport.objects.filter(user=dataset.users[0]).values_list('title', 'count'))
+    assert titles(first) == titles(second)
+
+@pytest.mark.django_db
+def test_seed_dataset_with_a_password_hash_and_similarity_index(user):
+    dataset = seed_dataset(users=2, applications=1, reports_per_user=5, password_hash=user.password,
+                           similarity_index=True)
+    assert authenticate(username=dataset.users[1].username, password='password') == dataset.users[1]
+    assert SimilarityBand.objects.values('crash_report').distinct().count() == 10
+
+@pytest.mark.django_db
+def test_seed_crashes_command():
+    call_command('seed_crashes', users=2, applications=2, reports=5, verbosity=0)
+    assert CrashReport.objects.count() == 10
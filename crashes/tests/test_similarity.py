@@ -0,0 +1,58 @@
+from crashes import factories as f
+from crashes.models import CrashReport, SimilarityBand
+from crashes.similarity import (shingles, minhash, signature_bands, similar_crash_reports,
+                                index_crash_reports, BANDS, SIGNATURE_SIZE, MIN_SHARED_BANDS)
+from crashes.tests.fixtures import *
+
+
+def suggested_titles(user, application, title, details=''):
+    return [c.title for c, _ in similar_crash_reports(user, application.id, title, details)]
+
+def test_shingles_ignore_case_numbers_and_spacing():
+    assert shingles('Crash at 0x1f2e') == shingles('crash   AT 0xdeadbeef')
+    assert shingles('') == set()
+    assert len(shingles('ab')) == 1
+
+def test_minhash_estimates_jaccard_similarity():
+    a, b = shingles('segfault while rendering fonts'), shingles('segfault while rendering images')
+    same = sum(x == y for x, y in zip(minhash(a), minhash(b)))
+    assert len(minhash(a)) == SIGNATURE_SIZE
+    assert 0 < same < SIGNATURE_SIZE
+    assert minhash(a) == minhash(set(a))
+
+def test_signature_bands_number_title_and_details_bands_apart():
+    bands = signature_bands('Segfault', 'EXC_BAD_ACCESS')
+    assert [band for band, _ in bands] == range(2 * BANDS)
+    assert [band for band, _ in signature_bands('Segfault', '')] == range(BANDS)
+    assert [band for band, _ in signature_bands('', 'EXC_BAD_ACCESS')] == range(BANDS, 2 * BANDS)
+
+def test_saving_a_crash_report_indexes_it(crash_report):
+    assert SimilarityBand.objects.filter(crash_report=crash_report).count() == 2 * BANDS
+    crash_report.details = ''
+    crash_report.save()
+    assert SimilarityBand.objects.filter(crash_report=crash_report).count() == BANDS
+
+def test_bulk_created_crash_reports_are_indexed(user, application):
+    batch = [f.CrashReportFactory.build(user=user, application=application) for _ in range(3)]
+    CrashReport.objects.bulk_increment_or_create(batch)
+    assert SimilarityBand.objects.filter(user=user).values('crash_report').distinct().count() == 3
+
+def test_similar_crash_reports_ranks_near_duplicates(user, application, other_user):
+    f.CrashReportFactory.create(user=user, application=application, title='Segfault while rendering fonts', details='')
+    f.CrashReportFactory.create(user=user, application=application, title='Loses data when saving', details='')
+    f.CrashReportFactory.create(user=other_user, application=application, title='Segfault while rendering fonts', details='')
+    f.CrashReportFactory.create(user=user, title='Segfault while rendering fonts', details='')
+
+    suggestions = similar_crash_reports(user, application.id, 'segfault while rendering font')
+    assert [c.title for c, _ in suggestions] == ['Segfault while rendering fonts']
+    assert MIN_SHARED_BANDS <= suggestions[0][1] <= 1
+    assert suggested_titles(user, application, 'Segfault while rendering fonts')[0] == 'Segfault while rendering fonts'
+    assert suggested_titles(user, application, 'Loses data when saving')[0] == 'Loses data when saving'
+
+def test_similar_crash_reports_of_empty_text(user, application, crash_report):
+    assert similar_crash_reports(user, application.id, '', '') == []
+
+def test_index_crash_reports_replaces_bands(crash_report):
+    index_crash_reports([crash_report])
+    index_crash_reports([crash_report])
+    assert SimilarityBand.objects.filter(crash_report=crash_report).count() == 2 * BANDS
@@ -0,0 +1,85 @@
+import pytest
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+
+from crashes import factories as f
+from crashes.cache import application_cache
+from crashes.models import CrashReport, CRASH_KIND
+from crashes.spool import CrashSpool, drain_spool
+from crashes.tests.fixtures import *
+
+
+@pytest.fixture()
+def spool(tmpdir):
+    return CrashSpool(str(tmpdir.join('spool.db')))
+
+def crash(application, **kwargs):
+    data = dict(application=application, title='Foo', kind=CRASH_KIND['crash'], details='', version='1.0', count=1)
+    data.update(kwargs)
+    return data
+
+def test_spool_keeps_crashes_until_removed(spool, user, application):
+    spool.append(user.id, [crash(application), crash(application, title='Bar')])
+    entries = spool.peek(10)
+    assert [(user_id, c['title'], c['application']) for _, user_id, c in entries] == [
+        (user.id, 'Foo', application.id),
+        (user.id, 'Bar', application.id),
+    ]
+    assert len(spool) == 2
+    spool.remove([entries[0][0]])
+    assert [c['title'] for _, _, c in spool.peek(10)] == ['Bar']
+
+def test_spool_survives_reopening(spool, user, application):
+    spool.append(user.id, [crash(application)])
+    assert len(CrashSpool(spool.path)) == 1
+
+def test_drain_spool_stores_crashes_in_batches(spool, user, application):
+    spool.append(user.id, [crash(application, title='Crash {0}'.format(f.spell(i))) for i in range(5)])
+    spool.append(user.id, [crash(application, title='Crash a')])
+    assert drain_spool(spool, batch_size=2) == 6
+    assert len(spool) == 0
+    assert CrashReport.objects.count() == 5
+    assert CrashReport.objects.get(title='Crash a').count == 2
+
+def test_drain_spool_sets_aside_crashes_of_applications_deleted_elsewhere(spool, user, application):
+    other_application = f.ApplicationFactory.create()
+    application_cache.get_many([application.id, other_application.id])
+    spool.append(user.id, [crash(application), crash(other_application)])
+    # like a web worker deleting it: no signal reaches this process
+    connection.cursor().execute('DELETE FROM crashes_application WHERE id = %s', [other_application.id])
+    assert drain_spool(spool) == 1
+    assert len(spool) == 0
+    assert CrashReport.objects.get().application == application
+    assert [(c['application'], 'no longer exists' in error) for _, _, c, error in spool.dead_letters()] == [
+        (other_application.id, True)]
+
+def test_drain_spool_sets_aside_invalid_crashes(spool, user, application):
+    spool.append(user.id, [crash(application, title='x' * 1000), crash(application)])
+    assert drain_spool(spool) == 1
+    assert [error.startswith('Invalid') for _, _, _, error in spool.dead_letters()] == [True]
+
+def test_drain_spool_sets_aside_crashes_the_database_refuses(monkeypatch, spool, user, application):
+    bulk_increment_or_create = CrashReport.objects.bulk_increment_or_create
+    def refuse_bar(crash_reports, **kwargs):
+        if any(crash_report.title == 'Bar' for crash_report in crash_reports):
+            raise DatabaseError('refused')
+        return bulk_increment_or_create(crash_reports, **kwargs)
+    monkeypatch.setattr(CrashReport.objects, 'bulk_increment_or_create', refuse_bar)
+    spool.append(user.id, [crash(application), crash(application, title='Bar'), crash(application, title='Baz')])
+    assert drain_spool(spool) == 2
+    assert len(spool) == 0
+    assert sorted(CrashReport.objects.values_list('title', flat=True)) == ['Baz', 'Foo']
+    assert [c['title'] for _, _, c, _ in spool.dead_letters()] == ['Bar']
+
+    monkeypatch.undo()
+    assert spool.requeue_dead_letters() == 1
+    assert spool.dead_letters() == []
+    assert drain_spool(spool) == 1
+    assert CrashReport.objects.count() == 3
+
+def test_drain_crash_spool_command(settings, spool, user, application):
+    settings.CRASH_SPOOL_PATH = spool.path
+    spool.append(user.id, [crash(application)])
+    call_command('drain_crash_spool', verbosity=0)
+    assert CrashReport.objects.count() == 1
+    assert len(spool) == 0
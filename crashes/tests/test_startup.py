@@ -0,0 +1,48 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import resolve, reverse
+
+from crashula.importtime import ImportTimer
+
+
+def test_import_timer(monkeypatch, tmpdir):
+    tmpdir.join('timed_outer.py').write('import timed_inner\n')
+    tmpdir.join('timed_inner.py').write('x = 1\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+    timer = ImportTimer()
+    timer.install()
+    try:
+        import timed_outer
+    finally:
+        timer.uninstall()
+    inner, outer = timer.records[-2:]
+    assert (inner['modules'], inner['depth']) == (['timed_inner'], 1)
+    assert (outer['modules'], outer['depth']) == (['timed_outer'], 0)
+    assert outer['cumulative'] >= inner['cumulative'] + outer['self']
+    assert timer.total() == outer['cumulative']
+
+def social_auth_settings(monkeypatch):
+    for name in ('TWITTER_CONSUMER_KEY', 'TWITTER_CONSUMER_SECRET', 'FACEBOOK_APP_ID', 'FACEBOOK_API_SECRET'):
+        monkeypatch.setenv('CRASHULA_' + name, 'test')
+
+def test_import_times(monkeypatch, capsys):
+    social_auth_settings(monkeypatch)
+    call_command('import_times', repeat=1, limit=5)
+    out, _ = capsys.readouterr()
+    assert out.startswith('Lean runtime: ')
+    assert len(out.splitlines()) == 7
+
+def test_import_times_over_budget(monkeypatch):
+    social_auth_settings(monkeypatch)
+    with pytest.raises(CommandError):
+        call_command('import_times', repeat=1, limit=0, budget=0.001)
+
+def test_social_auth_complete_is_csrf_exempt():
+    match = resolve(reverse('socialauth_complete', args=['twitter']))
+    assert match.func.__name__ == 'complete'
+    assert match.func.csrf_exempt
+
+def test_admin_urls_are_namespaced():
+    assert reverse('admin:profile_list') == '/admin/profiles/'
+    assert resolve('/admin/').namespace == 'admin'
@@ -1,12 +1,17 @@
 import json
 import urlparse
 
+import pytest
+from django.core.serializers.json import DjangoJSONEncoder
 from django.http import Http404
+from django.test.client import Client
 
 from crashes import views as v
 from crashes import factories as f
 from crashes import models
 from crashes.tests.fixtures import *
+from crashes.tests.helpers import count_queries
+from crashes.spool import get_spool
 
 
 def assert_redirects_to(response, path='/login/'):
@@ -27,6 +32,15 @@ def assert_json(response, obj):
     assert response['Content-Type'] == 'application/json'
     assert json.loads(response.content) == obj
 
+def bulk_crash_reports(count, user, application):
+    "Inserts count crash reports for the user with bulk_create, which is much faster than the factory."
+    crash_reports = []
+    for _ in range(count):
+        crash_report = f.CrashReportFactory.build(user=user, application=application)
+        crash_report.fingerprint = crash_report.compute_fingerprint()
+        crash_reports.append(crash_report)
+    models.CrashReport.objects.bulk_create(crash_reports)
+
 #def test_integration(live_server, browser):
 #    browser.get(unicode(live_server))
 #    assert 'Crashula' in browser.title
@@ -77,11 +91,149 @@ def test_logged_in_user_can_create_a_new_crash_report(user_client, user, applica
     assert crash_report.application == application
     assert crash_report.count == 1
 
+def test_posting_the_same_crash_report_twice_increments_its_count(user_client, user, application):
+    data = f.CrashReportFactory.attributes()
+    data['application'] = application.id
+    user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    response = user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    assert models.CrashReport.objects.count() == 1
+    crash_report = models.CrashReport.objects.all()[0]
+    assert_redirects_to(response, '/u/{0}/{1}/'.format(user.username, crash_report.id))
+    assert crash_report.count == 2
+
+def test_posting_a_near_identical_crash_report_increments_the_original(user_client, user, application):
+    data = f.CrashReportFactory.attributes()
+    data['application'] = application.id
+    data['title'] = 'Segfault at 0x0001f3a'
+    user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    data['title'] = '  SEGFAULT at 0xdeadbeef '
+    user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    assert models.CrashReport.objects.count() == 1
+    assert models.CrashReport.objects.all()[0].count == 2
+
+def test_new_crash_report_is_filed_under_the_selected_application(user_client, user, application):
+    other_application = f.ApplicationFactory.create()
+    data = f.CrashReportFactory.attributes()
+    data['application'] = other_application.id
+    user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    assert models.CrashReport.objects.get().application == other_application
+
+def test_new_crash_report_does_not_query_cached_applications(user_client, user, application):
+    data = f.CrashReportFactory.attributes()
+    data['application'] = application.id
+    user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    with count_queries() as queries:
+        user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    assert not [q for q in queries.queries if '"crashes_application"' in q['sql']]
+
+def test_new_crash_report_is_spooled_in_spool_ingest_mode(settings, tmpdir, user_client, user, application):
+    settings.CRASH_INGEST_MODE = 'spool'
+    settings.CRASH_SPOOL_PATH = str(tmpdir.join('spool.db'))
+    data = f.CrashReportFactory.attributes()
+    data['application'] = application.id
+    response = user_client.post('/u/{0}/new/'.format(user.username), data=data)
+    assert response.status_code == 202
+    assert models.CrashReport.objects.count() == 0
+    assert len(get_spool()) == 1
+
 def test_guest_user_cannot_create_a_new_crash_report(client, db):
     data = f.CrashReportFactory.attributes()
     response = client.post('/crashes/new/', data=data)
     assert response.status_code != 200
 
+# BULK NEW CRASHES
+
+def bulk_crash_data(application, count):
+    return [dict(application=application.id, title='Crash {0}'.format(f.spell(i)), kind=1, details='', version='1.0', count=1)
+            for i in range(count)]
+
+def test_bulk_new_crashes_requires_post(user_client, user):
+    response = user_client.get('/u/{0}/bulk/'.format(user.username))
+    assert response.status_code == 405
+
+def test_guest_user_cannot_bulk_create_crash_reports(client, db):
+    response = client.post('/u/jeff/bulk/', data='[]', content_type='application/json')
+    assert_redirects_to(response, '/login/?next=/u/jeff/bulk/')
+
+def test_bulk_new_crashes_accepts_an_api_key_without_csrf(user, application):
+    client = Client(enforce_csrf_checks=True)
+    response = client.post('/u/{0}/bulk/'.format(user.username), data=json.dumps(bulk_crash_data(application, 2)),
+                           content_type='application/json',
+                           HTTP_AUTHORIZATION='Token {0}'.format(models.ApiKey.objects.for_user(user).key))
+    assert response.status_code == 200
+    assert list(models.CrashReport.objects.values_list('user', flat=True)) == [user.id, user.id]
+
+def test_bulk_new_crashes_rejects_an_invalid_api_key(user):
+    models.ApiKey.objects.for_user(user)
+    response = Client().post('/u/{0}/bulk/'.format(user.username), data='[]', content_type='application/json',
+                             HTTP_AUTHORIZATION='Token wrong')
+    assert response.status_code == 401
+    assert response['WWW-Authenticate'] == 'Token'
+
+def test_bulk_new_crashes_needs_the_csrf_token_of_a_session(user, application):
+    client = Client(enforce_csrf_checks=True)
+    client.login(username=user.username, password='password')
+    path = '/u/{0}/bulk/'.format(user.username)
+    data = json.dumps(bulk_crash_data(application, 1))
+    assert client.post(path, data=data, content_type='application/json').status_code == 403
+
+    client.get('/u/{0}/new/'.format(user.username))
+    response = client.post(path, data=data, content_type='application/json',
+                           HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+    assert response.status_code == 200
+
+def test_bulk_new_crashes_accepts_a_json_array(user_client, user, application):
+    data = bulk_crash_data(application, 3) + bulk_crash_data(application, 1)
+    response = user_client.post('/u/{0}/bulk/'.format(user.username), data=json.dumps(data), content_type='application/json')
+    ids = [c.id for c in models.CrashReport.objects.order_by('title')]
+    assert_json(response, dict(crash_reports=[
+        dict(id=ids[0], created=True),
+        dict(id=ids[1], created=True),
+        dict(id=ids[2], created=True),
+        dict(id=ids[0], created=False),
+    ]))
+    assert models.CrashReport.objects.get(id=ids[0]).count == 2
+    assert models.CrashReport.objects.get(id=ids[0]).application == application
+    assert models.CrashReport.objects.get(id=ids[0]).user == user
+
+def test_bulk_new_crashes_accepts_ndjson(user_client, user, application):
+    data = '\n'.join(json.dumps(item) for item in bulk_crash_data(application, 3))
+    response = user_client.post('/u/{0}/bulk/'.format(user.username), data=data, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert models.CrashReport.objects.count() == 3
+
+def test_bulk_new_crashes_are_spooled_in_spool_ingest_mode(settings, tmpdir, user_client, user, application):
+    settings.CRASH_INGEST_MODE = 'spool'
+    settings.CRASH_SPOOL_PATH = str(tmpdir.join('spool.db'))
+    data = json.dumps(bulk_crash_data(application, 3))
+    response = user_client.post('/u/{0}/bulk/'.format(user.username), data=data, content_type='application/json')
+    assert response.status_code == 202
+    assert json.loads(response.content) == dict(queued=3)
+    assert models.CrashReport.objects.count() == 0
+    assert len(get_spool()) == 3
+
+def test_bulk_new_crashes_rejects_the_batch_if_any_crash_is_invalid(user_client, user, application):
+    data = bulk_crash_data(application, 3)
+    data[1]['title'] = ''
+    response = user_client.post('/u/{0}/bulk/'.format(user.username), data=json.dumps(data), content_type='application/json')
+    assert response.status_code == 400
+    assert json.loads(response.content)['errors'].keys() == ['1']
+    assert models.CrashReport.objects.count() == 0
+
+def test_bulk_new_crashes_rejects_malformed_bodies(user_client, user):
+    response = user_client.post('/u/{0}/bulk/'.format(user.username), data='[1, 2]', content_type='application/json')
+    assert response.status_code == 400
+
+def test_bulk_new_crashes_uses_a_fixed_number_of_queries(user_client, user, application):
+    data = json.dumps(bulk_crash_data(application, 1000))
+    with count_queries() as queries:
+        response = user_client.post('/u/{0}/bulk/'.format(user.username), data=data, content_type='application/json')
+    assert response.status_code == 200
+    assert models.CrashReport.objects.count() == 1000
+    # session + user + applications, then a few statements per 500 crash batch
+    # besides the bulk INSERTs, which the backend may split
+    assert len([q for q in queries.queries if not q['sql'].startswith('INSERT')]) <= 3 + 2 * 5, queries
+
 # CRASH PAGE
 
 def test_crash_by_user_returns_page(user_client, user, crash_reports):
@@ -89,6 +241,19 @@ def test_crash_by_user_returns_page(user_client, user, crash_reports):
     assert response.status_code == 200
     assert crash_reports[0].title in response.content
 
+def test_crash_by_user_answers_conditional_requests_before_rendering(client, user, crash_report):
+    url = '/u/{0}/{1}/'.format(user.username, crash_report.id)
+    response = client.get(url)
+    assert response['Last-Modified']
+    with count_queries() as queries:
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+    etag = response['ETag']
+    crash_report.save()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
 def test_crash_by_invalid_crash_id_is_a_404(user_client, user):
     response = user_client.get('/u/{0}/1/'.format(user.username))
     assert response.status_code == 404
@@ -131,6 +296,28 @@ def test_logged_in_user_can_update_a_crash_report(user_client, user, application
     assert crash_report.details == data['details']
     assert crash_report.application == application
 
+def test_updating_a_crash_report_keeps_application_stats(user_client, user, application, crash_report):
+    models.ApplicationStats.objects.rebuild()
+    data = f.CrashReportFactory.attributes()
+    data.update(application=f.ApplicationFactory.create().id, count=5)
+    user_client.post('/u/{0}/{1}/edit/'.format(user.username, crash_report.id), data=data)
+    assert models.ApplicationStats.objects.drift() == []
+
+def test_updating_an_uncounted_crash_report_makes_no_negative_application_stats(user_client, user, application,
+                                                                               crash_report):
+    data = f.CrashReportFactory.attributes()
+    data.update(application=application.id, count=5)
+    user_client.post('/u/{0}/{1}/edit/'.format(user.username, crash_report.id), data=data)
+    assert list(models.ApplicationStats.objects.values_list('application', 'count')) == [(application.id, 5)]
+
+def test_updating_a_crash_report_into_a_duplicate_is_rejected(user_client, user, application, crash_reports):
+    data = f.CrashReportFactory.attributes()
+    data.update(application=application.id, title=crash_reports[1].title, details=crash_reports[1].details)
+    response = user_client.post('/u/{0}/{1}/edit/'.format(user.username, crash_reports[0].id), data=data)
+    assert response.status_code == 200
+    assert 'already been reported' in response.content
+    assert models.CrashReport.objects.get(id=crash_reports[0].id).title == crash_reports[0].title
+
 
 # LIST CRASHES PAGE
 
@@ -140,9 +327,230 @@ def test_anyone_can_see_crashes_by_user(client, user, crash_reports):
     i = 0
     sorted_crash_reports = sorted(crash_reports, cmp=lambda x, y: cmp(x.updated_at, y.updated_at))
     sorted_crash_reports.reverse()
-    assert list(response.context['crash_reports']) == sorted_crash_reports
+    # rows are deferred instances, which don't compare equal to full ones
+    assert [c.id for c in response.context['crash_reports']] == [c.id for c in sorted_crash_reports]
+
+def test_crashes_by_user_answers_conditional_requests_before_rendering(client, user, crash_reports):
+    etag = client.get('/u/{0}/'.format(user.username))['ETag']
+    with count_queries() as queries:
+        response = client.get('/u/{0}/'.format(user.username), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+def test_crashes_by_user_etag_changes_with_the_crash_reports_and_applications(client, user, application, crash_reports):
+    etag = client.get('/u/{0}/'.format(user.username))['ETag']
+    crash_reports[0].save()
+    response = client.get('/u/{0}/'.format(user.username), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+    etag = response['ETag']
+    application.save()
+    response = client.get('/u/{0}/'.format(user.username), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+def test_crashes_by_user_etag_depends_on_the_viewer(client, user_client, user, crash_reports):
+    etag = client.get('/u/{0}/'.format(user.username))['ETag']
+    response = user_client.get('/u/{0}/'.format(user.username), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
 
 def test_crashes_by_invalid_username_is_a_404(client, db):
     response = client.get('/u/invalid/')
     assert response.status_code == 404
 
+@pytest.mark.parametrize('count', [10, 1000, 10000])
+def test_crashes_by_user_uses_a_fixed_number_of_queries(client, user, application, count):
+    bulk_crash_reports(count, user, application)
+    with count_queries() as queries:
+        response = client.get('/u/{0}/'.format(user.username))
+    assert response.status_code == 200
+    # user, conditional GET validators, the page
+    assert len(queries) == 3, queries
+
+def test_crashes_by_user_does_not_load_crash_details(client, user, crash_reports):
+    with count_queries() as queries:
+        client.get('/u/{0}/'.format(user.username))
+    assert not [q for q in queries.queries if '"details"' in q['sql']]
+
+def test_crashes_by_user_pages_with_cursors(client, user, application):
+    bulk_crash_reports(v.CRASH_REPORTS_PER_PAGE + 5, user, application)
+    response = client.get('/u/{0}/'.format(user.username))
+    page = response.context['crash_reports_page']
+    assert len(response.context['crash_reports']) == v.CRASH_REPORTS_PER_PAGE
+    assert '?after={0}'.format(page.next_cursor) in response.content
+
+    response = client.get('/u/{0}/?after={1}'.format(user.username, page.next_cursor))
+    assert len(response.context['crash_reports']) == 5
+    assert not response.context['crash_reports_page'].has_next()
+    assert '?before=' in response.content
+
+@pytest.mark.parametrize('cursor', ['foo', '99999999999999999999-1'])
+def test_crashes_by_user_with_an_invalid_cursor_is_a_404(client, user, cursor):
+    response = client.get('/u/{0}/?after={1}'.format(user.username, cursor))
+    assert response.status_code == 404
+
+def test_similar_crashes_suggests_the_users_reports(user_client, user, application):
+    crash_report = f.CrashReportFactory.create(user=user, application=application, title='Segfault while rendering fonts')
+    response = user_client.get('/u/{0}/similar/'.format(user.username), dict(
+        application=application.id, title='Segfault rendering fonts'))
+    suggestions = json.loads(response.content)['crash_reports']
+    assert [(s['id'], s['title'], s['url']) for s in suggestions] == [
+        (crash_report.id, crash_report.title, '/u/{0}/{1}/'.format(user.username, crash_report.id))]
+
+def test_similar_crashes_requires_an_application(user_client, user):
+    response = user_client.get('/u/{0}/similar/'.format(user.username), dict(title='Foo'))
+    assert response.status_code == 400
+
+def test_similar_crashes_requires_login(client, user):
+    assert_redirects_to(client.get('/u/{0}/similar/'.format(user.username)))
+
+def test_search_crashes(client, user, application, other_user):
+    f.CrashReportFactory.create(user=user, application=application, title='Segfault in renderer')
+    f.CrashReportFactory.create(user=user, application=application, title='Hangs on launch')
+    f.CrashReportFactory.create(user=other_user, application=application, title='Renderer leaks')
+    response = client.get('/u/{0}/search/'.format(user.username), dict(q='renderer'))
+    assert response.status_code == 200
+    assert [c.title for c in response.context['crash_reports']] == ['Segfault in renderer']
+    assert response.context['query'] == 'renderer'
+
+def test_search_crashes_without_a_query_finds_nothing(client, user, crash_reports):
+    response = client.get('/u/{0}/search/'.format(user.username))
+    assert list(response.context['crash_reports']) == []
+
+def test_search_crashes_pages_keep_the_query(client, user, application):
+    bulk_crash_reports(v.CRASH_REPORTS_PER_PAGE + 5, user, application)
+    response = client.get('/u/{0}/search/'.format(user.username), dict(q='title'))
+    page = response.context['crash_reports_page']
+    assert '?q=title&amp;after={0}'.format(page.next_cursor) in response.content
+
+def test_search_crashes_for_a_missing_user_is_a_404(client, db):
+    response = client.get('/u/nobody/search/', dict(q='foo'))
+    assert response.status_code == 404
+
+def crashes_by_user_queries_crash_reports(client, user):
+    with count_queries() as queries:
+        response = client.get('/u/{0}/'.format(user.username))
+    assert response.status_code == 200
+    # the ETag is always looked up, by username, in the table
+    return bool([q for q in queries.queries
+                 if 'crashes_crashreport' in q['sql'] and '"auth_user"."username"' not in q['sql']])
+
+def test_crashes_by_user_is_cached(client, user, crash_reports):
+    assert crashes_by_user_queries_crash_reports(client, user)
+    assert not crashes_by_user_queries_crash_reports(client, user)
+
+def test_crashes_by_user_cache_is_invalidated_by_new_occurrences(user_client, user, application, crash_report):
+    crashes_by_user_queries_crash_reports(user_client, user)
+    models.CrashReport.objects.increment_or_create(user=user, fingerprint=crash_report.fingerprint)
+    response = user_client.get('/u/{0}/'.format(user.username))
+    assert response.context['crash_reports'][0].count == 2
+
+def test_crashes_by_user_cache_is_invalidated_by_bulk_uploads(user_client, user, application):
+    crashes_by_user_queries_crash_reports(user_client, user)
+    user_client.post('/u/{0}/bulk/'.format(user.username), data=json.dumps(bulk_crash_data(application, 2)),
+                     content_type='application/json')
+    response = user_client.get('/u/{0}/'.format(user.username))
+    assert len(response.context['crash_reports']) == 2
+
+def test_crashes_by_user_cache_is_invalidated_by_edits(user_client, user, crash_report):
+    crashes_by_user_queries_crash_reports(user_client, user)
+    crash_report.title = 'Edited'
+    crash_report.save()
+    response = user_client.get('/u/{0}/'.format(user.username))
+    assert response.context['crash_reports'][0].title == 'Edited'
+
+def test_crashes_by_user_cache_is_invalidated_by_application_changes(client, user, application, crash_report):
+    crashes_by_user_queries_crash_reports(client, user)
+    application.name = 'Renamed'
+    application.save()
+    response = client.get('/u/{0}/'.format(user.username))
+    assert response.context['crash_reports'][0].application.name == 'Renamed'
+
+def test_crashes_by_user_cache_is_per_user(client, user, other_user, crash_report):
+    crashes_by_user_queries_crash_reports(client, user)
+    response = client.get('/u/{0}/'.format(other_user.username))
+    assert len(response.context['crash_reports']) == 0
+
+
+# JSON API
+
+def ndjson(response):
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/x-ndjson'
+    return [json.loads(line) for line in ''.join(response.streaming_content).splitlines()]
+
+def test_api_crash_by_user_returns_the_crash_report(client, user, crash_report):
+    response = client.get('/api/u/{0}/crashes/{1}/'.format(user.username, crash_report.id))
+    crash_report = models.CrashReport.objects.get(id=crash_report.id)
+    assert_json(response, dict(
+        id=crash_report.id,
+        title=crash_report.title,
+        kind=crash_report.kind,
+        kind_name='Crash',
+        details=crash_report.details,
+        version=crash_report.version,
+        count=1,
+        application=dict(id=crash_report.application.id, name=crash_report.application.name,
+                         company=crash_report.application.company),
+        created_at=json.loads(json.dumps(crash_report.created_at, cls=DjangoJSONEncoder)),
+        updated_at=json.loads(json.dumps(crash_report.updated_at, cls=DjangoJSONEncoder)),
+    ))
+
+def test_api_crash_by_user_of_another_user_is_a_404(client, other_user, crash_report):
+    response = client.get('/api/u/{0}/crashes/{1}/'.format(other_user.username, crash_report.id))
+    assert response.status_code == 404
+
+def test_api_crashes_by_user_streams_ndjson_newest_first(client, user, crash_reports):
+    response = client.get('/api/u/{0}/crashes/'.format(user.username))
+    expected = models.CrashReport.objects.filter(user=user).order_by('-updated_at', '-id')
+    assert [c['id'] for c in ndjson(response)] == [c.id for c in expected]
+
+def test_api_crashes_by_user_streams_in_batches(monkeypatch, client, user, application):
+    monkeypatch.setattr(v, 'API_BATCH_SIZE', 3)
+    bulk_crash_reports(10, user, application)
+    with count_queries() as queries:
+        assert len(ndjson(client.get('/api/u/{0}/crashes/'.format(user.username)))) == 10
+    # user + validators + 4 batches
+    assert len(queries) == 6, queries
+
+def test_api_crashes_by_invalid_username_is_a_404(client, db):
+    response = client.get('/api/u/invalid/crashes/')
+    assert response.status_code == 404
+
+def test_api_crashes_by_user_answers_conditional_requests(client, user, crash_reports):
+    response = client.get('/api/u/{0}/crashes/'.format(user.username))
+    assert response['ETag']
+    # deletes and application renames don't move any updated_at
+    assert not response.has_header('Last-Modified')
+
+    with count_queries() as queries:
+        response = client.get('/api/u/{0}/crashes/'.format(user.username), HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+def test_api_crashes_by_user_etag_changes_with_the_crash_reports(client, user, crash_reports):
+    etag = client.get('/api/u/{0}/crashes/'.format(user.username))['ETag']
+    crash_reports[0].delete()
+    response = client.get('/api/u/{0}/crashes/'.format(user.username), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+def test_api_crashes_by_user_etag_changes_with_older_crash_reports_and_applications(client, user, application,
+                                                                                   crash_reports):
+    url = '/api/u/{0}/crashes/'.format(user.username)
+    etag = client.get(url)['ETag']
+    min(crash_reports, key=lambda c: (c.updated_at, c.id)).delete()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+    etag = response['ETag']
+    application.name = 'Renamed'
+    application.save()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+def test_api_crash_by_user_answers_conditional_requests(client, user, crash_report):
+    url = '/api/u/{0}/crashes/{1}/'.format(user.username, crash_report.id)
+    etag = client.get(url)['ETag']
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    crash_report.save()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
@@ -5,8 +5,14 @@ urlpatterns = patterns('',
 
     url(r'^$', 'crashes.views.index', name='index'),
     url(r'^u/(?P<username>[A-Za-z0-9-_]+)/$', 'crashes.views.crashes_by_user', name='crashes_by_user'),
+    url(r'^u/(?P<username>[A-Za-z0-9-_]+)/search/$', 'crashes.views.search_crashes', name='search_crashes'),
     url(r'^u/(?P<username>[A-Za-z0-9-_]+)/new/$', 'crashes.views.new_crash', name='crash_new'),
+    url(r'^u/(?P<username>[A-Za-z0-9-_]+)/similar/$', 'crashes.views.similar_crashes', name='similar_crashes'),
+    url(r'^u/(?P<username>[A-Za-z0-9-_]+)/bulk/$', 'crashes.views.bulk_new_crashes', name='crash_bulk_new'),
     url(r'^u/(?P<username>[A-Za-z0-9-_]+)/(?P<crash_report_id>\d+)/$', 'crashes.views.crash_by_user', name='crash_by_user'),
     url(r'^u/(?P<username>[A-Za-z0-9-_]+)/(?P<crash_report_id>\d+)/edit/$', 'crashes.views.edit_crash', name='edit_crash'),
+
+    url(r'^api/u/(?P<username>[A-Za-z0-9-_]+)/crashes/$', 'crashes.views.api_crashes_by_user', name='api_crashes_by_user'),
+    url(r'^api/u/(?P<username>[A-Za-z0-9-_]+)/crashes/(?P<crash_report_id>\d+)/$', 'crashes.views.api_crash_by_user', name='api_crash_by_user'),
 )
 
@@ -1,19 +1,92 @@
 import json
+import re
+from functools import wraps
 
-from django.http import HttpResponseNotAllowed, HttpResponse
+from django.http import (HttpResponseNotAllowed, HttpResponse, HttpResponseBadRequest, Http404,
+                         StreamingHttpResponse)
 from django.shortcuts import (render_to_response, get_object_or_404, redirect)
 from django.template import RequestContext
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.forms.forms import NON_FIELD_ERRORS
 
-from crashes.models import CrashReport, Application
-from crashes.forms import CrashForm
+from crashes.cache import application_cache, crash_reports_cache_key, crash_reports_versions
+from crashes.models import ApiKey, CrashReport, ApplicationStats, crash_fingerprint
+from crashes.forms import CrashForm, BulkCrashForm
+from crashes.pagination import keyset_paginate, make_cursor, decode_cursor, InvalidCursor
+from crashes.search import search_crash_reports
+from crashes.similarity import similar_crash_reports
+from crashes.spool import get_spool, ingest_is_spooled
+
+
+CRASH_REPORTS_PER_PAGE = 50
+API_BATCH_SIZE = 500
 
 
 def _render(request, template, context=None):
     return render_to_response(template, context or {}, context_instance=RequestContext(request))
 
 
+class HttpResponseAccepted(HttpResponse):
+    status_code = 202
+
+class HttpResponseUnauthorized(HttpResponse):
+    status_code = 401
+
+
+def _json_response(obj, response_class=HttpResponse):
+    return response_class(json.dumps(obj, cls=DjangoJSONEncoder), content_type='application/json')
+
+
+API_KEY_HEADER = re.compile(r'^Token\s+(\S+)$')
+
+def api_key_or_login_required(view):
+    """Lets programs call a view with an API key, as Authorization: Token <key>,
+    besides logged in browsers.
+
+    Requests with a key skip CSRF checks, which only protect cookies; the
+    others still need a session and, for POSTs, the CSRF token.
+    """
+    login_view = login_required(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        match = API_KEY_HEADER.match(request.META.get('HTTP_AUTHORIZATION', ''))
+        if match is None:
+            rejected = CsrfViewMiddleware().process_view(request, None, args, kwargs)
+            return rejected or login_view(request, *args, **kwargs)
+        user = ApiKey.objects.user_for(match.group(1))
+        if user is None:
+            response = _json_response(dict(error='Invalid API key'), HttpResponseUnauthorized)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.user = user
+        return view(request, *args, **kwargs)
+    return wrapper
+
+def _parse_crashes(body):
+    """Returns the list of crash dicts in a JSON array or NDJSON request body.
+
+    Raises ValueError if the body is neither.
+    """
+    body = body.strip()
+    if body.startswith('['):
+        items = json.loads(body)
+    else:
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    if not all(isinstance(item, dict) for item in items):
+        raise ValueError('Expected a list of JSON objects')
+    return items
+
+
 def index(request):
     if request.user.is_authenticated():
         return redirect('crashes_by_user', request.user.username)
@@ -25,19 +98,84 @@ def new_crash(request, username):
     if request.method == 'POST':
         form = CrashForm(request.POST)
         if form.is_valid():
-            crash_report, created = CrashReport.objects.get_or_create(
-                application=Application.objects.all()[0],
+            data = form.cleaned_data
+            if ingest_is_spooled():
+                get_spool().append(request.user.id, [data])
+                response = _render(request, 'crashes/crash_queued.html', dict(page='new_crash'))
+                response.status_code = 202
+                return response
+            crash_report_id, created = CrashReport.objects.increment_or_create(
                 user=request.user,
-                title=form.cleaned_data['title'],
-                defaults=form.cleaned_data,
+                fingerprint=crash_fingerprint(data['application'].id, data['kind'], data['title'], data['details']),
+                defaults=data,
             )
-            if not created:
-                crash_report.count += 1
-                crash_report.save()
-
-            return redirect('crash_by_user', request.user.username, crash_report.id)
+            return redirect('crash_by_user', request.user.username, crash_report_id)
     return _render(request, 'crashes/new_crash.html', dict(form=form, page='new_crash'))
 
+@api_key_or_login_required
+def bulk_new_crashes(request, username):
+    """Files a JSON array or NDJSON stream of crashes at once, as the user of
+    an API key or the logged in user.
+
+    Every crash is validated with the CrashForm rules; if any is invalid,
+    nothing is saved and the errors are returned by index.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        items = _parse_crashes(request.body)
+    except ValueError as e:
+        return _json_response(dict(error=unicode(e)), HttpResponseBadRequest)
+
+    application_ids = set()
+    for item in items:
+        try:
+            application_ids.add(int(item.get('application')))
+        except (ValueError, TypeError):
+            pass
+    applications = application_cache.get_many(application_ids)
+
+    forms = [BulkCrashForm(item, applications) for item in items]
+    errors = dict(
+        (i, dict((name, [unicode(e) for e in field_errors]) for name, field_errors in form.errors.items()))
+        for i, form in enumerate(forms) if not form.is_valid()
+    )
+    if errors:
+        return _json_response(dict(errors=errors), HttpResponseBadRequest)
+
+    if ingest_is_spooled():
+        get_spool().append(request.user.id, [form.cleaned_data for form in forms])
+        return _json_response(dict(queued=len(forms)), HttpResponseAccepted)
+
+    results = CrashReport.objects.bulk_increment_or_create([
+        CrashReport(user=request.user, **form.cleaned_data) for form in forms
+    ])
+    return _json_response(dict(crash_reports=[
+        dict(id=crash_report_id, created=created) for crash_report_id, created in results
+    ]))
+
+@login_required
+def similar_crashes(request, username):
+    """Returns the user's crash reports that are probably the same crash as the
+    application, title and details parameters, as JSON.
+    """
+    try:
+        application_id = int(request.GET.get('application', ''))
+    except ValueError:
+        return _json_response(dict(error='application must be an id'), HttpResponseBadRequest)
+    suggestions = similar_crash_reports(
+        request.user, application_id, request.GET.get('title', ''), request.GET.get('details', ''))
+    return _json_response(dict(crash_reports=[
+        dict(
+            id=crash_report.id,
+            title=crash_report.title,
+            count=crash_report.count,
+            similarity=round(similarity, 2),
+            url=reverse('crash_by_user', args=(request.user.username, crash_report.id)),
+        )
+        for crash_report, similarity in suggestions
+    ]))
+
 @login_required
 def edit_crash(request, username, crash_report_id):
     crash_report = get_object_or_404(CrashReport, id=crash_report_id, user=request.user)
@@ -45,16 +183,76 @@ def edit_crash(request, username, crash_report_id):
     if request.method == 'POST':
         form = CrashForm(request.POST)
         if form.is_valid():
+            old_stats = (crash_report.application_id, crash_report.version, crash_report.kind, crash_report.count)
             for name, value in form.cleaned_data.items():
                 setattr(crash_report, name, value)
-            crash_report.save()
-            return redirect('crash_by_user', request.user.username, crash_report.id)
+            duplicates = CrashReport.objects.filter(
+                user=request.user,
+                fingerprint=crash_report.compute_fingerprint(),
+            ).exclude(id=crash_report.id)
+            if not duplicates.exists():
+                with transaction.commit_on_success():
+                    crash_report.save()
+                    ApplicationStats.objects.subtract(*old_stats)
+                    ApplicationStats.objects.add(crash_report.application_id, crash_report.version,
+                                                 crash_report.kind, crash_report.count)
+                return redirect('crash_by_user', request.user.username, crash_report.id)
+            form._errors[NON_FIELD_ERRORS] = form.error_class(['This crash has already been reported.'])
     return _render(request, 'crashes/new_crash.html', dict(
         form=form,
         crash_report=crash_report,
         page='edit_crash',
     ))
 
+def _crash_reports_owner(request, username):
+    "Returns the user whose crash reports are requested, looked up once per request."
+    if not hasattr(request, '_crash_reports_owner'):
+        request._crash_reports_owner = get_object_or_404(User, username=username)
+    return request._crash_reports_owner
+
+def _crash_reports_etag(request, username, **kwargs):
+    """Returns the ETag of a user's crash reports, or None if there are none.
+
+    It is the cursor of the most recently updated one, a seek on the
+    (user, updated_at, id) index, with the user's crash_reports_versions
+    from the shared cache, which also change on deletes and application
+    renames. There is no Last-Modified, which those changes wouldn't move.
+    """
+    latest = CrashReport.objects.filter(user__username=username).order_by(
+        '-updated_at', '-id').values_list('updated_at', 'id', 'user')[:1]
+    if not latest:
+        return None
+    updated_at, id, user_id = latest[0]
+    return '{0}-{1}-{2}'.format(make_cursor(updated_at, id), *crash_reports_versions(user_id))
+
+def _crash_report_validators(request, username, crash_report_id):
+    "Returns the (etag, last_modified) of one crash report, or (None, None)."
+    if not hasattr(request, '_crash_report_validators'):
+        updated_at = CrashReport.objects.filter(
+            user__username=username, id=crash_report_id,
+        ).values_list('updated_at', 'application__updated_at')[:1]
+        if updated_at:
+            last_modified = max(updated_at[0])
+            request._crash_report_validators = (make_cursor(last_modified, crash_report_id), last_modified)
+        else:
+            request._crash_report_validators = (None, None)
+    return request._crash_report_validators
+
+def _crash_report_etag(request, username, crash_report_id, **kwargs):
+    return _crash_report_validators(request, username, crash_report_id)[0]
+
+def _crash_report_last_modified(request, username, crash_report_id, **kwargs):
+    return _crash_report_validators(request, username, crash_report_id)[1]
+
+def _viewer_etag(etag_func):
+    "Makes the ETags of etag_func specific to the logged in user, for pages that render differently per user."
+    def etag(request, *args, **kwargs):
+        etag = etag_func(request, *args, **kwargs)
+        if etag is not None:
+            return '{0}-{1}'.format(request.user.pk or 0, etag)
+    return etag
+
+@condition(etag_func=_viewer_etag(_crash_report_etag), last_modified_func=_crash_report_last_modified)
 def crash_by_user(request, username, crash_report_id):
     user = get_object_or_404(User, username=username)
     crash_report = get_object_or_404(CrashReport, user=user, id=crash_report_id)
@@ -64,11 +262,103 @@ def crash_by_user(request, username, crash_report_id):
     ))
 
 
+def _crash_reports_list(user):
+    "Returns the queryset of a user's crash reports with just the fields the list page shows."
+    return CrashReport.objects.filter(user=user).select_related('application').only(
+        'id', 'title', 'kind', 'version', 'count', 'updated_at',
+        'application__name', 'application__company', 'application__updated_at',
+    )
+
+def _page_cursors(request):
+    "Returns the (after, before) cursors of a list page request, raising Http404 for malformed ones."
+    after, before = request.GET.get('after'), request.GET.get('before')
+    try:
+        for cursor in (after, before):
+            if cursor is not None:
+                decode_cursor(cursor)
+    except InvalidCursor:
+        raise Http404
+    return after, before
+
+@condition(etag_func=_viewer_etag(_crash_reports_etag))
 def crashes_by_user(request, username):
-    user = get_object_or_404(User, username=username)
-    crash_reports = CrashReport.objects.filter(user=user).order_by('-updated_at')
+    user = _crash_reports_owner(request, username)
+    crash_reports = _crash_reports_list(user)
+    after, before = _page_cursors(request)
+
+    cache_key = crash_reports_cache_key(user.id, 'page', after or '', before or '')
+    crash_reports_page = cache.get(cache_key)
+    if crash_reports_page is None:
+        crash_reports_page = keyset_paginate(crash_reports, CRASH_REPORTS_PER_PAGE, after=after, before=before)
+        cache.set(cache_key, crash_reports_page)
     return _render(request, 'crashes/user_crashes.html', dict(
-        crash_reports=crash_reports,
+        crash_reports=crash_reports_page.object_list,
+        crash_reports_page=crash_reports_page,
+        owner=user,
         page='crashes_by_user',
     ))
 
+def search_crashes(request, username):
+    "Lists a user's crash reports whose title or details contain every word of the q parameter."
+    user = get_object_or_404(User, username=username)
+    query = request.GET.get('q', '').strip()
+    after, before = _page_cursors(request)
+    crash_reports = search_crash_reports(_crash_reports_list(user), query)
+    crash_reports_page = keyset_paginate(crash_reports, CRASH_REPORTS_PER_PAGE, after=after, before=before)
+    return _render(request, 'crashes/user_crashes.html', dict(
+        crash_reports=crash_reports_page.object_list,
+        crash_reports_page=crash_reports_page,
+        owner=user,
+        query=query,
+        page='search_crashes',
+    ))
+
+
+# JSON API
+
+def _crash_report_json(crash_report):
+    return dict(
+        id=crash_report.id,
+        title=crash_report.title,
+        kind=crash_report.kind,
+        kind_name=crash_report.get_kind_display(),
+        details=crash_report.details,
+        version=crash_report.version,
+        count=crash_report.count,
+        application=dict(
+            id=crash_report.application_id,
+            name=crash_report.application.name,
+            company=crash_report.application.company,
+        ),
+        created_at=crash_report.created_at,
+        updated_at=crash_report.updated_at,
+    )
+
+def _stream_crash_reports_json(crash_reports, batch_size):
+    "Yields crash_reports as NDJSON lines, loading batch_size of them at a time."
+    page = keyset_paginate(crash_reports, batch_size)
+    while True:
+        for crash_report in page:
+            yield json.dumps(_crash_report_json(crash_report), cls=DjangoJSONEncoder) + '\n'
+        if not page.has_next():
+            return
+        page = keyset_paginate(crash_reports, batch_size, after=page.next_cursor)
+
+@condition(etag_func=_crash_reports_etag)
+def api_crashes_by_user(request, username):
+    "Streams a user's crash reports as NDJSON, newest first."
+    user = _crash_reports_owner(request, username)
+    crash_reports = CrashReport.objects.filter(user=user).select_related('application')
+    return StreamingHttpResponse(
+        _stream_crash_reports_json(crash_reports, API_BATCH_SIZE),
+        content_type='application/x-ndjson',
+    )
+
+@condition(etag_func=_crash_report_etag, last_modified_func=_crash_report_last_modified)
+def api_crash_by_user(request, username, crash_report_id):
+    crash_report = get_object_or_404(
+        CrashReport.objects.select_related('application'),
+        user__username=username,
+        id=crash_report_id,
+    )
+    return _json_response(_crash_report_json(crash_report))
@@ -0,0 +1,18 @@
+"""The admin's URLs, which crashula.urls only loads on the first request for one.
+
+Importing this runs admin.autodiscover(), which imports every app's admin
+module.
+"""
+from django.conf.urls import patterns, url
+from django.contrib import admin
+
+from crashula import profiling
+
+admin.autodiscover()
+
+urlpatterns = patterns('',
+    # staff only, through the admin's login like the rest of the admin
+    url(r'^profiles/$', admin.site.admin_view(profiling.profile_list), name='profile_list'),
+    url(r'^profiles/(?P<name>[\w-]+)/$', admin.site.admin_view(profiling.profile_detail),
+        name='profile_detail'),
+) + admin.site.get_urls()
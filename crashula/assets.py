@@ -0,0 +1,232 @@
+"""The static asset pipeline: bundles built at collectstatic time, and a WSGI
+layer serving the collected files.
+
+collectstatic with BundlingStaticFilesStorage concatenates each bundle of
+STATIC_BUNDLES into one minified file, saves every file again under a name
+with a hash of its contents, and writes gzip and, if the brotli module is
+installed, brotli copies of the hashed text files next to them. Templates
+link bundles with the bundle tag of crashes/templatetags/assets.py.
+
+StaticFilesApplication then serves STATIC_ROOT ahead of Django, picking
+the precompressed copy the client accepts and marking hashed files
+immutable, so browsers don't even revalidate them.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from StringIO import StringIO
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import CachedStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# text formats that compress well; images and fonts like woff are compressed already
+# (Content-Encoding, extension) of the precompressed copies, in order of preference
+ENCODING_EXTENSIONS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.ico', '.eot', '.ttf')
+# the 12 hex digits of CachedFilesMixin.hashed_name
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'"\)]+)\1\s*\)""")
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+
+def minify_css(css):
+    """Returns css without comments and the whitespace it doesn't need.
+
+    Deliberately simple: strings are minified like the rest, so don't put
+    runs of whitespace in content: values.
+    """
+    css = CSS_COMMENT.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    # a space before a colon can be a descendant selector, as in "a :hover"
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+def rebase_css_urls(css, source, bundle):
+    "Rewrites the relative url()s of the CSS file source to work from the bundle's directory."
+    source_dir, bundle_dir = posixpath.dirname(source), posixpath.dirname(bundle)
+    if source_dir == bundle_dir:
+        return css
+
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('/', '#', 'data:', 'http:', 'https:')):
+            return match.group(0)
+        return 'url({0}{1}{0})'.format(quote, posixpath.relpath(posixpath.join(source_dir, url), bundle_dir or '.'))
+    return CSS_URL.sub(rebase, css)
+
+def minified_name(name):
+    "Returns the name of the minified copy of a static file, like js/bootstrap.min.js for js/bootstrap.js."
+    root, extension = posixpath.splitext(name)
+    if root.endswith('.min'):
+        return name
+    return root + '.min' + extension
+
+
+def compress(content):
+    "Returns {Content-Encoding: compressed content} of the encodings that make content smaller."
+    buf = StringIO()
+    # mtime=0 keeps the output the same from one collectstatic to the next
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf, compresslevel=9, mtime=0) as f:
+        f.write(content)
+    variants = dict(gzip=buf.getvalue())
+    if brotli is not None:
+        variants['br'] = brotli.compress(content)
+    return dict((encoding, data) for encoding, data in variants.items() if len(data) < len(content))
+
+
+class BundlingStaticFilesStorage(CachedStaticFilesStorage):
+    """Hashes static files like CachedStaticFilesStorage, after building the
+    bundles of STATIC_BUNDLES, and precompresses the hashed text files.
+
+    A bundle joins the minified copy (name.min.ext) of each of its files
+    where there is one, and otherwise the file itself, minified if it is
+    CSS. Relative url()s in CSS are rewritten for the bundle's directory.
+    """
+    def build_bundle(self, name, sources, paths):
+        "Saves the bundle name of the source files, which paths maps to (storage, path) like collectstatic."
+        parts = []
+        for source in sources:
+            minified = minified_name(source)
+            path = minified if minified in paths else source
+            if path not in paths:
+                raise ValueError("The file '{0}' of the bundle '{1}' could not be found.".format(source, name))
+            storage, storage_path = paths[path]
+            with storage.open(storage_path) as f:
+                content = f.read().decode(settings.FILE_CHARSET)
+            if name.endswith('.css'):
+                content = rebase_css_urls(content, path, name)
+                if path != minified:
+                    content = minify_css(content)
+            parts.append(content.strip())
+        # a ; keeps a script without a trailing one from running into the next
+        separator = '\n' if name.endswith('.css') else '\n;\n'
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile((separator.join(parts) + '\n').encode('utf-8')))
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name, sources in getattr(settings, 'STATIC_BUNDLES', {}).items():
+            self.build_bundle(name, sources, paths)
+            paths[name] = (self, name)
+
+        for name, hashed_name, processed in super(BundlingStaticFilesStorage, self).post_process(paths, dry_run, **options):
+            if processed and hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                with self.open(hashed_name) as f:
+                    variants = compress(f.read())
+                for encoding, extension in ENCODING_EXTENSIONS:
+                    if self.exists(hashed_name + extension):
+                        self.delete(hashed_name + extension)
+                    if encoding in variants:
+                        self._save(hashed_name + extension, ContentFile(variants[encoding]))
+            yield name, hashed_name, processed
+
+
+def accepted_encodings(header):
+    "Returns the content codings an Accept-Encoding header accepts, ignoring those with a q of 0."
+    accepted = set()
+    for coding in header.split(','):
+        parts = [part.strip() for part in coding.split(';')]
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0
+        if parts[0] and q > 0:
+            accepted.add(parts[0].lower())
+    return accepted
+
+
+class StaticFile(object):
+    "A collected static file, with the precompressed copies that were saved next to it."
+    def __init__(self, name, path, max_age):
+        self.path = path
+        content_type, _ = mimetypes.guess_type(name)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        if HASHED_NAME.search(name):
+            # the name changes whenever the content does
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'public, max-age={0}'.format(max_age)
+        self.headers = [('Content-Type', content_type), ('Cache-Control', cache_control)]
+        # [(Content-Encoding, path, size, ETag)], best first
+        self.variants = []
+        for encoding, extension in ENCODING_EXTENSIONS:
+            if os.path.isfile(path + extension):
+                self.variants.append(self._variant(encoding, path + extension))
+        if self.variants:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+        self.variants.append(self._variant(None, path))
+
+    def _variant(self, encoding, path):
+        stat = os.stat(path)
+        etag = '"{0:x}-{1:x}{2}"'.format(int(stat.st_mtime), stat.st_size, '-' + encoding if encoding else '')
+        return encoding, path, stat.st_size, etag
+
+    def serve(self, environ, start_response):
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding, path, size, etag = next(variant for variant in self.variants
+                                          if variant[0] is None or variant[0] in accepted)
+        headers = self.headers + [('ETag', etag)]
+        if etag in [tag.strip() for tag in environ.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            start_response('304 Not Modified', headers)
+            return []
+        headers.append(('Content-Length', str(size)))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return environ.get('wsgi.file_wrapper', FileWrapper)(open(path, 'rb'), 64 * 1024)
+
+
+class StaticFilesApplication(object):
+    """Serves the files collected in root at the URL prefix ahead of a WSGI application.
+
+    Requests for other URLs, and for files that aren't there, go to the
+    application. What it learns about a file is kept for the life of the
+    process, as files are only collected on deploys.
+    """
+    def __init__(self, application, root, prefix, max_age=60 * 60):
+        self.application = application
+        self.root = root
+        self.prefix = prefix
+        self.max_age = max_age
+        self.files = {}
+
+    def find(self, name):
+        "Returns the StaticFile of a name under root, or None if there is no such file."
+        static_file = self.files.get(name)
+        if static_file is None:
+            normalized = posixpath.normpath(name)
+            if normalized != name or name.startswith(('/', '../')) or '\0' in name:
+                return None
+            path = os.path.join(self.root, *name.split('/'))
+            if not os.path.isfile(path):
+                return None
+            static_file = self.files[name] = StaticFile(name, path, self.max_age)
+        return static_file
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ['REQUEST_METHOD'] in ('GET', 'HEAD') and path.startswith(self.prefix):
+            static_file = self.find(path[len(self.prefix):])
+            if static_file is not None:
+                return static_file.serve(environ, start_response)
+        return self.application(environ, start_response)
@@ -0,0 +1,8 @@
+from django.db.backends.sqlite3.base import *
+from django.db.backends.sqlite3.base import DatabaseWrapper as _DatabaseWrapper
+
+from crashula.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, _DatabaseWrapper):
+    pass
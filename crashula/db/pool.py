@@ -0,0 +1,239 @@
+import logging
+import os
+import threading
+import time
+
+from django.core.signals import request_finished
+from django.db.utils import DatabaseError
+
+
+logger = logging.getLogger(__name__)
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        # it is being thrown away because it may be broken already
+        pass
+
+
+class PoolTimeout(DatabaseError):
+    "Raised when a worker has max_connections open and none is released for wait_timeout seconds."
+
+
+class ConnectionPool(object):
+    """The open connections to one database that a worker process isn't using,
+    and the count of all those it has open.
+
+    Connections are handed out newest first, so the ones left over after a
+    burst sit at the bottom, go past max_idle and get closed. At most
+    max_connections (pool_size if 0) are open at once, in use or idle: a
+    request that needs another waits up to wait_timeout seconds for one to
+    be released, then fails with PoolTimeout. Only pool_size are kept idle.
+    """
+    def __init__(self, pool_size, max_age, max_idle, health_check, max_connections=0, wait_timeout=10.0):
+        self.pool_size = pool_size
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.health_check = health_check
+        self.max_connections = max_connections or pool_size
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+        # [(connection, opened at, released at)], most recently released last
+        self.idle = []
+        # connections open, in use or idle
+        self.open = 0
+        self.pid = os.getpid()
+
+    def _forget_parent_connections(self):
+        # a forked worker must not use or close the sockets of its parent's
+        # connections: closing them would end the parent's sessions too
+        if self.pid != os.getpid():
+            self.idle = []
+            self.open = 0
+            self.pid = os.getpid()
+
+    def _closed(self, count):
+        # with the lock held; connections handed in without being counted,
+        # like those of tests, don't take the count below zero
+        self.open = max(0, self.open - count)
+        self.released.notify(count)
+
+    def _expired(self, opened_at, now):
+        return self.max_age and now - opened_at >= self.max_age
+
+    def acquire(self, is_usable):
+        """Returns the (connection, opened at) of an idle connection, or None if the
+        caller is to open a new one, which then counts as open.
+
+        Waits for a connection to be released while max_connections are open,
+        and raises PoolTimeout after wait_timeout seconds. Connections idle for
+        health_check seconds or more are only returned if is_usable(connection)
+        is true; the others are closed.
+        """
+        deadline = time.time() + self.wait_timeout
+        while True:
+            with self.lock:
+                self._forget_parent_connections()
+                while not self.idle and self.open >= self.max_connections:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout('All {0} database connections of the worker stayed in use for {1} seconds'.format(
+                            self.max_connections, self.wait_timeout))
+                    self.released.wait(remaining)
+                if not self.idle:
+                    self.open += 1
+                    return None
+                connection, opened_at, released_at = self.idle.pop()
+            now = time.time()
+            if self._expired(opened_at, now) or now - released_at >= self.max_idle:
+                self.discard(connection)
+            elif now - released_at >= self.health_check and not is_usable(connection):
+                logger.info('Dropping a pooled database connection that failed its health check')
+                self.discard(connection)
+            else:
+                return connection, opened_at
+
+    def release(self, connection, opened_at):
+        "Keeps a connection that's done with for reuse, or closes it if it is too old or the pool is full."
+        now = time.time()
+        closing = []
+        with self.lock:
+            self._forget_parent_connections()
+            while self.idle and now - self.idle[0][2] >= self.max_idle:
+                closing.append(self.idle.pop(0)[0])
+            if self._expired(opened_at, now) or len(self.idle) >= self.pool_size:
+                closing.append(connection)
+            else:
+                self.idle.append((connection, opened_at, now))
+                self.released.notify()
+            self._closed(len(closing))
+        for connection in closing:
+            _close_quietly(connection)
+
+    def discard(self, connection=None):
+        "Closes a connection that was in use, or gives up the place of one that couldn't be opened."
+        if connection is not None:
+            _close_quietly(connection)
+        with self.lock:
+            self._forget_parent_connections()
+            self._closed(1)
+
+    def clear(self):
+        "Closes every idle connection."
+        with self.lock:
+            self._forget_parent_connections()
+            idle, self.idle = self.idle, []
+            self._closed(len(idle))
+        for connection, _, _ in idle:
+            _close_quietly(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(settings_dict):
+    "Returns the process's ConnectionPool for the database of a DATABASES entry."
+    key = tuple(settings_dict.get(name) for name in ('ENGINE', 'NAME', 'USER', 'HOST', 'PORT'))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**settings_dict['POOL'])
+        return _pools[key]
+
+def clear_pools():
+    "Closes the idle connections of every pool, as before forking workers."
+    with _pools_lock:
+        pools = _pools.values()
+    for pool in pools:
+        pool.clear()
+
+
+class PooledDatabaseWrapperMixin(object):
+    """Makes a Django DatabaseWrapper hand its connection to a ConnectionPool at the end
+    of a request, and take one from it before opening a new one.
+
+    close() still closes the connection, along with the pool's idle ones, as
+    Django's test database setup expects; only release() pools it.
+    """
+    def _cursor(self):
+        if self.connection is None:
+            _release_connections_after_requests()
+            pool = get_pool(self.settings_dict)
+            pooled = pool.acquire(self._is_usable)
+            if pooled is not None:
+                self.connection, self._opened_at = pooled
+            else:
+                self._opened_at = time.time()
+                try:
+                    return super(PooledDatabaseWrapperMixin, self)._cursor()
+                except Exception:
+                    pool.discard(self.connection)
+                    self.connection = None
+                    raise
+        return super(PooledDatabaseWrapperMixin, self)._cursor()
+
+    def _is_usable(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def release(self):
+        "Hands the connection over to the pool, ending the transaction it is in."
+        self.validate_thread_sharing()
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        try:
+            connection.rollback()
+        except Exception:
+            get_pool(self.settings_dict).discard(connection)
+            return
+        get_pool(self.settings_dict).release(connection, self._opened_at)
+
+    def close(self):
+        in_use = self.connection is not None
+        super(PooledDatabaseWrapperMixin, self).close()
+        pool = get_pool(self.settings_dict)
+        # the sqlite backend keeps in-memory databases open
+        if in_use and self.connection is None:
+            pool.discard()
+        pool.clear()
+
+
+def release_connections(**kwargs):
+    """Hands the pooled connections over to their pools when a request finishes.
+
+    Runs before Django's close_connection, which then finds nothing left to
+    close. Connections in a managed transaction, like a test case's, are
+    left alone.
+    """
+    from django.db import connections, transaction
+    for alias in connections:
+        connection = connections[alias]
+        if isinstance(connection, PooledDatabaseWrapperMixin) and not connection.is_managed():
+            transaction.abort(alias)
+            connection.release()
+
+_receivers_connected = []
+
+def _release_connections_after_requests():
+    if _receivers_connected:
+        return
+    with _pools_lock:
+        if _receivers_connected:
+            return
+        _receivers_connected.append(True)
+    # django.db makes a DatabaseWrapper before it is done importing, so this
+    # waits for the first cursor
+    from django.db import close_connection
+    # receivers run in the order they were connected
+    request_finished.disconnect(close_connection)
+    request_finished.connect(release_connections, dispatch_uid='crashula.db.pool.release_connections')
+    request_finished.connect(close_connection)
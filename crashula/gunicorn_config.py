@@ -0,0 +1,75 @@
+"""Gunicorn settings for crashula:
+
+    gunicorn -c crashula/gunicorn_config.py crashula.wsgi:application
+
+Each setting can be overridden with an environment variable:
+
+    CRASHULA_WORKER_CLASS        gevent (default) serves up to
+                                 CRASHULA_WORKER_CONNECTIONS requests at once per
+                                 worker, so slow clients and queries don't hold a
+                                 whole worker; sync serves one at a time
+    WEB_CONCURRENCY              worker processes
+    CRASHULA_WORKER_CONNECTIONS  concurrent requests per gevent worker
+    CRASHULA_KEEPALIVE           seconds gevent workers keep idle client connections
+    CRASHULA_MAX_REQUESTS        requests after which a worker is replaced, to bound
+                                 slow leaks; 0 never replaces workers
+    CRASHULA_TIMEOUT             seconds a worker may stay silent before it is killed
+    CRASHULA_PRELOAD             load Django once in the master before forking, so the
+                                 workers share its memory copy-on-write
+
+Every greenlet of a gevent worker uses its own database connection, so
+pool the database URL: its max_connections (pool_size by default) caps
+the connections of each worker, and requests beyond it wait for one. The
+workers times max_connections must fit the database's connection limit
+(20 on Heroku's smallest Postgres plans), e.g. with 4 workers
+
+    postgres://...?pool_size=4
+"""
+import multiprocessing
+import os
+
+
+def _flag(name, default):
+    return os.environ.get(name, default).lower() in ('yes', 'y', 'true', '1', 't')
+
+_cores = multiprocessing.cpu_count()
+
+bind = os.environ.get('CRASHULA_BIND', '0.0.0.0:{0}'.format(os.environ.get('PORT', 8000)))
+worker_class = os.environ.get('CRASHULA_WORKER_CLASS', 'gevent')
+# sync workers wait on the database and clients with the CPU idle, so they
+# need more processes per core than gevent workers, which switch requests
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 * _cores + 1 if worker_class == 'sync' else _cores + 1))
+worker_connections = int(os.environ.get('CRASHULA_WORKER_CONNECTIONS', 100))
+keepalive = int(os.environ.get('CRASHULA_KEEPALIVE', 5))
+max_requests = int(os.environ.get('CRASHULA_MAX_REQUESTS', 5000))
+timeout = int(os.environ.get('CRASHULA_TIMEOUT', 30))
+graceful_timeout = timeout
+preload_app = _flag('CRASHULA_PRELOAD', 'yes')
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from crashula.wsgi import warm_up
+        warm_up()
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        # every worker opens its own database connections; a socket shared
+        # across a fork would interleave the workers' queries
+        from django.db import connections
+        for connection in connections.all():
+            connection.close()
+
+def post_fork(server, worker):
+    from django.conf import settings
+    postgres = any('postgresql' in database['ENGINE'] for database in settings.DATABASES.values())
+    if postgres and type(worker).__module__ == 'gunicorn.workers.ggevent':
+        # without this every query blocks all of the worker's greenlets
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning('psycogreen or psycopg2 is not installed: database queries block gevent workers')
+        if any('POOL' not in database for database in settings.DATABASES.values()):
+            server.log.warning('The database URL has no pool parameters: each gevent worker may open up to '
+                               '%s connections at once', server.cfg.worker_connections)
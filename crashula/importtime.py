@@ -0,0 +1,102 @@
+"""How long importing each module takes, like the -X importtime of later Pythons.
+
+Run as a script, it times a cold start of the site the way a gunicorn
+worker pays it, importing crashula.wsgi and warming it up, and prints the
+timings as JSON:
+
+    python -m crashula.importtime
+
+manage.py import_times runs it in a fresh process and reports on it.
+"""
+import __builtin__
+import json
+import os
+import sys
+import time
+
+
+class ImportTimer(object):
+    """Times every import statement while installed.
+
+    Each import that loads new modules is recorded as a dict of its
+    modules, depth (how many imports it is nested in), self time
+    (excluding the imports it made) and cumulative time, in seconds.
+    Records are in the order the imports finished, so a module comes
+    after everything it imported.
+    """
+    def __init__(self):
+        self.records = []
+        # [time spent in nested imports, modules loaded] of the imports in progress
+        self._stack = []
+        self._known = set()
+        self._count = 0
+        self._original = None
+
+    def install(self):
+        self._known = set(sys.modules)
+        self._count = len(sys.modules)
+        self._original = __builtin__.__import__
+        __builtin__.__import__ = self._import
+
+    def uninstall(self):
+        __builtin__.__import__ = self._original
+
+    def _claim_new_modules(self):
+        # a module is in sys.modules from the moment it starts loading, so the
+        # ones that appeared since the last check belong to the innermost
+        # import in progress; Python 2 also adds None entries for failed
+        # implicit relative imports
+        if len(sys.modules) != self._count:
+            self._count = len(sys.modules)
+            loaded = set(sys.modules) - self._known
+            self._known.update(loaded)
+            if self._stack:
+                self._stack[-1][1].extend(name for name in loaded if sys.modules[name] is not None)
+
+    def _import(self, *args, **kwargs):
+        self._claim_new_modules()
+        started = time.time()
+        self._stack.append([0.0, []])
+        try:
+            return self._original(*args, **kwargs)
+        finally:
+            cumulative = time.time() - started
+            self._claim_new_modules()
+            nested, modules = self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += cumulative
+            if modules:
+                self.records.append(dict(
+                    modules=sorted(modules),
+                    depth=len(self._stack),
+                    self=cumulative - nested,
+                    cumulative=cumulative,
+                ))
+
+    def total(self):
+        "Returns the seconds spent importing: the cumulative time of the outermost imports."
+        return sum(record['cumulative'] for record in self.records if record['depth'] == 0)
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crashula.settings')
+    timer = ImportTimer()
+    timer.install()
+    started = time.time()
+    try:
+        from crashula.wsgi import warm_up
+        warm_up()
+    finally:
+        timer.uninstall()
+    from django.conf import settings
+    json.dump(dict(
+        lean_runtime=settings.LEAN_RUNTIME,
+        startup=time.time() - started,
+        imports=timer.total(),
+        modules=len(sys.modules),
+        records=timer.records,
+    ), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
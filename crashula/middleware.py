@@ -0,0 +1,150 @@
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+
+logger = logging.getLogger('crashula.performance')
+
+# the timings of the request the current thread is handling, if it is sampled
+_local = threading.local()
+
+
+class RequestTimings(object):
+    "Where the time of one request went, in seconds."
+    def __init__(self):
+        self.started = time.time()
+        self.total = None
+        self.view = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def stop(self):
+        self.total = time.time() - self.started
+
+    def server_timing(self):
+        "Returns the Server-Timing header value of the timings, in milliseconds."
+        return 'db;dur={0:.1f};desc="{1} queries", template;dur={2:.1f}, total;dur={3:.1f}'.format(
+            self.db_time * 1000, self.queries, self.template_time * 1000, self.total * 1000)
+
+
+class TimedCursor(object):
+    "Wraps a database cursor, adding the time of every query to a RequestTimings."
+    def __init__(self, cursor, timings):
+        self.cursor = cursor
+        self.timings = timings
+
+    def execute(self, sql, params=()):
+        started = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.timings.queries += 1
+            self.timings.db_time += time.time() - started
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.timings.queries += 1
+            self.timings.db_time += time.time() - started
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def _time_queries(timings):
+    # connections are per thread, so shadowing their cursor method only times
+    # the queries of this thread's request
+    for connection in connections.all():
+        cursor = type(connection).cursor
+        connection.cursor = lambda connection=connection, cursor=cursor: TimedCursor(cursor(connection), timings)
+
+def _stop_timing_queries():
+    for connection in connections.all():
+        connection.__dict__.pop('cursor', None)
+
+def _time_templates():
+    "Makes Template.render add its time to the sampled request's timings, once per process."
+    if getattr(Template.render, 'timed', False):
+        return
+    render = Template.render
+
+    def timed_render(self, context):
+        timings = getattr(_local, 'timings', None)
+        # included and inherited templates are part of the outermost template's time
+        if timings is None or timings.rendering:
+            return render(self, context)
+        timings.rendering = True
+        started = time.time()
+        try:
+            return render(self, context)
+        finally:
+            timings.template_time += time.time() - started
+            timings.rendering = False
+    timed_render.timed = True
+    Template.render = timed_render
+
+
+class PerformanceMiddleware(object):
+    """Measures a sample of requests: wall time, database queries and their
+    time, template render time and response size.
+
+    PERFORMANCE_SAMPLE_RATE is the fraction of requests measured. Each one
+    is logged as a line of JSON to the crashula.performance logger, and gets
+    a Server-Timing header if PERFORMANCE_SERVER_TIMING is set. Put it first
+    in MIDDLEWARE_CLASSES so it measures the other middleware too.
+    """
+    def __init__(self):
+        self.sample_rate = getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0)
+        self.server_timing = getattr(settings, 'PERFORMANCE_SERVER_TIMING', False)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        _time_templates()
+
+    def process_request(self, request):
+        _local.timings = None
+        if random.random() >= self.sample_rate:
+            return
+        _local.timings = request.performance_timings = RequestTimings()
+        _time_queries(_local.timings)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, 'performance_timings', None)
+        if timings is not None:
+            timings.view = '{0}.{1}'.format(view_func.__module__, getattr(view_func, '__name__', type(view_func).__name__))
+
+    def process_response(self, request, response):
+        timings = getattr(request, 'performance_timings', None)
+        if timings is None:
+            return response
+        _stop_timing_queries()
+        _local.timings = None
+        timings.stop()
+        if self.server_timing:
+            response['Server-Timing'] = timings.server_timing()
+        logger.info(json.dumps(dict(
+            view=timings.view,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            total_ms=round(timings.total * 1000, 1),
+            db_ms=round(timings.db_time * 1000, 1),
+            queries=timings.queries,
+            template_ms=round(timings.template_time * 1000, 1),
+            # streamed responses aren't read here; their size is unknown
+            response_bytes=None if getattr(response, 'streaming', False) else len(response.content),
+        ), sort_keys=True))
+        return response
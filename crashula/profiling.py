@@ -0,0 +1,230 @@
+"""cProfile of chosen requests, for finding hot paths on the servers themselves.
+
+Staff either arm the next N requests (optionally under a path prefix) from
+the admin's profiles page, or add ?profile to any URL they open. Profiles
+are saved under PROFILE_PATH, where every worker process on the host sees
+them, and the profiles page lists them and shows their top functions.
+"""
+import cProfile
+import datetime
+import itertools
+import json
+import os
+import pstats
+import tempfile
+import time
+
+from django import forms
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404
+from django.shortcuts import redirect, render_to_response
+from django.template import RequestContext
+
+
+PROFILE_SORTS = ('cumulative', 'tottime', 'ncalls')
+PROFILE_ROWS = 50
+_counter = itertools.count()
+
+
+class ProfileStore(object):
+    """The profiles saved in a directory, and the requests armed to be profiled next.
+
+    Every armed request is a ticket file in pending/; a worker claims one by
+    deleting it, which only one worker can do, so N armed tickets profile
+    exactly N requests however many workers there are.
+    """
+    def __init__(self, path, keep=100):
+        self.path = path
+        self.pending_path = os.path.join(path, 'pending')
+        self.keep = keep
+        # the pending/ mtime when it was last found empty, to skip listing it on every request
+        self._empty_at = None
+
+    def _makedirs(self):
+        if not os.path.isdir(self.pending_path):
+            os.makedirs(self.pending_path)
+
+    def arm(self, count, path_prefix=''):
+        "Profiles the next count requests whose path starts with path_prefix."
+        self._makedirs()
+        for _ in range(count):
+            fd, _ = tempfile.mkstemp(dir=self.pending_path)
+            os.write(fd, path_prefix.encode('utf-8'))
+            os.close(fd)
+
+    def pending(self):
+        "Returns the number of armed requests not profiled yet."
+        try:
+            return len(os.listdir(self.pending_path))
+        except OSError:
+            return 0
+
+    def claim(self, path):
+        "Returns True if a pending ticket matches path and this process took it."
+        try:
+            mtime = os.stat(self.pending_path).st_mtime
+            if mtime == self._empty_at:
+                return False
+            names = sorted(os.listdir(self.pending_path))
+        except OSError:
+            return False
+        if not names:
+            self._empty_at = mtime
+            return False
+        for name in names:
+            ticket = os.path.join(self.pending_path, name)
+            try:
+                with open(ticket) as f:
+                    path_prefix = f.read().decode('utf-8')
+                if not path.startswith(path_prefix):
+                    continue
+                os.remove(ticket)
+            except (IOError, OSError):
+                # another worker claimed it first
+                continue
+            return True
+        return False
+
+    def save(self, profile, **metadata):
+        "Dumps a cProfile.Profile with its metadata, dropping the oldest beyond keep. Returns its name."
+        self._makedirs()
+        now = datetime.datetime.utcnow()
+        name = '{0:%Y%m%dT%H%M%S%f}-{1}-{2:06d}'.format(now, os.getpid(), next(_counter))
+        profile.dump_stats(os.path.join(self.path, name + '.prof'))
+        metadata.update(name=name, created_at=now.isoformat(), pid=os.getpid())
+        with open(os.path.join(self.path, name + '.json'), 'w') as f:
+            json.dump(metadata, f)
+        for old in self.names()[self.keep:]:
+            self.delete(old)
+        return name
+
+    def names(self):
+        "Returns the names of the saved profiles, newest first."
+        try:
+            files = os.listdir(self.path)
+        except OSError:
+            return []
+        return sorted((f[:-len('.json')] for f in files if f.endswith('.json')), reverse=True)
+
+    def delete(self, name):
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(self.path, name + extension))
+            except OSError:
+                pass
+
+    def metadata(self, name):
+        try:
+            with open(os.path.join(self.path, name + '.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def profiles(self):
+        "Returns the metadata of the saved profiles, newest first."
+        return filter(None, (self.metadata(name) for name in self.names()))
+
+    def top_functions(self, name, sort='cumulative', limit=PROFILE_ROWS):
+        """Returns the total time and the limit functions of a profile with the most sort,
+        as dicts of calls, primitive_calls, total_time, cumulative_time and function.
+        """
+        stats = pstats.Stats(os.path.join(self.path, name + '.prof'))
+        stats.sort_stats(sort)
+        rows = []
+        for function in stats.fcn_list[:limit]:
+            primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[function]
+            rows.append(dict(
+                calls=calls,
+                primitive_calls=primitive_calls,
+                total_time=total_time,
+                cumulative_time=cumulative_time,
+                function=pstats.func_std_string(function),
+            ))
+        return stats.total_tt, rows
+
+
+def get_profile_store():
+    return ProfileStore(settings.PROFILE_PATH, keep=getattr(settings, 'PROFILE_KEEP', 100))
+
+
+class ProfilingMiddleware(object):
+    """Profiles armed requests, and the requests of staff who add ?profile to the URL.
+
+    Goes after AuthenticationMiddleware, which it needs to tell staff apart.
+    Other requests only cost a stat() of the pending directory.
+    """
+    def __init__(self):
+        if not getattr(settings, 'PROFILE_PATH', None):
+            raise MiddlewareNotUsed
+        self.store = get_profile_store()
+
+    def process_request(self, request):
+        requested = 'profile' in request.GET and request.user.is_staff
+        if requested or self.store.claim(request.path):
+            request.profiler = cProfile.Profile()
+            request.profile_started = time.time()
+            request.profiler.enable()
+
+    def process_response(self, request, response):
+        profiler = getattr(request, 'profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        del request.profiler
+        user = getattr(request, 'user', None)
+        self.store.save(
+            profiler,
+            method=request.method,
+            path=request.get_full_path(),
+            status=response.status_code,
+            duration_ms=round((time.time() - request.profile_started) * 1000, 1),
+            user=user.username if user is not None and user.is_authenticated() else None,
+        )
+        return response
+
+
+class ArmProfilingForm(forms.Form):
+    count = forms.IntegerField(min_value=1, max_value=100, initial=10,
+                               help_text='Number of requests to profile.')
+    path_prefix = forms.CharField(required=False, max_length=200,
+                                  help_text='Only profile requests whose path starts with this, like /u/.')
+
+
+def profile_list(request):
+    "Lists the saved profiles, and arms the next requests to be profiled."
+    store = get_profile_store()
+    if request.method == 'POST':
+        form = ArmProfilingForm(request.POST)
+        if form.is_valid():
+            store.arm(form.cleaned_data['count'], form.cleaned_data['path_prefix'])
+            messages.info(request, 'Profiling the next {0} requests.'.format(form.cleaned_data['count']))
+            return redirect('admin:profile_list')
+    else:
+        form = ArmProfilingForm()
+    return render_to_response('admin/profiles/profile_list.html', dict(
+        title='Profiles',
+        form=form,
+        pending=store.pending(),
+        profiles=store.profiles(),
+    ), context_instance=RequestContext(request))
+
+def profile_detail(request, name):
+    "Shows the top functions of a saved profile."
+    store = get_profile_store()
+    profile = store.metadata(name)
+    if profile is None:
+        raise Http404
+    sort = request.GET.get('sort')
+    if sort not in PROFILE_SORTS:
+        sort = PROFILE_SORTS[0]
+    total_time, functions = store.top_functions(name, sort)
+    return render_to_response('admin/profiles/profile_detail.html', dict(
+        title='Profile of {0} {1}'.format(profile['method'], profile['path']),
+        profile=profile,
+        sort=sort,
+        sorts=PROFILE_SORTS,
+        total_time=total_time,
+        functions=functions,
+    ), context_instance=RequestContext(request))
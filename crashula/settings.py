@@ -1,12 +1,18 @@
 import os
 import sys
-import dj_database_url
+
+from crashula.db import parse_database_url, south_database_adapters
+
 def relative(*paths):
     return os.path.join(os.path.dirname(os.path.abspath(__file__)), *paths)
 
 DEBUG = os.environ.get('CRASHULA_DEBUG', 'YES').lower() in ('yes', 'y', 'true', '1', 't')
 TEMPLATE_DEBUG = DEBUG
 TESTING = 'test' in ' '.join(sys.argv)
+# The lean runtime serves the site without the apps only management commands
+# and the admin documentation need, so workers start faster. crashula.wsgi
+# turns it on unless CRASHULA_LEAN_RUNTIME is set; manage.py runs without it.
+LEAN_RUNTIME = os.environ.get('CRASHULA_LEAN_RUNTIME', 'no').lower() in ('yes', 'y', 'true', '1', 't')
 
 ADMINS = (
     # ('Your Name', 'your_email@example.com'),
@@ -14,15 +20,76 @@ ADMINS = (
 
 MANAGERS = ADMINS
 
+# Add pool parameters to the URL to keep connections open between requests,
+# for example postgres://host/crashula?pool_size=1&max_age=1800; see crashula.db.
 DATABASES = {
-    'default': dj_database_url.parse(
+    'default': parse_database_url(
         os.environ.get('CRASHULA_DATABASE_URL',
             os.environ.get('DATABASE_URL', 'sqlite:///' + relative('..', 'sqlite.db')))),
 }
+SOUTH_DATABASE_ADAPTERS = south_database_adapters(DATABASES)
+
+# Caches the per-user crash lists and the versions their keys embed, which
+# every worker has to share, or a list cached by one goes stale in the others.
+# Local memory suits development, where there is a single process. Otherwise
+# it is memcached if MEMCACHE_SERVERS is set (python-memcached must then be
+# installed), and else the crashula_cache table of the database, made by
+# `manage.py createcachetable crashula_cache` (fab deploy runs it).
+# CRASHULA_CACHE_BACKEND and CRASHULA_CACHE_LOCATION override the choice.
+if DEBUG or TESTING:
+    CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+    CACHE_LOCATION = 'crashula'
+elif os.environ.get('MEMCACHE_SERVERS'):
+    CACHE_BACKEND = 'django.core.cache.backends.memcached.MemcachedCache'
+    CACHE_LOCATION = os.environ['MEMCACHE_SERVERS'].replace(',', ';')
+else:
+    CACHE_BACKEND = 'django.core.cache.backends.db.DatabaseCache'
+    CACHE_LOCATION = 'crashula_cache'
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CRASHULA_CACHE_BACKEND', CACHE_BACKEND),
+        'LOCATION': os.environ.get('CRASHULA_CACHE_LOCATION', CACHE_LOCATION),
+        'TIMEOUT': int(os.environ.get('CRASHULA_CACHE_TIMEOUT', 60 * 60)),
+    },
+    # rendered template fragments, like the rows of crash lists. They are keyed
+    # on what they show and never go stale, so each process keeps its own
+    # rather than look up every row in the shared cache.
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # the hashed names of static files, which every process can work out for itself
+    'staticfiles': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'staticfiles',
+        'TIMEOUT': 60 * 60 * 24 * 365,
+    },
+}
+
+# How crash submissions are stored: 'sync' writes them to the database in the
+# request; 'spool' validates them, appends them to a local SQLite spool and
+# answers 202, leaving `manage.py drain_crash_spool` to store them.
+CRASH_INGEST_MODE = os.environ.get('CRASHULA_INGEST_MODE', 'sync')
+CRASH_SPOOL_PATH = os.environ.get('CRASHULA_SPOOL_PATH', relative('..', 'crash_spool.db'))
+
+# The fraction of requests crashula.middleware.PerformanceMiddleware measures,
+# from 0 (off) to 1. Every measured request is logged as JSON to the
+# crashula.performance logger and, with PERFORMANCE_SERVER_TIMING, gets a
+# Server-Timing header browsers show in their developer tools.
+PERFORMANCE_SAMPLE_RATE = float(os.environ.get('CRASHULA_PERFORMANCE_SAMPLE_RATE', 1 if DEBUG else 0.01))
+PERFORMANCE_SERVER_TIMING = os.environ.get('CRASHULA_PERFORMANCE_SERVER_TIMING', 'YES').lower() in ('yes', 'y', 'true', '1', 't')
+
+# Where crashula.profiling saves the cProfile of requests staff ask for, from
+# the admin's profiles page or with ?profile; the newest PROFILE_KEEP are kept.
+# Workers on one host share the directory.
+PROFILE_PATH = os.environ.get('CRASHULA_PROFILE_PATH', relative('..', 'profiles'))
+PROFILE_KEEP = int(os.environ.get('CRASHULA_PROFILE_KEEP', 100))
 
 # Hosts/domain names that are valid for this site; required if DEBUG is False
 # See https://docs.djangoproject.com/en/1.5/ref/settings/#allowed-hosts
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('CRASHULA_ALLOWED_HOSTS', '').split(',') if host]
 
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
@@ -60,7 +127,7 @@ MEDIA_URL = '/uploads/'
 # Don't put anything in this directory yourself; store your static files
 # in apps' "static/" subdirectories and in STATICFILES_DIRS.
 # Example: "/var/www/example.com/static/"
-STATIC_ROOT = relative('..', 'static_root')
+STATIC_ROOT = os.environ.get('CRASHULA_STATIC_ROOT', relative('..', 'static_root'))
 
 # URL prefix for static files.
 # Example: "http://example.com/static/", "http://static.example.com/"
@@ -82,6 +149,17 @@ STATICFILES_FINDERS = (
 #    'django.contrib.staticfiles.finders.DefaultStorageFinder',
 )
 
+# collectstatic joins each bundle's files into one minified file, names every
+# file after a hash of its contents and precompresses them, for
+# crashula.wsgi to serve with far-future cache headers; see crashula.assets.
+# Templates link bundles with {% bundle %}, which links the separate files
+# with DEBUG.
+STATICFILES_STORAGE = 'crashula.assets.BundlingStaticFilesStorage'
+STATIC_BUNDLES = {
+    'css/site.css': ('css/bootstrap.css', 'css/bootstrap-responsive.css', 'css/application.css'),
+    'js/site.js': ('js/bootstrap.js',),
+}
+
 # Make this unique, and don't share it with anybody.
 SECRET_KEY = os.environ.get('CRASHULA_SECRET_KEY', 'v!7j@4#&w)a%7v=&8x5n0mg&x8dk%!!2w7rt_^_n79a^_5e%st')
 
@@ -91,12 +169,19 @@ TEMPLATE_LOADERS = (
     'django.template.loaders.app_directories.Loader',
 #     'django.template.loaders.eggs.Loader',
 )
+if not DEBUG:
+    # keep compiled templates instead of reading and parsing them on every render
+    TEMPLATE_LOADERS = (
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    )
 
 MIDDLEWARE_CLASSES = (
+    'crashula.middleware.PerformanceMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'crashula.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
@@ -137,11 +222,14 @@ INSTALLED_APPS = (
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.admin',
-    'django.contrib.admindocs',
     'social_auth',
-    'south',
     'crashes',
 )
+if not LEAN_RUNTIME:
+    INSTALLED_APPS += (
+        'django.contrib.admindocs',
+        'south',
+    )
 
 # Honor ssl header
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -164,7 +252,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.request': {
@@ -172,6 +264,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'crashula.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
 
@@ -190,6 +287,12 @@ if not TESTING:
 #GOOGLE_OAUTH2_CLIENT_ID      = ''
 #GOOGLE_OAUTH2_CLIENT_SECRET  = ''
 
+if TESTING:
+    # tests create lots of users; the default PBKDF2 hasher is slow on purpose
+    PASSWORD_HASHERS = ('django.contrib.auth.hashers.MD5PasswordHasher',)
+    # tests don't run collectstatic, so there are no hashed files to link
+    STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGIN_ERROR_URL = '/login/error/'
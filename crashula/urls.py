@@ -1,19 +1,23 @@
 from django.conf.urls import patterns, include, url
 from django.conf import settings
+from django.core.urlresolvers import RegexURLResolver
 
-# Uncomment the next two lines to enable the admin:
-from django.contrib import admin
-admin.autodiscover()
 
 urlpatterns = patterns('',
     url(r'', include('social_auth.urls')),
     url(r'', include('crashes.urls')),
+)
 
-    # Uncomment the admin/doc line below to enable admin documentation:
-    url(r'^admin/doc/', include('django.contrib.admindocs.urls')),
+if 'django.contrib.admindocs' in settings.INSTALLED_APPS:
+    urlpatterns += patterns('',
+        url(r'^admin/doc/', include('django.contrib.admindocs.urls')),
+    )
 
-    # Uncomment the next line to enable the admin:
-    url(r'^admin/', include(admin.site.urls)),
+urlpatterns += patterns('',
+    # Unlike include(), a resolver given a module name imports it when it is
+    # first used, and reversing the other URLs leaves namespaced ones alone,
+    # so the admin loads on its first request.
+    RegexURLResolver(r'^admin/', 'crashula.admin_urls', app_name='admin', namespace='admin'),
 )
 
 if settings.DEBUG:
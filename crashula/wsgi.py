@@ -20,13 +20,35 @@ import os
 # mod_wsgi daemon mode with each site in its own daemon process, or use
 # os.environ["DJANGO_SETTINGS_MODULE"] = "crashula.settings"
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crashula.settings")
+# Serve without the apps only management commands need; see LEAN_RUNTIME in
+# crashula/settings.py. runserver has loaded the settings before this.
+os.environ.setdefault("CRASHULA_LEAN_RUNTIME", "yes")
 
 # This application object is used by any WSGI server configured to use this
 # file. This includes Django's development server, if the WSGI_APPLICATION
 # setting points here.
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
+handler = get_wsgi_application()
+application = handler
 
-# Apply WSGI middleware here.
-# from helloworld.wsgi import HelloWorldApplication
-# application = HelloWorldApplication(application)
+# Serve the collected static files ahead of Django, precompressed and with
+# far-future cache headers. With DEBUG, runserver serves them from the source
+# tree instead.
+if not settings.DEBUG:
+    from crashula.assets import StaticFilesApplication
+    application = StaticFilesApplication(handler, settings.STATIC_ROOT, settings.STATIC_URL)
+
+def warm_up():
+    """Loads what Django otherwise loads on the first request: the models,
+    middleware and URLconf.
+
+    gunicorn's preload_app runs this in the master process (see
+    crashula/gunicorn_config.py), so the forked workers share it all
+    copy-on-write instead of each loading their own copy.
+    """
+    from django.core.urlresolvers import get_resolver
+    from django.db.models.loading import get_models
+    get_models()
+    handler.load_middleware()
+    get_resolver(None)._populate()
@@ -1,4 +1,4 @@
-from fabric.api import local, task
+from fabric.api import local, settings, task
 
 HEROKU_APP = 'crashula'
 
@@ -13,6 +13,9 @@ def deploy():
     local('git push heroku master')
     local('heroku run -a {0} python manage.py syncdb'.format(HEROKU_APP))
     local('heroku run -a {0} python manage.py migrate'.format(HEROKU_APP))
+    with settings(warn_only=True):
+        # fails, harmlessly, once the table exists
+        local('heroku run -a {0} python manage.py createcachetable crashula_cache'.format(HEROKU_APP))
     local('heroku maintenance:off -a {0}'.format(HEROKU_APP))
 
 